@@ -15,13 +15,26 @@ from datetime import datetime, timedelta
 import time
 import re
 from typing import Dict, List, Any, Optional
+import pandas as pd
 
 # Core modules
 from core import router
 from core import context_manager as cm
+from core.entities import extract_entities
+from core.report_generator import format_file_size, get_report_registry
+from core.ticket_store import get_ticket_store
 from utils.role_manager import get_allowed_actions
-from utils import trace_logger
-from utils.trace_logger import get_persistent_traces
+from utils.trace_context import StreamlitTraceContext, get_trace_context, set_trace_context
+from utils.trace_logger import get_latency_analytics, get_persistent_traces, get_trace_analytics
+from utils.resource_monitor import get_resource_monitor, top_allocations, stop_allocation_tracing
+from utils.timing import format_ms
+
+# Response-time budget the health bar is drawn against
+RESPONSE_TIME_BUDGET_MS = 2000.0
+
+# Recent traces are kept per browser session (bounded) instead of per process
+if not isinstance(get_trace_context(), StreamlitTraceContext):
+    set_trace_context(StreamlitTraceContext())
 
 # --- Enhanced Custom CSS for Professional UI ---
 def load_css():
@@ -302,7 +315,7 @@ def load_json_cached(filepath: str) -> Dict[str, Any]:
 FAQS = load_json_cached("data/faqs.json")
 EMAILS = load_json_cached("data/sample_emails.json")
 ACTIONS = load_json_cached("config/actions_config.json")
-TICKETS = load_json_cached("data/tickets.json")
+TICKETS = get_ticket_store().all()
 
 # --- Advanced Session State Management ---
 def initialize_session_state():
@@ -344,20 +357,19 @@ def get_conversation_analytics():
     total_conversations = len(conversations)
     total_messages = sum(len(msgs) for msgs in conversations.values())
     
-    # Calculate average response time (simulated)
-    avg_response_time = "1.2s"
+    # Measured end-to-end routing latency
+    latency = get_latency_analytics()
+    overall = latency["overall"] or {}
+    avg_response_time = format_ms(overall.get("mean_ms"))
     
-    # Get module usage stats
-    traces = get_persistent_traces(100)
-    module_stats = {}
-    for trace in traces:
-        module = trace.get('routed_to', 'Unknown')
-        module_stats[module] = module_stats.get(module, 0) + 1
+    # Module usage comes from the metrics registry, not the trace log
+    module_stats = get_trace_analytics()["modules_used"]
     
     return {
         "total_conversations": total_conversations,
         "total_messages": total_messages,
         "avg_response_time": avg_response_time,
+        "latency": latency,
         "module_stats": module_stats,
         "user_satisfaction": 4.7  # Simulated
     }
@@ -414,16 +426,17 @@ with st.sidebar:
         help="Your role determines available actions and data visibility"
     )
     
-    # Role-based capabilities display
-    role_capabilities = {
-        "Admin": ["🔧 Full System Access", "📊 All Reports", "👥 User Management", "🔍 Audit Trails"],
-        "Manager": ["📄 Invoice Management", "📊 GST Reports", "🎫 Ticket Creation", "📈 Analytics"],
-        "Viewer": ["👀 Read-Only Access", "📋 Basic Reports", "🎫 View Tickets", "❓ Help & FAQs"]
-    }
-    
+    # Role-based capabilities display (same permission matrix the action handler enforces)
     with st.expander(f"🔑 {role} Capabilities", expanded=False):
-        for capability in role_capabilities.get(role, []):
-            st.markdown(f"• {capability}")
+        for action in get_allowed_actions(role):
+            st.markdown(f"• **{action['name'].replace('_', ' ').title()}**: {action['description']}")
+    
+    # Report jobs run in the background across reruns; show the ones still going
+    active_reports = get_report_registry().jobs(active_only=True)
+    if active_reports:
+        st.markdown("### 📊 Reports in Progress")
+        for job in active_reports:
+            st.progress(job.progress, text=f"{job.report_id} ({job.period}, {job.fmt.upper()})")
     
     st.divider()
     
@@ -539,7 +552,7 @@ with st.sidebar:
         st.metric("Messages", analytics["total_messages"], delta=5)
     
     with col2:
-        st.metric("Avg Response", analytics["avg_response_time"], delta="-0.3s")
+        st.metric("Avg Response", analytics["avg_response_time"])
         st.metric("Satisfaction", f"{analytics['user_satisfaction']}/5.0", delta="0.2")
     
     # Module usage visualization
@@ -717,8 +730,11 @@ if (send_button and user_input.strip()) or (user_input.strip() and st.session_st
         with st.spinner("🤔 Processing your request..."):
             try:
                 # Enhanced routing with context
+                # Extracted once; routing and saving the turn share the result
+                entities = extract_entities(user_input)
                 response, trace = router.route_query(
-                    user_input, role, FAQS, EMAILS, st.session_state["tickets"], ACTIONS, user_id
+                    user_input, role, FAQS, EMAILS, st.session_state["tickets"], ACTIONS, user_id,
+                    entities=entities
                 )
 
                 # Process and format response
@@ -758,12 +774,10 @@ if (send_button and user_input.strip()) or (user_input.strip() and st.session_st
                         "conversation_id": active_conv,
                         "actions_performed": actions_done if isinstance(response, dict) else [],
                         "confidence": assistant_message.get("confidence", 0.8)
-                    }
+                    },
+                    entities=entities
                 )
                 
-                # Enhanced trace logging
-                trace_logger.log_trace(user_input, response, trace)
-                
                 # Update session activity
                 st.session_state["last_activity"] = datetime.now()
                 
@@ -812,20 +826,26 @@ with tab1:
     # Smart search
     search_query = st.text_input("🔍 Search tickets...", placeholder="Search by ID, summary, or keywords")
     
-    # Apply intelligent filtering
-    visible_tickets = st.session_state["tickets"].copy()
+    # Apply intelligent filtering through the ticket store's status/priority/assignee indexes
+    ticket_store = get_ticket_store()
+    status_values = None
     
     # Role-based filtering
     if role.lower() == "viewer":
-        visible_tickets = [t for t in visible_tickets if t["status"] in ["open", "in_progress"]]
+        status_values = ["open", "in_progress"]
     
     # Apply filters
     if status_filter != "All":
-        visible_tickets = [t for t in visible_tickets if t["status"].lower().replace("_", " ") == status_filter.lower()]
-    if priority_filter != "All":
-        visible_tickets = [t for t in visible_tickets if t["priority"].lower() == priority_filter.lower()]
+        wanted_status = status_filter.lower().replace(" ", "_")
+        status_values = [wanted_status] if status_values is None or wanted_status in status_values else []
+    priority_value = priority_filter.lower() if priority_filter != "All" else None
+    assignee_value = assigned_filter if assigned_filter in ticket_store.values("assignee") else None
+    
+    visible_tickets = ticket_store.query(status=status_values, priority=priority_value, assignee=assignee_value)
     if search_query:
+        # Free-text search has no index; it only scans what the indexes already narrowed down
         visible_tickets = [t for t in visible_tickets if search_query.lower() in t["summary"].lower() or search_query.lower() in t["ticket_id"].lower()]
+    visible_ids = [t["ticket_id"] for t in visible_tickets]
     
     # Advanced ticket analytics
     if visible_tickets:
@@ -833,10 +853,10 @@ with tab1:
         with col1:
             st.metric("Total Tickets", len(visible_tickets))
         with col2:
-            high_priority = len([t for t in visible_tickets if t["priority"] == "high"])
+            high_priority = ticket_store.count(visible_ids, priority="high")
             st.metric("High Priority", high_priority)
         with col3:
-            open_tickets = len([t for t in visible_tickets if t["status"] == "open"])
+            open_tickets = ticket_store.count(visible_ids, status="open")
             st.metric("Open", open_tickets)
         with col4:
             avg_age = "3.2 days"  # Simulated
@@ -915,7 +935,7 @@ with tab2:
     with metrics_row[0]:
         st.metric("🗣️ Total Queries", analytics["total_messages"], delta="12 today")
     with metrics_row[1]:
-        st.metric("⚡ Avg Response", analytics["avg_response_time"], delta="-0.3s")
+        st.metric("⚡ Avg Response", analytics["avg_response_time"])
     with metrics_row[2]:
         success_rate = "94.7%"
         st.metric("✅ Success Rate", success_rate, delta="2.1%")
@@ -931,18 +951,21 @@ with tab2:
         module_data = []
         total_queries = sum(analytics["module_stats"].values())
         
+        module_latency = analytics["latency"]["modules"]
         for module, count in analytics["module_stats"].items():
             percentage = (count / total_queries) * 100
+            timing = module_latency.get(module, {})
             module_data.append({
                 "Module": module.replace(" Module", "").replace("(", "").replace(")", ""),
                 "Queries": count,
                 "Percentage": f"{percentage:.1f}%",
-                "Avg Response": f"{1.2 + (count % 10) * 0.1:.1f}s"  # Simulated
+                "Latency": " / ".join(format_ms(timing.get(f"p{p}_ms")) for p in (50, 95, 99))
             })
         
         # Display as professional table
+        st.caption("Latency columns are p50 / p95 / p99 end-to-end routing time")
         for module_info in sorted(module_data, key=lambda x: x["Queries"], reverse=True):
-            cols = st.columns([3, 1, 1, 1])
+            cols = st.columns([3, 1, 1, 2])
             with cols[0]:
                 st.markdown(f"**{module_info['Module']}**")
             with cols[1]:
@@ -950,7 +973,21 @@ with tab2:
             with cols[2]:
                 st.markdown(f"`{module_info['Percentage']}`")
             with cols[3]:
-                st.markdown(f"`{module_info['Avg Response']}`")
+                st.markdown(f"`{module_info['Latency']}`")
+
+    # Pipeline stage latency
+    stage_latency = analytics["latency"]["stages"]
+    if stage_latency:
+        st.markdown("#### ⏱️ Routing Pipeline Stages")
+        for stage, timing in sorted(stage_latency.items(), key=lambda x: x[1]["p95_ms"], reverse=True):
+            cols = st.columns([3, 1, 1, 1, 1])
+            with cols[0]:
+                st.markdown(f"**{stage.replace('_', ' ').title()}**")
+            with cols[1]:
+                st.markdown(f"`{timing['count']} runs`")
+            for col, pct in zip(cols[2:], (50, 95, 99)):
+                with col:
+                    st.markdown(f"`p{pct} {format_ms(timing[f'p{pct}_ms'])}`")
     
     # System Health Monitoring
     st.markdown("#### 🔧 System Health Monitor")
@@ -975,16 +1012,73 @@ with tab2:
     
     with health_cols[1]:
         st.markdown("**Performance Metrics**")
+        monitor = get_resource_monitor()
+        resources = monitor.summary()
+        memory_percent = resources.get("memory_percent")
+        cpu_percent = resources.get("cpu_percent")
+        rss = resources.get("rss_bytes")
+        uptime_hours = resources.get("uptime_seconds", 0) / 3600
+        memory_value = "N/A"
+        if rss is not None:
+            memory_value = format_file_size(rss)
+            if memory_percent is not None:
+                memory_value += f" ({memory_percent}% of RAM)"
         perf_metrics = [
-            ("Memory Usage", "67%", 67),
-            ("CPU Usage", "34%", 34),
-            ("Response Time", "1.2s", 80),
-            ("Uptime", "99.8%", 99),
+            ("Memory (RSS)", memory_value, memory_percent),
+            ("CPU Usage", f"{cpu_percent}%" if cpu_percent is not None else "N/A",
+             min(100, cpu_percent) if cpu_percent is not None else None),
+            ("Response Time (p95)",
+             format_ms((analytics["latency"]["overall"] or {}).get("p95_ms")),
+             min(100, 100 * (analytics["latency"]["overall"] or {}).get("p95_ms", 0) / RESPONSE_TIME_BUDGET_MS)),
+            ("Uptime", f"{uptime_hours:.1f} h", None),
         ]
         
         for metric, value, progress in perf_metrics:
             st.markdown(f"**{metric}**: {value}")
-            st.progress(progress / 100)
+            if progress is not None:
+                st.progress(progress / 100)
+
+        if resources.get("available"):
+            growth = resources.get("rss_growth_bytes") or 0
+            load = resources.get("load_average") or ("N/A",) * 3
+            st.caption(
+                f"Threads {resources['threads']} · open fds {resources['open_fds']} · "
+                f"GC gen0/1/2 {'/'.join(str(c) for c in resources['gc_collections'])} collections · "
+                f"load {load[0]} {load[1]} {load[2]}"
+            )
+            st.caption(
+                f"RSS {'+' if growth >= 0 else '-'}{format_file_size(abs(growth))} over the last "
+                f"{resources['window_seconds'] / 60:.0f} min · session traces "
+                f"{len(get_trace_context())} · conversation messages "
+                f"{sum(len(m) for m in st.session_state['conversations'].values())}"
+            )
+
+    history = monitor.history()
+    if len(history) > 1:
+        st.markdown("#### 📈 Process Memory & CPU")
+        st.line_chart(pd.DataFrame({
+            "RSS (MB)": [(h["rss_bytes"] or 0) / 1024 ** 2 for h in history],
+            "CPU %": [h["cpu_percent"] or 0 for h in history],
+        }, index=pd.to_datetime([h["timestamp"] for h in history], unit="s")))
+
+    with st.expander("🧠 Top memory allocators (tracemalloc)"):
+        st.caption("Tracing slows every allocation. The first click starts it, and it keeps running "
+                   "(across reruns and sessions) until you press Stop tracing.")
+        alloc_cols = st.columns(2)
+        with alloc_cols[0]:
+            inspect_allocations = st.button("Show top allocators")
+        with alloc_cols[1]:
+            if st.button("Stop tracing"):
+                stop_allocation_tracing()
+        if inspect_allocations:
+            allocations = top_allocations()
+            if allocations["started"]:
+                st.info("Allocation tracing started - click again to see allocations made from now on.")
+            else:
+                st.markdown(f"Traced: {format_file_size(allocations['traced_bytes'])} "
+                            f"(peak {format_file_size(allocations['traced_peak_bytes'])})")
+                for alloc in allocations["allocations"]:
+                    st.markdown(f"`{format_file_size(alloc['size_bytes'])}` in {alloc['count']} blocks — `{alloc['location']}`")
 
 with tab3:
     st.markdown("### 🔍 Advanced Trace Intelligence")
@@ -1001,22 +1095,19 @@ with tab3:
     traces = get_persistent_traces(trace_limit)
     
     if traces:
-        # Trace analytics
+        # Trace analytics (all traces, from the metrics registry)
         st.markdown("#### 📈 Trace Analytics")
+        trace_analytics = get_trace_analytics()
         trace_stats_cols = st.columns(4)
         
         with trace_stats_cols[0]:
-            st.metric("Total Traces", len(traces))
+            st.metric("Total Traces", trace_analytics["total_traces"])
         with trace_stats_cols[1]:
-            unique_modules = len(set(t.get('routed_to', '') for t in traces))
-            st.metric("Unique Modules", unique_modules)
+            st.metric("Unique Modules", len(trace_analytics["modules_used"]))
         with trace_stats_cols[2]:
-            avg_query_length = sum(len(t.get('query', '')) for t in traces) / len(traces)
-            st.metric("Avg Query Length", f"{avg_query_length:.0f} chars")
+            st.metric("Avg Query Length", f"{trace_analytics.get('average_query_length', 0):.0f} chars")
         with trace_stats_cols[3]:
-            success_traces = len([t for t in traces if 'error' not in t.get('routed_to', '').lower()])
-            success_rate = (success_traces / len(traces)) * 100
-            st.metric("Success Rate", f"{success_rate:.1f}%")
+            st.metric("Success Rate", f"{trace_analytics.get('success_rate', 100.0):.1f}%")
         
         # Detailed trace viewer
         st.markdown("#### 🔬 Detailed Trace Analysis")
@@ -1045,6 +1136,12 @@ with tab3:
                     st.markdown(f"**🎯 Routed to:** `{routed_to}`")
                     st.markdown(f"**📏 Query Length:** {len(query)} characters")
                     st.markdown(f"**🕐 Timestamp:** {timestamp}")
+                    stage_timings = entry.get('stage_timings')
+                    if stage_timings:
+                        st.markdown(f"**⏱️ Total Time:** {format_ms(stage_timings.get('total'))}")
+                        st.markdown(" · ".join(
+                            f"{name} {format_ms(ms)}" for name, ms in stage_timings.items() if name != "total"
+                        ))
                 
                 with trace_details[1]:
                     st.markdown("**🤖 Response Analysis**")
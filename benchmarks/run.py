@@ -0,0 +1,298 @@
+"""Benchmark harness for the routing hot paths.
+
+Run from the repository root (no Streamlit server needed)::
+
+    python -m benchmarks.run --sizes 10,1000,100000 --queries 2000 --output bench.json
+    python -m benchmarks.run --sizes 1000 --compare bench.json
+
+For every size, a temporary workspace gets synthetic FAQs, emails, tickets
+and a conversation history of that many records (see ``benchmarks.synthetic``).
+A fresh worker process then replays a query mix sampled from
+``data/conversation_history.json`` against each benchmarked function.  The
+worker's cwd is the workspace, so the usual ``data/...`` paths resolve to
+the synthetic files, and each size starts with cold caches and its own
+memory high-water mark.
+
+Per function the report gives:
+
+* the first (cold) call, which includes index builds and file loads
+* throughput and p50/p95/p99 latency over the replay
+* the largest per-call traced allocation peak (tracemalloc pass over
+  ``--memory-queries`` queries)
+* the process peak RSS once the function has run
+
+Results are written as JSON.  ``--compare`` prints each p50/p95/throughput
+change against an earlier run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synthetic import (BENCH_USER, QUERY_SOURCE_PATH, REPO_ROOT, load_query_mix, sample_queries,
+                                  write_workspace)
+
+DEFAULT_SIZES = "10,1000,10000"
+DEFAULT_QUERIES = 1000
+DEFAULT_MEMORY_QUERIES = 50
+REPORT_VERSION = 1
+
+# Run in this order: the router goes last, so the other functions' cold calls still build their indexes
+FUNCTIONS = (
+    "faq.match_faq",
+    "context_manager.fetch_relevant_email",
+    "context_manager.get_relevant_context",
+    "trace_logger.log_trace",
+    "router.route_query",
+)
+
+
+# --- Worker (runs inside a synthetic workspace) ---
+
+def _bench_targets() -> Dict[str, Callable[[str, str], Any]]:
+    """Function name -> call(query, role), imported only once the cwd is the workspace."""
+    from core import context_manager as cm
+    from core import faq, router
+    from core.actions import load_action_config
+    from utils import trace_logger
+
+    action_config = load_action_config()
+    trace_metadata = {"role": "Admin", "confidence": 0.9, "complexity": "simple", "context_used": False}
+
+    return {
+        "router.route_query": lambda query, role: router.route_query(
+            query, role, None, None, None, action_config, user_id=BENCH_USER),
+        "context_manager.get_relevant_context": lambda query, role: cm.get_relevant_context(BENCH_USER, query),
+        "context_manager.fetch_relevant_email": lambda query, role: cm.fetch_relevant_email(query.lower()),
+        "faq.match_faq": lambda query, role: faq.match_faq(query.lower()),
+        "trace_logger.log_trace": lambda query, role: trace_logger.log_trace(
+            query, {"text": "Benchmark response"}, "FAQ Module", dict(trace_metadata, role=role)),
+    }
+
+
+def _peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _measure(name: str, call: Callable[[str, str], Any], queries: List[Tuple[str, str]],
+             memory_queries: int) -> Dict[str, Any]:
+    from utils.metrics import LogLinearHistogram
+    from utils.timing import latency_stats
+
+    first_query, first_role = queries[0]
+    start = time.perf_counter_ns()
+    call(first_query, first_role)
+    cold_ns = time.perf_counter_ns() - start
+
+    histogram = LogLinearHistogram()
+    errors = 0
+    loop_start = time.perf_counter_ns()
+    for query, role in queries:
+        start = time.perf_counter_ns()
+        try:
+            call(query, role)
+        except Exception:
+            errors += 1
+        histogram.record(time.perf_counter_ns() - start)
+    loop_ns = time.perf_counter_ns() - loop_start
+
+    # Allocation peaks are measured separately: tracemalloc slows every allocation down
+    traced_peak = 0
+    tracemalloc.start()
+    try:
+        for query, role in queries[:memory_queries]:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                call(query, role)
+            except Exception:
+                pass
+            traced_peak = max(traced_peak, tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        "function": name,
+        "calls": histogram.count,
+        "errors": errors,
+        "cold_ms": round(cold_ns / 1e6, 3),
+        "throughput_per_s": round(histogram.count / (loop_ns / 1e9), 1) if loop_ns else None,
+        "min_ms": round(histogram.min / 1e6, 3),
+        "max_ms": round(histogram.max / 1e6, 3),
+        "traced_peak_bytes": traced_peak,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+    result.update(latency_stats(histogram))
+    return result
+
+
+def run_worker(size: int, query_count: int, memory_queries: int, seed: int,
+               functions: List[str], query_source: str) -> Dict[str, Any]:
+    """Benchmark ``functions`` against the workspace in the current directory."""
+    rng = random.Random(seed)
+    queries = sample_queries(load_query_mix(query_source), query_count, rng)
+    if not queries:
+        raise SystemExit(f"No queries found in {query_source}")
+
+    targets = _bench_targets()
+    results = []
+    for name in sorted(functions, key=FUNCTIONS.index):
+        results.append(_measure(name, targets[name], queries, memory_queries))
+
+    # Let the background trace writer drain before the workspace is removed
+    from utils.trace_sink import get_trace_sink
+    get_trace_sink().flush()
+    return {"size": size, "results": results}
+
+
+# --- Driver ---
+
+def _run_size(size: int, args: argparse.Namespace, mix: List[Tuple[str, str]]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"finkraft-bench-{size}-") as workspace:
+        setup_start = time.perf_counter()
+        counts = write_workspace(workspace, size, mix, seed=args.seed)
+        setup_seconds = time.perf_counter() - setup_start
+
+        result_path = os.path.join(workspace, "bench_result.json")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, env.get("PYTHONPATH")]))
+        # The whole synthetic history stays retained, so context scoring sees every turn
+        env["FINKRAFT_HISTORY_RETENTION"] = str(max(size, 1))
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--worker", result_path,
+            "--sizes", str(size), "--queries", str(args.queries),
+            "--memory-queries", str(args.memory_queries), "--seed", str(args.seed),
+            "--functions", ",".join(args.functions), "--query-source", os.path.abspath(args.query_source),
+        ]
+        completed = subprocess.run(command, cwd=workspace, env=env,
+                                   stdout=None if args.verbose else subprocess.DEVNULL)
+        if completed.returncode != 0:
+            return {"size": size, "datasets": counts, "error": f"worker exited with {completed.returncode}"}
+        with open(result_path, "r") as f:
+            result = json.load(f)
+
+    result["datasets"] = counts
+    result["setup_seconds"] = round(setup_seconds, 2)
+    return result
+
+
+def _format_bytes(size: Optional[float]) -> str:
+    if size is None:
+        return "N/A"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = f"{'function':<40} {'cold ms':>9} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc peak':>11} {'peak RSS':>10}"
+    for run in report["runs"]:
+        print(f"\n=== size {run['size']} ({run.get('setup_seconds', 0)}s setup) ===")
+        if "error" in run:
+            print(f"⚠️ {run['error']}")
+            continue
+        print(header)
+        for r in run["results"]:
+            print(f"{r['function']:<40} {r['cold_ms']:>9.2f} {r['throughput_per_s'] or 0:>10.1f} "
+                  f"{r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} "
+                  f"{_format_bytes(r['traced_peak_bytes']):>11} {_format_bytes(r['peak_rss_bytes']):>10}")
+
+
+def _change(new: Optional[float], old: Optional[float]) -> str:
+    if not new or not old:
+        return "N/A"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print p50/p95/throughput changes for every (size, function) present in both runs."""
+    previous = {
+        (run["size"], r["function"]): r
+        for run in baseline.get("runs", []) for r in run.get("results", [])
+    }
+    print(f"\n=== compared with {baseline.get('meta', {}).get('started_at', 'baseline')} ===")
+    print(f"{'size':>8} {'function':<40} {'p50':>9} {'p95':>9} {'ops/s':>9}")
+    for run in report["runs"]:
+        for r in run.get("results", []):
+            old = previous.get((run["size"], r["function"]))
+            if old is None:
+                continue
+            print(f"{run['size']:>8} {r['function']:<40} {_change(r['p50_ms'], old.get('p50_ms')):>9} "
+                  f"{_change(r['p95_ms'], old.get('p95_ms')):>9} "
+                  f"{_change(r['throughput_per_s'], old.get('throughput_per_s')):>9}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the router, context manager, FAQ and trace hot paths.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated record counts for FAQs, emails, tickets and history (10 to 1000000)")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="queries replayed per function")
+    parser.add_argument("--memory-queries", type=int, default=DEFAULT_MEMORY_QUERIES,
+                        help="queries replayed under tracemalloc for allocation peaks")
+    parser.add_argument("--functions", default=",".join(FUNCTIONS), help="comma-separated subset of: " + ", ".join(FUNCTIONS))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--query-source", default=QUERY_SOURCE_PATH, help="conversation history to draw queries from")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="show output printed by the benchmarked code")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    args.sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    args.functions = [f.strip() for f in args.functions.split(",") if f.strip()]
+    unknown = [f for f in args.functions if f not in FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown functions: {', '.join(unknown)}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.worker:
+        result = run_worker(args.sizes[0], args.queries, args.memory_queries, args.seed,
+                            args.functions, args.query_source)
+        with open(args.worker, "w") as f:
+            json.dump(result, f)
+        return
+
+    mix = load_query_mix(args.query_source)
+    report = {
+        "version": REPORT_VERSION,
+        "meta": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "queries": args.queries,
+            "memory_queries": args.memory_queries,
+            "seed": args.seed,
+            "query_source": args.query_source,
+            "distinct_queries": len(set(mix)),
+        },
+        "runs": [_run_size(size, args, mix) for size in args.sizes],
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare_reports(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
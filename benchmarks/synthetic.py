@@ -0,0 +1,196 @@
+"""Synthetic FAQs, emails, tickets and conversation history for the benchmarks.
+
+Each dataset starts from the repository's own fixtures under ``data/`` and
+is padded with generated records built from the same vocabulary (vendors,
+periods, filing topics, ticket and invoice IDs).  That way the replayed
+queries hit the matching paths as well as the miss paths.  Generation is
+seeded, so two runs at the same size and seed benchmark identical data.
+"""
+import json
+import os
+import random
+import shutil
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY_SOURCE_PATH = os.path.join(REPO_ROOT, "data", "conversation_history.json")
+
+# Fixtures copied unchanged: action config and the invoice/ledger CSVs behind the actions
+FIXTURE_DIRS = ("config",)
+FIXTURE_FILES = ("invoices.csv", "purchase_register.csv", "gstr2a.csv")
+
+BENCH_USER = "bench-user"
+
+VENDORS = ("ABC Pvt Ltd", "Sharma Traders", "Kumar Logistics", "Zenith Supplies", "Metro Office Mart",
+           "Coastal Freight", "Orbit Software", "Greenleaf Foods", "Apex Components", "Vertex Consulting")
+PERIODS = ("last month", "this month", "last quarter", "this quarter", "last year",
+           "Q1 2025", "Q2 2025", "Q3 2025", "Q4 2024")
+TOPICS = ("GST filing", "GSTR-2A reconciliation", "input tax credit", "invoice mismatch", "e-way bill",
+          "TDS deduction", "vendor onboarding", "audit trail", "filing status", "purchase register")
+CATEGORIES = ("reminder", "support", "vendors", "itc", "gst_filing", "audit", "invoices")
+QUESTION_TEMPLATES = (
+    "Why did my {topic} fail for {period}?",
+    "How do I fix {topic} errors?",
+    "What is {topic}?",
+    "When is the {topic} deadline for {period}?",
+    "How can I check {topic} for {vendor}?",
+)
+ANSWER_TEMPLATES = (
+    "{topic} issues usually come from missing invoice data or an incorrect GSTIN. Review the error log for {period}.",
+    "Open the {topic} dashboard, select {period} and compare the supplier records for {vendor}.",
+)
+EMAIL_SUBJECTS = (
+    "{topic} update for {period}",
+    "Action required: {topic} for {vendor}",
+    "INV-{number} flagged during {topic}",
+    "Ticket TCK-{ticket} status: {topic}",
+)
+EMAIL_BODIES = (
+    "Dear User, the {topic} for {period} shows {count} invoices with mismatches from {vendor}. Amount ₹{amount}.",
+    "Dear User, your {topic} request was completed. Reference INV-{number}, vendor {vendor}.",
+    "Dear User, ticket TCK-{ticket} about {topic} has been updated. Please review before the {period} deadline.",
+)
+TICKET_STATUSES = ("open", "in_progress", "resolved", "closed")
+TICKET_PRIORITIES = ("low", "medium", "high")
+TEAMS = ("Compliance Team", "Reconciliation Team", "Support Team", "Finance Team")
+INTENTS = ("data_retrieval", "explanation", "creation", "report_generation", "status_check", "general")
+
+
+def _load_json(path: str, default: Any) -> Any:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _fields(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "topic": rng.choice(TOPICS),
+        "period": rng.choice(PERIODS),
+        "vendor": rng.choice(VENDORS),
+        "number": rng.randint(1, 999999),
+        "ticket": rng.randint(101, 999999),
+        "count": rng.randint(1, 40),
+        "amount": f"{rng.randint(1000, 9999999):,}",
+    }
+
+
+def _date(rng: random.Random) -> str:
+    return (datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 700))).strftime("%Y-%m-%d")
+
+
+def generate_faqs(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    faqs = _load_json(os.path.join(REPO_ROOT, "data", "faqs.json"), [])[:size]
+    while len(faqs) < size:
+        fields = _fields(rng)
+        faqs.append({
+            "question": rng.choice(QUESTION_TEMPLATES).format(**fields),
+            "answer": rng.choice(ANSWER_TEMPLATES).format(**fields),
+            "tags": [fields["topic"].lower().replace(" ", "_"), rng.choice(CATEGORIES)],
+        })
+    return faqs
+
+
+def generate_emails(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    emails = _load_json(os.path.join(REPO_ROOT, "data", "sample_emails.json"), [])[:size]
+    while len(emails) < size:
+        fields = _fields(rng)
+        emails.append({
+            "id": f"email_{len(emails) + 1:07d}",
+            "subject": rng.choice(EMAIL_SUBJECTS).format(**fields),
+            "body": rng.choice(EMAIL_BODIES).format(**fields),
+            "category": rng.choice(CATEGORIES),
+            "date": _date(rng),
+        })
+    return emails
+
+
+def generate_tickets(size: int, rng: random.Random) -> List[Dict[str, Any]]:
+    tickets = _load_json(os.path.join(REPO_ROOT, "data", "tickets.json"), [])[:size]
+    next_number = 101 + len(tickets)
+    while len(tickets) < size:
+        fields = _fields(rng)
+        created = _date(rng)
+        tickets.append({
+            "ticket_id": f"TCK-{next_number}",
+            "summary": f"{fields['topic'].capitalize()} issue for {fields['vendor']} ({fields['period']})",
+            "status": rng.choice(TICKET_STATUSES),
+            "priority": rng.choice(TICKET_PRIORITIES),
+            "created_at": created,
+            "updated_at": created,
+            "assigned_to": rng.choice(TEAMS),
+        })
+        next_number += 1
+    return tickets
+
+
+def generate_history(size: int, queries: List[Tuple[str, str]], rng: random.Random) -> List[Dict[str, Any]]:
+    """``size`` turns for one user, oldest first, in the shape save_conversation writes."""
+    from core.entities import ENTITY_VERSION, extract_entities
+
+    start = datetime.now() - timedelta(minutes=size)
+    history = []
+    for i in range(size):
+        fields = _fields(rng)
+        query, role = rng.choice(queries) if queries and rng.random() < 0.5 else (
+            rng.choice(QUESTION_TEMPLATES).format(**fields), "Admin")
+        moment = start + timedelta(minutes=i)
+        history.append({
+            "timestamp": moment.isoformat(),
+            "ts": moment.timestamp(),
+            "query": query,
+            "response": rng.choice(ANSWER_TEMPLATES).format(**fields),
+            "context": {"role": role, "timestamp": moment.isoformat()},
+            "entities": extract_entities(query).as_dict(),
+            "entities_version": ENTITY_VERSION,
+            "intent": rng.choice(INTENTS),
+            "satisfaction_score": round(rng.uniform(0.2, 1.0), 2),
+        })
+    return history
+
+
+def load_query_mix(path: str = QUERY_SOURCE_PATH) -> List[Tuple[str, str]]:
+    """Every recorded (query, role) pair, duplicates kept so sampling follows real frequencies."""
+    history = _load_json(path, {})
+    if not isinstance(history, dict):
+        return []
+    return [
+        (entry["query"], (entry.get("context") or {}).get("role") or "Admin")
+        for entries in history.values() for entry in entries if entry.get("query")
+    ]
+
+
+def sample_queries(mix: List[Tuple[str, str]], count: int, rng: random.Random) -> List[Tuple[str, str]]:
+    return [rng.choice(mix) for _ in range(count)] if mix else []
+
+
+def write_workspace(directory: str, size: int, queries: List[Tuple[str, str]], seed: int = 0) -> Dict[str, int]:
+    """Lay out ``directory`` like the repository root, with synthetic data of ``size`` records each."""
+    rng = random.Random(seed)
+    data_dir = os.path.join(directory, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    for name in FIXTURE_DIRS:
+        shutil.copytree(os.path.join(REPO_ROOT, name), os.path.join(directory, name), dirs_exist_ok=True)
+    for name in FIXTURE_FILES:
+        source = os.path.join(REPO_ROOT, "data", name)
+        if os.path.exists(source):
+            shutil.copy(source, data_dir)
+
+    datasets = {
+        "faqs.json": generate_faqs(size, rng),
+        "sample_emails.json": generate_emails(size, rng),
+        "tickets.json": generate_tickets(size, rng),
+        # Imported into the conversation store on first use, like any legacy history file
+        "conversation_history.json": {BENCH_USER: generate_history(size, queries, rng)},
+    }
+    for name, records in datasets.items():
+        with open(os.path.join(data_dir, name), "w") as f:
+            json.dump(records, f)
+    return {
+        "faqs": len(datasets["faqs.json"]),
+        "emails": len(datasets["sample_emails.json"]),
+        "tickets": len(datasets["tickets.json"]),
+        "history_turns": size,
+    }
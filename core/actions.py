@@ -1,111 +1,127 @@
 import re
-import json
-import os
 from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping
 
-def extract_parameters(query: str) -> dict:
-    """Extract structured parameters from natural language query."""
+from core.invoice_repository import get_invoice_repository
+from core.reconciliation import get_reconciler
+from core.report_generator import (DEFAULT_FORMAT, ReportError, format_file_size, get_report_registry,
+                                   latest_register_month)
+from core.query_analyzer import ACTION_PATTERNS, QueryFeatures, analyze_query
+from utils.role_manager import get_action_config, get_allowed_action_names
+
+# ---------- Compiled extraction tables (built once at import) ----------
+PERIOD_PATTERNS = [
+    (re.compile(r"\blast\s+month\b"), "last_month"),
+    (re.compile(r"\bthis\s+month\b"), "this_month"),
+    (re.compile(r"\blast\s+quarter\b"), "last_quarter"),
+    (re.compile(r"\bq[1-4]\s*20\d{2}\b"), lambda m: m.group(0).upper()),
+    (re.compile(r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s+20\d{2}\b"), lambda m: m.group(0)),
+]
+
+VENDOR_PATTERNS = [
+    re.compile(r"vendor[=\s]+['\"]?([A-Za-z0-9\s&]+)['\"]?", re.IGNORECASE),      # vendor = IndiSky
+    re.compile(r"supplier[=\s]+['\"]?([A-Za-z0-9\s&]+)['\"]?", re.IGNORECASE),    # supplier = TechCorp
+    re.compile(r"\bfrom\s+([A-Z][A-Za-z0-9\s&]+)(?=\s|,|$)", re.IGNORECASE),       # from IndiSky
+]
+VENDOR_STOPWORDS = frozenset(["last month", "this month", "last", "this", "quarter"])
+
+STATUS_PATTERNS = [
+    re.compile(r"status[=\s]+['\"]?(\w+)['\"]?"),     # status=pending
+    re.compile(r"\b(failed|pending|reconciled|open|closed|processing)\b"),
+]
+
+REPORT_ID_PATTERN = re.compile(r"\bRPT-[0-9A-Z-]+\b", re.IGNORECASE)
+REPORT_FORMAT_PATTERN = re.compile(r"\b(csv|xlsx|excel|pdf)\b", re.IGNORECASE)
+REPORT_FORMAT_ALIASES = {"csv": "csv", "xlsx": "xlsx", "excel": "xlsx", "pdf": "pdf"}
+
+# Used when the query names no period and the register has no newest month to offer
+DEFAULT_PERIOD = "this_month"
+
+HIGH_PRIORITY_WORDS = ("urgent", "high priority", "critical")
+LOW_PRIORITY_WORDS = ("low priority", "minor")
+
+def _default_period() -> str:
+    """Period for reconciliations and reports that name none: the newest month in the purchase register."""
+    try:
+        return latest_register_month() or DEFAULT_PERIOD
+    except Exception as e:
+        print(f"⚠️ Error reading the purchase register: {str(e)}")
+        return DEFAULT_PERIOD
+
+def _period_label(period: str) -> str:
+    """Display form of an extracted period ("this_month" -> "This Month")."""
+    return period.replace("_", " ").title()
+
+@lru_cache(maxsize=1024)
+def extract_parameters(query: str) -> Mapping[str, str]:
+    """Extract structured parameters from natural language query.
+
+    Results are memoized per query text and returned as a read-only mapping,
+    so the same object can be shared by every handler that needs it.
+    """
     params = {}
     query_lower = query.lower()
 
     # ---------- Time Period Extraction (highest priority) ----------
-    time_patterns = {
-        r"\blast\s+month\b": "last_month",
-        r"\bthis\s+month\b": "this_month",
-        r"\blast\s+quarter\b": "last_quarter",
-        r"\bq[1-4]\s*20\d{2}\b": lambda m: m.group(0).upper(),
-        r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s+20\d{2}\b": lambda m: m.group(0)
-    }
-
-    for pattern, value in time_patterns.items():
-        match = re.search(pattern, query_lower)
+    for pattern, value in PERIOD_PATTERNS:
+        match = pattern.search(query_lower)
         if match:
             params["period"] = value(match) if callable(value) else value
             break  # ✅ Stop at first valid time match
 
     # ---------- Vendor Extraction (run AFTER period to avoid false capture) ----------
-    vendor_patterns = [
-        r"vendor[=\s]+['\"]?([A-Za-z0-9\s&]+)['\"]?",      # vendor = IndiSky
-        r"supplier[=\s]+['\"]?([A-Za-z0-9\s&]+)['\"]?",    # supplier = TechCorp
-        r"\bfrom\s+([A-Z][A-Za-z0-9\s&]+)(?=\s|,|$)"       # from IndiSky
-    ]
-
-    for pattern in vendor_patterns:
-        match = re.search(pattern, query, re.IGNORECASE)
+    for pattern in VENDOR_PATTERNS:
+        match = pattern.search(query)
         if match:
             vendor_name = match.group(1).strip()
             # ✅ Guard against false matches like "from last month"
-            if vendor_name.lower() not in ["last month", "this month", "last", "this", "quarter"]:
+            if vendor_name.lower() not in VENDOR_STOPWORDS:
                 params["vendor"] = vendor_name
                 break
 
     # ---------- Status Extraction ----------
-    status_patterns = [
-        r"status[=\s]+['\"]?(\w+)['\"]?",     # status=pending
-        r"\b(failed|pending|reconciled|open|closed|processing)\b"
-    ]
-
-    for pattern in status_patterns:
-        match = re.search(pattern, query_lower)
+    for pattern in STATUS_PATTERNS:
+        match = pattern.search(query_lower)
         if match:
             params["status"] = match.group(1).lower()
             break
 
     # ---------- Priority Extraction ----------
-    if any(word in query_lower for word in ["urgent", "high priority", "critical"]):
+    if any(word in query_lower for word in HIGH_PRIORITY_WORDS):
         params["priority"] = "high"
-    elif any(word in query_lower for word in ["low priority", "minor"]):
+    elif any(word in query_lower for word in LOW_PRIORITY_WORDS):
         params["priority"] = "low"
     else:
         params["priority"] = "medium"  # ✅ Default
 
-    return params
+    return MappingProxyType(params)
 
 # Enhanced filter_invoices with better business logic
 def filter_invoices(query, role, params=None):
-    # Extract parameters using enhanced extraction
-    extracted_params = extract_parameters(query)
-    
-    # Simulate more realistic data
-    sample_invoices = [
-        {"invoice_id": "INV-2024-001", "vendor": "IndiSky", "status": "failed", "date": "2024-12-01", "amount": 50000, "error": "Missing GSTIN"},
-        {"invoice_id": "INV-2024-002", "vendor": "IndiSky", "status": "failed", "date": "2024-12-05", "amount": 75000, "error": "Invalid HSN code"},
-        {"invoice_id": "INV-2024-003", "vendor": "TechCorp", "status": "pending", "date": "2024-12-10", "amount": 120000, "error": None},
-        {"invoice_id": "INV-2024-004", "vendor": "DataFlow", "status": "reconciled", "date": "2024-12-15", "amount": 95000, "error": None},
-        {"invoice_id": "INV-2024-005", "vendor": "IndiSky", "status": "failed", "date": "2024-12-20", "amount": 60000, "error": "Amount mismatch"}
-    ]
-    
-    # Apply filters
-    filtered_invoices = sample_invoices
-    filter_applied = []
-    
-    if extracted_params.get('vendor'):
-        vendor = extracted_params['vendor'].lower()
-        filtered_invoices = [inv for inv in filtered_invoices if vendor in inv['vendor'].lower()]
-        filter_applied.append(f"vendor: {extracted_params['vendor']}")
-    
-    if extracted_params.get('status'):
-        status = extracted_params['status']
-        filtered_invoices = [inv for inv in filtered_invoices if inv['status'] == status]
-        filter_applied.append(f"status: {status}")
-    
-    if extracted_params.get('period'):
-        period = extracted_params['period']
-        if period == "last_month":
-            # Simulate filtering for last month
-            filtered_invoices = [inv for inv in filtered_invoices if "2024-12" in inv['date']]
-            filter_applied.append(f"period: last month")
-    
-    # Calculate summary statistics
-    total_amount = sum(inv['amount'] for inv in filtered_invoices)
-    failed_count = len([inv for inv in filtered_invoices if inv['status'] == 'failed'])
+    # Reuse the caller's parameters when handle_action already extracted them
+    extracted_params = params if params is not None else extract_parameters(query)
+    
+    # Vectorized mask over the columnar invoice store; aggregates come from the same mask
+    result = get_invoice_repository().filter(
+        vendor=extracted_params.get('vendor'),
+        status=extracted_params.get('status'),
+        period=extracted_params.get('period'),
+        limit=5
+    )
+    filtered_invoices = result.rows
+    filter_applied = result.filters_applied
+    total_found = result.total_found
+    total_amount = result.total_amount
+    failed_count = result.failed_count
     
     # Build detailed response
     filter_text = ", ".join(filter_applied) if filter_applied else "all criteria"
     
     response_text = f"📊 **Invoice Filter Results**\n\n"
     response_text += f"**Filters Applied**: {filter_text}\n"
-    response_text += f"**Found**: {len(filtered_invoices)} invoices\n"
+    response_text += f"**Found**: {total_found} invoices\n"
     response_text += f"**Total Amount**: ₹{total_amount:,}\n"
     if failed_count > 0:
         response_text += f"**⚠️ Failed**: {failed_count} invoices need attention\n"
@@ -118,11 +134,11 @@ def filter_invoices(query, role, params=None):
             response_text += f" - *{inv['error']}*"
         response_text += "\n"
     
-    if len(filtered_invoices) > 5:
-        response_text += f"\n... and {len(filtered_invoices) - 5} more invoices"
+    if total_found > 5:
+        response_text += f"\n... and {total_found - 5} more invoices"
     
     # Enhanced actions list
-    actions = [f"Filtered {len(filtered_invoices)} invoices by {filter_text}"]
+    actions = [f"Filtered {total_found} invoices by {filter_text}"]
     if failed_count > 0:
         actions.append(f"Identified {failed_count} failed invoices requiring attention")
     
@@ -130,45 +146,41 @@ def filter_invoices(query, role, params=None):
         "text": response_text,
         "actions": actions,
         "data": {
-            "total_found": len(filtered_invoices),
+            "total_found": total_found,
             "total_amount": total_amount,
             "failed_count": failed_count,
-            "filters_applied": extracted_params
+            "filters_applied": dict(extracted_params)
         }
     }
 
 # Enhanced reconcile_invoices with detailed business logic
 def reconcile_invoices(query, role, params=None):
-    extracted_params = extract_parameters(query)
-    period = extracted_params.get('period', 'current month')
-    
-    # Simulate realistic reconciliation data
-    reconciliation_data = {
-        "total_invoices": 156,
-        "matched": 142,
-        "mismatched": 11,
-        "missing_gstr2a": 3,
-        "amount_discrepancies": [
-            {"invoice_id": "INV-001", "our_amount": 50000, "gstr2a_amount": 49500, "difference": 500},
-            {"invoice_id": "INV-045", "our_amount": 75000, "gstr2a_amount": 73000, "difference": 2000}
-        ],
-        "missing_invoices": [
-            {"invoice_id": "INV-078", "vendor": "TechCorp", "amount": 120000},
-            {"invoice_id": "INV-091", "vendor": "DataSys", "amount": 85000}
-        ]
-    }
+    extracted_params = params if params is not None else extract_parameters(query)
+    period = extracted_params.get('period') or _default_period()
+    
+    try:
+        reconciliation_data = get_reconciler(period).reconcile(period)
+    except Exception as e:
+        print(f"⚠️ Error reconciling invoices: {str(e)}")
+        return {
+            "text": "⚠️ Reconciliation failed: the purchase register or GSTR-2A data could not be read.",
+            "actions": [],
+            "data": {}
+        }
     
-    match_rate = (reconciliation_data["matched"] / reconciliation_data["total_invoices"]) * 100
+    total = reconciliation_data["total_invoices"]
+    match_rate = (reconciliation_data["matched"] / total) * 100 if total else 0.0
     
     response_text = f"🔄 **Invoice Reconciliation Complete**\n\n"
-    response_text += f"**Period**: {period.title()}\n"
+    response_text += f"**Period**: {_period_label(period)}\n"
     response_text += f"**Match Rate**: {match_rate:.1f}%\n\n"
     
     response_text += f"📊 **Summary**:\n"
     response_text += f"• Total Processed: {reconciliation_data['total_invoices']}\n"
     response_text += f"• ✅ Matched: {reconciliation_data['matched']}\n"
     response_text += f"• ⚠️ Mismatched: {reconciliation_data['mismatched']}\n"
-    response_text += f"• ❌ Missing from GSTR-2A: {reconciliation_data['missing_gstr2a']}\n\n"
+    response_text += f"• ❌ Missing from GSTR-2A: {reconciliation_data['missing_gstr2a']}\n"
+    response_text += f"• 📥 Missing from Books: {reconciliation_data['missing_in_books']}\n\n"
     
     if reconciliation_data['amount_discrepancies']:
         response_text += f"💰 **Amount Discrepancies**:\n"
@@ -180,6 +192,12 @@ def reconcile_invoices(query, role, params=None):
         response_text += f"📋 **Missing Invoices**:\n"
         for miss in reconciliation_data['missing_invoices']:
             response_text += f"• {miss['invoice_id']}: {miss['vendor']} - ₹{miss['amount']:,}\n"
+        response_text += "\n"
+    
+    if reconciliation_data['unrecorded_invoices']:
+        response_text += f"📥 **In GSTR-2A but not in Books**:\n"
+        for miss in reconciliation_data['unrecorded_invoices']:
+            response_text += f"• {miss['invoice_id']}: {miss['vendor']} - ₹{miss['amount']:,}\n"
     
     actions = [
         f"Reconciled {reconciliation_data['total_invoices']} invoices for {period}",
@@ -197,39 +215,100 @@ def reconcile_invoices(query, role, params=None):
 
 # Load action configuration
 def load_action_config():
-    config_path = os.path.join("config", "actions_config.json")
-    with open(config_path, "r") as f:
-        return json.load(f)
+    # Cached by role_manager and re-read only when the file's mtime changes
+    return get_action_config()
 
-def download_gst_report(query, role, params=None):
-    extracted_params = extract_parameters(query)
-    period = extracted_params.get('period', 'current month')
-    
-    # Generate report metadata
+def _report_status_response(job):
+    """Chat response for a report job, finished or still running."""
     report_data = {
-        "report_id": f"RPT-{datetime.now().strftime('%Y%m%d%H%M')}",
-        "period": period,
-        "file_size": "2.3 MB",
-        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "report_id": job.report_id,
+        "period": job.period,
+        "format": job.fmt,
+        "status": job.status,
+        "progress": round(job.progress * 100, 1),
+        "row_count": job.row_count,
+        "generated_at": job.finished_at or job.created_at,
+        "cached": job.cached
     }
     
+    if job.status == "failed":
+        return {
+            "text": f"⚠️ **Report {job.report_id} Failed**\n\n{job.error}",
+            "actions": [f"Report {job.report_id} failed"],
+            "data": report_data
+        }
+    
+    if not job.done:
+        response_text = f"⏳ **GST Report In Progress**\n\n"
+        response_text += f"**Report ID**: {job.report_id}\n"
+        response_text += f"**Period**: {_period_label(job.period)}\n"
+        response_text += f"**Progress**: {report_data['progress']:.0f}% ({job.rows_scanned:,} of {job.rows_total:,} register rows scanned)\n\n"
+        response_text += f"Ask for `report status {job.report_id}` to check on it."
+        return {
+            "text": response_text,
+            "actions": [f"Queued GST report for {job.period}", f"Started report {job.report_id}"],
+            "data": report_data
+        }
+    
+    report_data["file_size"] = format_file_size(job.file_size)
+    report_data["file_path"] = job.file_path
+    
     response_text = f"📊 **GST Report Generated**\n\n"
-    response_text += f"**Report ID**: {report_data['report_id']}\n"
-    response_text += f"**Period**: {period.title()}\n"
+    response_text += f"**Report ID**: {job.report_id}\n"
+    response_text += f"**Period**: {_period_label(job.period)}\n"
+    response_text += f"**Invoices**: {job.row_count:,}\n"
     response_text += f"**File Size**: {report_data['file_size']}\n"
     response_text += f"**Generated**: {report_data['generated_at']}\n\n"
-    response_text += f"📁 File: `reports/gst_{period.replace(' ', '_')}_{report_data['report_id']}.pdf`\n"
+    response_text += f"📁 File: `{job.file_path}`\n"
+    if job.cached:
+        response_text += f"♻️ Source data unchanged since this report was generated - reusing it\n"
     response_text += f"⏰ Available for download for 30 days"
     
     return {
         "text": response_text,
-        "actions": [f"Generated GST report for {period}", f"Created report {report_data['report_id']}"],
+        "actions": [f"Generated GST report for {job.period}", f"Created report {job.report_id}"],
         "data": report_data
     }
 
+def download_gst_report(query, role, params=None):
+    extracted_params = params if params is not None else extract_parameters(query)
+    registry = get_report_registry()
+    
+    # "report status RPT-..." asks about a report that is already running
+    report_id = REPORT_ID_PATTERN.search(query)
+    if report_id:
+        job = registry.get(report_id.group(0))
+        if job is None:
+            return {
+                "text": f"❓ No report with ID {report_id.group(0).upper()} was found in this session.",
+                "actions": ["Looked up report status"],
+                "data": {}
+            }
+        return _report_status_response(job)
+    
+    period = extracted_params.get('period') or _default_period()
+    fmt_match = REPORT_FORMAT_PATTERN.search(query)
+    fmt = REPORT_FORMAT_ALIASES.get(fmt_match.group(1).lower(), DEFAULT_FORMAT) if fmt_match else DEFAULT_FORMAT
+    
+    try:
+        job = registry.submit(period, fmt)
+    except ReportError as e:
+        return {
+            "text": f"⚠️ {str(e)}",
+            "actions": [],
+            "data": {"period": period, "format": fmt}
+        }
+    
+    # Small periods finish inside the wait; large ones keep running in the background
+    if not job.cached:
+        job = registry.wait(job.report_id)
+    response = _report_status_response(job)
+    response["report_cache"] = dict(registry.cache.stats(), result="hit" if job.cached else "miss")
+    return response
+
 def view_filing_status(query, role, params=None):
-    extracted_params = extract_parameters(query)
-    period = extracted_params.get('period', 'current month')
+    extracted_params = params if params is not None else extract_parameters(query)
+    period = extracted_params.get('period', DEFAULT_PERIOD)
     
     # Simulate filing status data
     status_data = {
@@ -242,7 +321,7 @@ def view_filing_status(query, role, params=None):
     }
     
     response_text = f"📝 **GST Filing Status**\n\n"
-    response_text += f"**Period**: {period.title()}\n"
+    response_text += f"**Period**: {_period_label(period)}\n"
     response_text += f"**Status**: {status_data['status']} {'⚠️' if 'delay' in status_data['status'] else '✅'}\n"
     response_text += f"**Due Date**: {status_data['due_date']}\n"
     response_text += f"**Filed Date**: {status_data['filed_date']}\n"
@@ -256,7 +335,7 @@ def view_filing_status(query, role, params=None):
     }
 
 def raise_ticket(query, role, params=None):
-    extracted_params = extract_parameters(query)
+    extracted_params = params if params is not None else extract_parameters(query)
     priority = extracted_params.get('priority', 'medium')
     
     ticket_id = f"TCK-{datetime.now().strftime('%H%M%S')}"
@@ -284,58 +363,35 @@ ACTION_HANDLERS = {
     "raise_ticket": raise_ticket
 }
 
-# Enhanced action patterns with more variations
-ACTION_PATTERNS = {
-    "filter_invoices": [
-        "filter invoices", "show invoices", "find invoices", "search invoices", 
-        "list invoices", "invoices for", "get invoices"
-    ],
-    "download_gst_report": [
-        "download report", "get report", "generate report", "export report",
-        "gst report", "download gst", "create report"
-    ],
-    "view_filing_status": [
-        "filing status", "check status", "gst status", "show status",
-        "filing for", "check filing", "status of filing"
-    ],
-    "reconcile_invoices": [
-        "reconcile", "match invoices", "compare invoices", "reconcile invoices",
-        "invoice reconciliation", "match with gstr"
-    ],
-    "raise_ticket": [
-        "raise ticket", "create ticket", "new ticket", "open ticket",
-        "support ticket", "help ticket", "ticket for"
-    ]
-}
+def resolve_action(role: str, features: QueryFeatures):
+    """Name of the action handle_action would run for this query and role, or None."""
+    allowed_actions = get_allowed_action_names(role)
+    for action_name in features.actions:
+        if action_name in allowed_actions and action_name in ACTION_HANDLERS:
+            return action_name
+    return None
 
-def handle_action(query: str, role: str):
+def handle_action(query: str, role: str, features: QueryFeatures = None):
     """Enhanced action handler with better parameter extraction and business logic"""
-    query_lower = query.lower()
-    
-    # Check permissions
-    action_config = load_action_config()
-    allowed_actions = [a["name"] for a in action_config if role.lower() in [r.lower() for r in a["role_access"]]]
-    
-    # Enhanced pattern matching
-    for action_name, patterns in ACTION_PATTERNS.items():
-        if action_name not in allowed_actions:
-            continue
-            
-        # Check if any pattern matches
-        if any(pattern in query_lower for pattern in patterns):
-            handler = ACTION_HANDLERS.get(action_name)
-            if handler:
-                try:
-                    result = handler(query, role)
-                    # Add execution metadata
-                    result["execution_time"] = datetime.now().strftime("%H:%M:%S")
-                    result["executed_by"] = role
-                    return result
-                except Exception as e:
-                    return {
-                        "text": f"⚠️ Error executing {action_name}: {str(e)}",
-                        "actions": [f"Error in {action_name}"],
-                        "error": True
-                    }
-    
-    return None
\ No newline at end of file
+    features = features or analyze_query(query)
+    
+    # First matching action the role may run (precomputed role -> frozenset of action names)
+    action_name = resolve_action(role, features)
+    if action_name is None:
+        return None
+    
+    # Parameters are extracted once and shared by whichever handler runs
+    params = extract_parameters(query)
+    
+    try:
+        result = ACTION_HANDLERS[action_name](query, role, params)
+        # Add execution metadata
+        result["execution_time"] = datetime.now().strftime("%H:%M:%S")
+        result["executed_by"] = role
+        return result
+    except Exception as e:
+        return {
+            "text": f"⚠️ Error executing {action_name}: {str(e)}",
+            "actions": [f"Error in {action_name}"],
+            "error": True
+        }
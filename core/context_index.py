@@ -0,0 +1,209 @@
+"""Per-user index over conversation history for relevant-context retrieval.
+
+``get_relevant_context`` used to look at the last 15 turns only, intersect
+word and entity sets per turn and re-parse every timestamp on each query.
+A ``ContextIndex`` keeps, for every retained turn:
+
+- its query's L2-normalised term frequencies, in exact ``term -> {slot: weight}`` postings,
+- its entities, in exact ``type:value -> {slots}`` postings,
+- its intent as an integer code and its epoch timestamp, in arrays.
+
+Scoring a new query only touches the postings of its own terms and entities,
+plus two array operations over all rows: the intent match and a linear
+recency bonus for turns from the last day.  Entity overlap is checked
+against the stored values, so two different values never count as a match,
+and the lexical term is a TF-IDF cosine (IDF from the user's own history,
+applied on the query side).  The weights are the ones the set-based scorer
+used.
+
+Rows live in ring slots sized to the history retention, so the index never
+holds more turns than the history cache does.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+INITIAL_CAPACITY = 32
+
+INTENT_WEIGHT = 0.4
+ENTITY_WEIGHT = 0.3
+LEXICAL_WEIGHT = 0.2
+RECENCY_WEIGHT = 0.1
+RECENCY_WINDOW_SECONDS = 24 * 3600
+MIN_RELEVANCE = 0.2
+
+
+def _term_weights(text: str) -> Dict[str, float]:
+    """L2-normalised term frequencies of a query."""
+    counts = Counter(text.lower().split())
+    norm = sum(c * c for c in counts.values()) ** 0.5
+    return {term: c / norm for term, c in counts.items()}
+
+
+def _entity_keys(entities: Dict[str, Iterable[Any]]) -> Dict[str, List[str]]:
+    return {
+        entity_type: sorted({f"{entity_type}:{str(v).lower()}" for v in values})
+        for entity_type, values in (entities or {}).items()
+    }
+
+
+def entry_epoch(entry: Dict[str, Any]) -> Optional[float]:
+    """Epoch seconds of a history entry; only entries saved before ``ts`` existed are parsed."""
+    ts = entry.get("ts")
+    if ts is not None:
+        return float(ts)
+    timestamp = entry.get("timestamp")
+    if not timestamp:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        try:
+            # old entries saved as str(datetime.now())
+            return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f").timestamp()
+        except (TypeError, ValueError):
+            return None
+
+
+class ContextIndex:
+    """Ring of per-turn rows with exact term and entity postings and vectorized scoring."""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._entries: List[Optional[Dict[str, Any]]] = []
+        self._slot_terms: List[Dict[str, float]] = []
+        self._slot_entities: List[List[str]] = []
+        self._size = 0
+        self._next = 0  # ring slot of the next row; rows are in insertion order from here
+        self._intent_codes: Dict[str, int] = {}
+        self._term_postings: Dict[str, Dict[int, float]] = {}
+        self._entity_postings: Dict[str, Dict[int, None]] = {}
+        self._allocate(min(self.capacity, INITIAL_CAPACITY))
+
+    def _allocate(self, rows: int) -> None:
+        intents = np.full(rows, -1, dtype=np.int32)
+        epochs = np.full(rows, -np.inf, dtype=np.float64)
+        if self._size:
+            # Only grown before the ring wraps, so slots 0.._size-1 are in use
+            intents[:self._size] = self._intents[:self._size]
+            epochs[:self._size] = self._epochs[:self._size]
+        self._intents, self._epochs = intents, epochs
+        grow = rows - len(self._entries)
+        self._entries.extend([None] * grow)
+        self._slot_terms.extend({} for _ in range(grow))
+        self._slot_entities.extend([] for _ in range(grow))
+
+    # --- Updates ---
+
+    def _evict(self, slot: int) -> None:
+        for term in self._slot_terms[slot]:
+            docs = self._term_postings[term]
+            del docs[slot]
+            if not docs:
+                del self._term_postings[term]
+        for key in self._slot_entities[slot]:
+            slots = self._entity_postings[key]
+            del slots[slot]
+            if not slots:
+                del self._entity_postings[key]
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        """Index one conversation entry, replacing the oldest once at capacity."""
+        terms = _term_weights(entry.get("query", ""))
+        entity_keys = sorted({key for keys in _entity_keys(entry.get("entities")).values() for key in keys})
+        intent = entry.get("intent", "general")
+        epoch = entry_epoch(entry)
+
+        with self._lock:
+            if self._size == len(self._intents) and self._size < self.capacity:
+                self._allocate(min(self.capacity, 2 * len(self._intents)))
+            slot = self._next
+            if self._size == self.capacity:
+                self._evict(slot)
+            else:
+                self._size += 1
+
+            for term, weight in terms.items():
+                self._term_postings.setdefault(term, {})[slot] = weight
+            for key in entity_keys:
+                self._entity_postings.setdefault(key, {})[slot] = None
+            self._slot_terms[slot] = terms
+            self._slot_entities[slot] = entity_keys
+
+            self._intents[slot] = self._intent_codes.setdefault(intent, len(self._intent_codes))
+            self._epochs[slot] = -np.inf if epoch is None else epoch
+            self._entries[slot] = entry
+            self._next = (slot + 1) % self.capacity
+
+    @classmethod
+    def rebuild(cls, entries: Iterable[Dict[str, Any]], capacity: int) -> "ContextIndex":
+        index = cls(capacity)
+        for entry in entries:
+            index.add(entry)
+        return index
+
+    def __len__(self) -> int:
+        return self._size
+
+    # --- Reads ---
+
+    def top_k(self, query: str, intent: str, entities: Dict[str, Iterable[Any]], k: int = 3,
+              now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """The ``k`` most relevant past turns for a query, best first.
+
+        Turns scoring at or below MIN_RELEVANCE are left out; equal scores keep
+        history order (oldest first).
+        """
+        terms = Counter(query.lower().split())
+        entity_keys = _entity_keys(entities)
+        now = time.time() if now is None else now
+
+        with self._lock:
+            n = self._size
+            if not n or k <= 0:
+                return []
+            # Scored in slot order; history order only matters for the few candidates
+            scores = np.zeros(n, dtype=np.float32)
+
+            code = self._intent_codes.get(intent)
+            if code is not None:
+                np.add(scores, INTENT_WEIGHT, out=scores, where=self._intents[:n] == code)
+
+            # +ENTITY_WEIGHT per entity type sharing at least one exact value with the query
+            for keys in entity_keys.values():
+                slots = {slot for key in keys for slot in self._entity_postings.get(key, ())}
+                if slots:
+                    scores[np.fromiter(slots, dtype=np.intp, count=len(slots))] += ENTITY_WEIGHT
+
+            if terms:
+                postings = [self._term_postings.get(term) for term in terms]
+                weights = np.array([
+                    count * (np.log((1.0 + n) / (1.0 + (len(docs) if docs else 0))) + 1.0)
+                    for count, docs in zip(terms.values(), postings)
+                ], dtype=np.float32)
+                weights *= LEXICAL_WEIGHT / np.linalg.norm(weights)
+                for weight, docs in zip(weights, postings):
+                    if docs:
+                        slots = np.fromiter(docs.keys(), dtype=np.intp, count=len(docs))
+                        scores[slots] += weight * np.fromiter(docs.values(), dtype=np.float32, count=len(docs))
+
+            # Turns older than a day (or without a timestamp, stored as -inf) clip to a zero bonus
+            recency = np.subtract(now, self._epochs[:n])
+            recency *= -RECENCY_WEIGHT / RECENCY_WINDOW_SECONDS
+            recency += RECENCY_WEIGHT
+            np.maximum(recency, 0.0, out=recency)
+            scores += recency
+
+            candidates = np.flatnonzero(scores > MIN_RELEVANCE)
+            if len(candidates) > k:
+                # Keep every candidate tied with the k-th best so ties can be broken by age
+                kth = np.partition(scores[candidates], len(candidates) - k)[len(candidates) - k]
+                candidates = candidates[scores[candidates] >= kth]
+            age_rank = (candidates - self._next) % self.capacity if n == self.capacity else candidates
+            best = candidates[np.lexsort((age_rank, -scores[candidates]))][:k]
+            return [self._entries[slot] for slot in best]
@@ -0,0 +1,138 @@
+"""Running per-user context summary over the last few conversation turns.
+
+``get_context_summary`` used to re-read the last 20 turns and rebuild the
+intent counts, entity union and satisfaction mean on every query.  A
+``ContextSummary`` keeps those aggregates up to date as turns are added:
+each new turn is folded in and the turn falling out of the window is
+subtracted, so a read is just returning the cached result.
+
+The only state that has to be stored is the window of per-turn
+contributions; the counters are re-derived from it, and the whole summary
+can always be rebuilt from the conversation history itself.
+"""
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Optional
+
+SUMMARY_WINDOW = 20
+RECENT_TOPICS = 3
+STATE_VERSION = 1
+
+
+def _topic(query: str) -> str:
+    return query[:50] + "..." if len(query) > 50 else query
+
+
+class ContextSummary:
+    """Intent counts, entity frequencies, satisfaction mean and recent topics for one user."""
+
+    def __init__(self, window: int = SUMMARY_WINDOW):
+        self.window = window
+        # (intent, entities, satisfaction, topic, timestamp) per turn, oldest first
+        self._turns: deque = deque()
+        self._intents: Counter = Counter()
+        self._entities: Dict[str, Counter] = {}
+        self._satisfaction = 0.0
+        self._result: Optional[Dict[str, Any]] = None
+
+    # --- Updates ---
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        """Fold one conversation entry into the summary."""
+        self._fold((
+            entry.get("intent", "general"),
+            {k: list(dict.fromkeys(v)) for k, v in (entry.get("entities") or {}).items()},
+            entry.get("satisfaction_score", 0.5),
+            _topic(entry.get("query", "")),
+            entry.get("timestamp"),
+        ))
+
+    def _fold(self, turn) -> None:
+        if len(self._turns) == self.window:
+            self._remove(self._turns.popleft())
+        self._turns.append(turn)
+
+        intent, entities, satisfaction, _, _ = turn
+        self._intents[intent] += 1
+        for entity_type, values in entities.items():
+            self._entities.setdefault(entity_type, Counter()).update(values)
+        self._satisfaction += satisfaction
+        self._result = None
+
+    def _remove(self, turn) -> None:
+        intent, entities, satisfaction, _, _ = turn
+        self._intents[intent] -= 1
+        if self._intents[intent] <= 0:
+            del self._intents[intent]
+        for entity_type, values in entities.items():
+            counts = self._entities[entity_type]
+            counts.subtract(values)
+            for value in values:
+                if counts[value] <= 0:
+                    del counts[value]
+        self._satisfaction -= satisfaction
+
+    @classmethod
+    def rebuild(cls, entries: Iterable[Dict[str, Any]], window: int = SUMMARY_WINDOW) -> "ContextSummary":
+        summary = cls(window)
+        for entry in list(entries)[-window:]:
+            summary.add(entry)
+        return summary
+
+    # --- Reads ---
+
+    @property
+    def last_timestamp(self) -> Optional[str]:
+        return self._turns[-1][4] if self._turns else None
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def _most_common_intent(self) -> str:
+        if not self._intents:
+            return "general"
+        top = max(self._intents.values())
+        # Ties go to the intent seen first in the window
+        for intent, *_ in self._turns:
+            if self._intents[intent] == top:
+                return intent
+        return "general"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The dict returned by context_manager.get_context_summary."""
+        if not self._turns:
+            return {"summary": "No conversation history available"}
+        if self._result is None:
+            turns = len(self._turns)
+            self._result = {
+                "total_conversations": turns,
+                "most_common_intent": self._most_common_intent(),
+                "entities_mentioned": {k: list(v) for k, v in self._entities.items() if v},
+                "entity_frequency": {k: dict(v.most_common()) for k, v in self._entities.items() if v},
+                "average_satisfaction": round(self._satisfaction / turns, 2),
+                "recent_topics": [t[3] for t in list(self._turns)[-RECENT_TOPICS:]],
+                "intent_distribution": dict(self._intents),
+            }
+        return dict(self._result)
+
+    # --- Persistence ---
+
+    def state(self) -> Dict[str, Any]:
+        return {"version": STATE_VERSION, "window": self.window, "turns": [list(t) for t in self._turns]}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> Optional["ContextSummary"]:
+        """Restore a saved summary; None if the state is from an incompatible version."""
+        if not state or state.get("version") != STATE_VERSION:
+            return None
+        summary = cls(state.get("window", SUMMARY_WINDOW))
+        for turn in state.get("turns", []):
+            summary._fold(tuple(turn))
+        return summary
+
+
+def summary_matches(summary: Optional[ContextSummary], entries: List[Dict[str, Any]]) -> bool:
+    """True if a saved summary covers exactly the tail of ``entries``."""
+    if summary is None:
+        return False
+    expected = min(len(entries), summary.window)
+    return len(summary) == expected and summary.last_timestamp == (entries[-1].get("timestamp") if entries else None)
@@ -0,0 +1,484 @@
+"""Pluggable storage backends for per-user conversation history.
+
+History used to live in one JSON document that was loaded, trimmed and
+rewritten on every turn.  The backends here are append-only: saving a turn
+costs O(1) and reading a user's last k turns costs O(k), independent of how
+many other users share the store.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+# Legacy single-file history, imported once into an empty store
+LEGACY_HISTORY_PATH = os.path.join("data", "conversation_history.json")
+
+# Segmented log backend
+CONVERSATION_DIR = os.path.join("data", "conversations")
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+# On segment rollover, compact once entries past retention outnumber retained ones by this factor
+COMPACT_DEAD_RATIO = 1.0
+
+# SQLite backend
+CONVERSATION_DB_PATH = os.path.join("data", "conversations.db")
+
+# Number of turns kept per user (the old whole-file rewrite trimmed to 30)
+HISTORY_RETENTION = int(os.environ.get("FINKRAFT_HISTORY_RETENTION", "30"))
+
+
+def _load_legacy_history() -> Dict[str, List[Dict[str, Any]]]:
+    try:
+        with open(LEGACY_HISTORY_PATH, "r") as f:
+            history = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return history if isinstance(history, dict) else {}
+
+
+class ConversationStore:
+    """Interface shared by all conversation history backends."""
+
+    retention = HISTORY_RETENTION
+
+    def append(self, user_id: str, entry: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def tail(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the user's last ``limit`` entries (all retained ones if None), oldest first."""
+        raise NotImplementedError
+
+    def user_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    def count(self, user_id: str) -> int:
+        return len(self.tail(user_id))
+
+    def compact(self, transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> None:
+        """Reclaim space held by entries that fell out of retention.
+
+        With ``transform``, every retained entry is rewritten through it and
+        saved summaries (derived from the old entries) are discarded.
+        """
+        if transform is not None:
+            raise NotImplementedError
+
+    def save_summaries(self, summaries: Dict[str, Dict[str, Any]]) -> None:
+        """Persist derived per-user summary state next to the history.
+
+        Summaries can always be rebuilt from the history, so backends that do
+        not store them simply lose nothing but a little rebuild time.
+        """
+
+    def load_summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def close(self) -> None:
+        pass
+
+    def _import_legacy(self) -> None:
+        for user_id, entries in _load_legacy_history().items():
+            for entry in entries[-self.retention:]:
+                self.append(user_id, entry)
+
+
+class SegmentedLogStore(ConversationStore):
+    """Append-only JSON Lines segments with a per-user offset index.
+
+    Every entry is written as one line to the active ``segment-NNNNNN.jsonl``
+    file and its ``[user_id, offset, length]`` is appended to the matching
+    ``.idx`` file.  On open only the small index files are read; entries are
+    fetched with one seek per turn.  Segments roll over at SEGMENT_MAX_BYTES
+    and ``compact()`` rewrites the retained entries into a fresh segment.
+    Compaction also runs on rollover once the entries that fell out of
+    retention outnumber the retained ones (COMPACT_DEAD_RATIO), so disk use
+    and the index replayed on open follow retained history, not everything
+    ever written.
+
+    Appends hold an exclusive ``flock`` so several processes (e.g. Streamlit
+    workers) can share the directory; each reader catches up with index lines
+    written by other processes before serving a read.
+    """
+
+    def __init__(self, directory: str = CONVERSATION_DIR, retention: int = HISTORY_RETENTION,
+                 segment_max_bytes: int = SEGMENT_MAX_BYTES, compact_dead_ratio: float = COMPACT_DEAD_RATIO):
+        self.directory = directory
+        self.retention = retention
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_dead_ratio = compact_dead_ratio
+        self._lock = threading.RLock()
+        self._index: Dict[str, deque] = {}
+        self._idx_positions: Dict[int, int] = {}
+        self._indexed_entries = 0  # index lines read, retained or not
+        self._active_segment = 0
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._summary_position = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        fresh = not self._segment_numbers()
+        self._refresh()
+        if fresh:
+            self._import_legacy()
+
+    # --- Paths ---
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:06d}.jsonl")
+
+    def _idx_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:06d}.idx")
+
+    @property
+    def _summary_path(self) -> str:
+        return os.path.join(self.directory, "summaries.jsonl")
+
+    def _segment_numbers(self) -> List[int]:
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".idx"):
+                try:
+                    numbers.append(int(name[len("segment-"):-len(".idx")]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize writers across threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.directory, "store.lock"), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- Index maintenance ---
+
+    def _refresh(self) -> None:
+        """Read index lines appended since the last call (by any process)."""
+        with self._lock:
+            numbers = self._segment_numbers()
+            # Segments we indexed earlier may have been removed by compaction
+            if any(n not in numbers for n in self._idx_positions):
+                self._index.clear()
+                self._idx_positions.clear()
+                self._indexed_entries = 0
+
+            for number in numbers:
+                position = self._idx_positions.get(number, 0)
+                path = self._idx_path(number)
+                try:
+                    if os.path.getsize(path) <= position:
+                        continue
+                    with open(path, "rb") as f:
+                        f.seek(position)
+                        for line in f:
+                            if not line.endswith(b"\n"):
+                                break  # partially written line; pick it up next time
+                            position += len(line)
+                            user_id, offset, length = json.loads(line)
+                            self._remember(user_id, number, offset, length)
+                            self._indexed_entries += 1
+                except FileNotFoundError:
+                    continue
+                self._idx_positions[number] = position
+
+            self._active_segment = numbers[-1] if numbers else 1
+
+    def _remember(self, user_id: str, segment: int, offset: int, length: int) -> None:
+        positions = self._index.get(user_id)
+        if positions is None:
+            positions = self._index[user_id] = deque(maxlen=self.retention)
+        positions.append((segment, offset, length))
+
+    # --- ConversationStore API ---
+
+    def append(self, user_id: str, entry: Dict[str, Any]) -> None:
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._exclusive():
+            self._refresh()
+            number = self._active_segment
+            data_path = self._segment_path(number)
+            if os.path.exists(data_path) and os.path.getsize(data_path) + len(line) > self.segment_max_bytes:
+                if self._should_compact():
+                    self._compact_locked()
+                    number = self._active_segment
+                    data_path = self._segment_path(number)
+                if os.path.exists(data_path) and os.path.getsize(data_path) + len(line) > self.segment_max_bytes:
+                    number += 1
+                    data_path = self._segment_path(number)
+
+            with open(data_path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(line)
+            with open(self._idx_path(number), "a", encoding="utf-8") as f:
+                f.write(json.dumps([user_id, offset, len(line)]) + "\n")
+
+            # Pick up our own index line (and any written by other processes)
+            self._refresh()
+
+    def _should_compact(self) -> bool:
+        live = sum(len(positions) for positions in self._index.values())
+        return self._indexed_entries - live > self.compact_dead_ratio * live
+
+    def tail(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            positions = list(self._index.get(user_id, ()))
+        if limit is not None:
+            positions = positions[-limit:] if limit > 0 else []
+        return list(self._read(positions))
+
+    def _read(self, positions: Iterable) -> Iterable[Dict[str, Any]]:
+        handles = {}
+        try:
+            for segment, offset, length in positions:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._segment_path(segment), "rb")
+                f.seek(offset)
+                yield json.loads(f.read(length))
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def user_ids(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return list(self._index)
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._index.get(user_id, ()))
+
+    def _refresh_summaries(self) -> None:
+        """Apply summary lines appended since the last call; the last line per user wins."""
+        with self._lock:
+            try:
+                if os.path.getsize(self._summary_path) < self._summary_position:
+                    # Rewritten by compaction in another process
+                    self._summaries.clear()
+                    self._summary_position = 0
+                if os.path.getsize(self._summary_path) == self._summary_position:
+                    return
+                with open(self._summary_path, "rb") as f:
+                    f.seek(self._summary_position)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        self._summary_position += len(line)
+                        user_id, state = json.loads(line)
+                        self._summaries[user_id] = state
+            except FileNotFoundError:
+                return
+
+    def save_summaries(self, summaries: Dict[str, Dict[str, Any]]) -> None:
+        if not summaries:
+            return
+        data = b"".join(
+            (json.dumps([user_id, state], ensure_ascii=False) + "\n").encode("utf-8")
+            for user_id, state in summaries.items()
+        )
+        with self._exclusive():
+            with open(self._summary_path, "ab") as f:
+                f.write(data)
+            self._refresh_summaries()
+
+    def load_summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        self._refresh_summaries()
+        return self._summaries.get(user_id)
+
+    def compact(self, transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> None:
+        """Rewrite retained entries (through ``transform`` if given) into a new segment and drop the old ones."""
+        with self._exclusive():
+            self._compact_locked(transform)
+
+    def _compact_locked(self, transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> None:
+        # Caller holds _exclusive(); flock is not re-entrant across file descriptors
+        with self._lock:
+            self._refresh()
+            old_numbers = self._segment_numbers()
+            target = (old_numbers[-1] if old_numbers else 0) + 1
+            data_tmp = self._segment_path(target) + ".tmp"
+            idx_tmp = self._idx_path(target) + ".tmp"
+
+            with open(data_tmp, "wb") as data_f, open(idx_tmp, "w", encoding="utf-8") as idx_f:
+                for user_id, positions in self._index.items():
+                    for entry in self._read(list(positions)):
+                        if transform is not None:
+                            entry = transform(entry)
+                        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                        offset = data_f.tell()
+                        data_f.write(line)
+                        idx_f.write(json.dumps([user_id, offset, len(line)]) + "\n")
+
+            # Data file first so a visible index never points at a missing segment
+            os.replace(data_tmp, self._segment_path(target))
+            os.replace(idx_tmp, self._idx_path(target))
+            for number in old_numbers:
+                for path in (self._idx_path(number), self._segment_path(number)):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+            self._index.clear()
+            self._idx_positions.clear()
+            self._indexed_entries = 0
+            self._refresh()
+
+            # Keep only the latest summary of each user that still has history
+            self._refresh_summaries()
+            summary_tmp = self._summary_path + ".tmp"
+            with open(summary_tmp, "wb") as f:
+                for user_id, state in self._summaries.items():
+                    if user_id in self._index and transform is None:
+                        f.write((json.dumps([user_id, state], ensure_ascii=False) + "\n").encode("utf-8"))
+            os.replace(summary_tmp, self._summary_path)
+            self._summaries.clear()
+            self._summary_position = 0
+            self._refresh_summaries()
+
+
+class SQLiteStore(ConversationStore):
+    """SQLite backend in WAL mode; readers never block the single writer."""
+
+    def __init__(self, path: str = CONVERSATION_DB_PATH, retention: int = HISTORY_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id TEXT NOT NULL,"
+            " entry TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_id, id)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_summaries ("
+            " user_id TEXT PRIMARY KEY,"
+            " state TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+        if self._conn.execute("SELECT 1 FROM conversations LIMIT 1").fetchone() is None:
+            self._import_legacy()
+
+    def append(self, user_id: str, entry: Dict[str, Any]) -> None:
+        payload = json.dumps(entry, ensure_ascii=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO conversations (user_id, entry) VALUES (?, ?)", (user_id, payload)
+            )
+            # Trim this user's rows beyond retention (index range scan, not a table scan)
+            self._conn.execute(
+                "DELETE FROM conversations WHERE user_id = ? AND id <= ("
+                " SELECT id FROM conversations WHERE user_id = ?"
+                " ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (user_id, user_id, self.retention),
+            )
+
+    def tail(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        limit = self.retention if limit is None else min(limit, self.retention)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry FROM conversations WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def user_ids(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT user_id FROM conversations").fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, user_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM conversations WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return min(row[0], self.retention)
+
+    def save_summaries(self, summaries: Dict[str, Dict[str, Any]]) -> None:
+        rows = [(user_id, json.dumps(state, ensure_ascii=False)) for user_id, state in summaries.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversation_summaries (user_id, state) VALUES (?, ?)", rows
+            )
+
+    def load_summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM conversation_summaries WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def compact(self, transform: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None) -> None:
+        if transform is not None:
+            with self._lock, self._conn:
+                rows = self._conn.execute("SELECT id, entry FROM conversations").fetchall()
+                self._conn.executemany(
+                    "UPDATE conversations SET entry = ? WHERE id = ?",
+                    [(json.dumps(transform(json.loads(entry)), ensure_ascii=False), row_id)
+                     for row_id, entry in rows],
+                )
+                self._conn.execute("DELETE FROM conversation_summaries")
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# --- Backend selection ---
+
+STORE_BACKENDS = {
+    "log": SegmentedLogStore,
+    "sqlite": SQLiteStore,
+}
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ConversationStore:
+    """Return the process-wide store (backend chosen by FINKRAFT_CONVERSATION_STORE)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.environ.get("FINKRAFT_CONVERSATION_STORE", "log").lower()
+                if backend not in STORE_BACKENDS:
+                    raise ValueError(f"Unknown conversation store backend: {backend}")
+                _store = STORE_BACKENDS[backend]()
+    return _store
+
+
+def set_store(store: Optional[ConversationStore]) -> None:
+    """Install a specific store instance (None resets to the configured default)."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,269 @@
+"""Prebuilt retrieval index over notification emails.
+
+Emails are tokenized once into sparse term matrices (binary presence and
+L2-normalised TF-IDF) plus postings for invoice/ticket IDs and periods.  A
+query is scored against every email in a single sparse matrix-vector pass
+with the weights of the old per-email loop: +1 per query term present, +3
+per matching entity, +2 for a category hit and +2 for an intent-specific
+keyword.  Emails scoring above the threshold are ordered by that score, then
+by TF-IDF cosine similarity.  New emails are appended incrementally; the
+matrices are rebuilt lazily on the next query.
+
+Matching is by whole tokens, not by substring as in the old loop, so some
+queries pick a different email than before:
+
+* a query term counts only if the email contains it as a token (plurals
+  folded), so "gst" no longer matches "gstr-2a" and words such as "a" or
+  "in" no longer match inside longer words
+* invoice/ticket IDs and periods match through exact postings; other
+  entities match when all of their tokens occur in the email
+* a category hit needs a query token equal to a word of the category
+* ties go to the higher cosine similarity rather than to the email listed
+  first in the file
+"""
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+EMAIL_PATH = os.path.join("data", "sample_emails.json")
+RELOAD_CHECK_SECONDS = 1.0
+
+# IDs and GSTR names stay single tokens ("inv-001", "gstr-2a")
+_TOKEN_RE = re.compile(r"[a-z0-9₹]+(?:[-_][a-z0-9]+)*")
+_ID_RE = re.compile(r"\b(?:INV|TCK)[-_]\d+\b", re.IGNORECASE)
+_PERIOD_RE = re.compile(r"\b(?:last|this|next)\s+(?:month|quarter|year)\b|Q[1-4]\s*20\d{2}", re.IGNORECASE)
+
+FAILURE_WORDS = ("failed", "error", "issue")
+STATUS_WORDS = ("status", "update", "completed")
+
+# Entity types resolved through exact postings; the rest match on their tokens
+POSTING_ENTITY_TYPES = ("invoice_ids", "ticket_ids", "periods")
+
+
+def _normalize_term(token: str) -> str:
+    # Light plural folding so "invoice" still finds "invoices"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_normalize_term(t) for t in _TOKEN_RE.findall(text.lower())]
+
+
+def _normalize_entity(value: str) -> str:
+    return " ".join(str(value).lower().replace("_", "-").split())
+
+
+class EmailIndex:
+    """Sparse term index with entity postings, built incrementally."""
+
+    def __init__(self, emails: Iterable[Dict[str, Any]] = ()):
+        self.emails: List[Dict[str, Any]] = []
+        self._ids = set()
+        self._vocab: Dict[str, int] = {}
+        self._category_vocab: Dict[str, int] = {}
+        self._entity_postings: Dict[str, List[int]] = {}
+
+        # CSR components, grown in place as emails arrive
+        self._indptr = array("q", [0])
+        self._indices = array("q")
+        self._counts = array("f")
+        self._cat_indptr = array("q", [0])
+        self._cat_indices = array("q")
+        self._failure_flags = array("b")
+        self._status_flags = array("b")
+
+        self._lock = threading.Lock()
+        self._dirty = True
+        self._binary = None
+        self._tfidf = None
+        self._category = None
+        self.add(emails)
+
+    def add(self, emails: Iterable[Dict[str, Any]]) -> int:
+        """Index emails not seen before (by id); returns how many were added."""
+        added = 0
+        with self._lock:
+            for email in emails:
+                key = email.get("id") or (email.get("subject", ""), email.get("date", ""))
+                if key in self._ids:
+                    continue
+                self._ids.add(key)
+                self._add_one(email)
+                added += 1
+            if added:
+                self._dirty = True
+        return added
+
+    def _add_one(self, email: Dict[str, Any]) -> None:
+        row = len(self.emails)
+        self.emails.append(email)
+        text = email.get("subject", "") + " " + email.get("body", "")
+        text_lower = text.lower()
+
+        counts: Dict[int, int] = {}
+        for term in tokenize(text):
+            col = self._vocab.setdefault(term, len(self._vocab))
+            counts[col] = counts.get(col, 0) + 1
+        self._indices.extend(counts.keys())
+        self._counts.extend(counts.values())
+        self._indptr.append(len(self._indices))
+
+        category_cols = set()
+        for part in re.split(r"[_\s]+", email.get("category", "").lower()):
+            if part:
+                category_cols.add(self._category_vocab.setdefault(_normalize_term(part), len(self._category_vocab)))
+        self._cat_indices.extend(category_cols)
+        self._cat_indptr.append(len(self._cat_indices))
+
+        for value in _ID_RE.findall(text) + _PERIOD_RE.findall(text):
+            postings = self._entity_postings.setdefault(_normalize_entity(value), [])
+            if not postings or postings[-1] != row:
+                postings.append(row)
+
+        self._failure_flags.append(any(w in text_lower for w in FAILURE_WORDS))
+        self._status_flags.append(any(w in text_lower for w in STATUS_WORDS))
+
+    def _build(self) -> None:
+        n_rows, n_terms = len(self.emails), len(self._vocab)
+        counts = sparse.csr_matrix(
+            (np.frombuffer(self._counts, dtype=np.float32),
+             np.frombuffer(self._indices, dtype=np.int64),
+             np.frombuffer(self._indptr, dtype=np.int64)),
+            shape=(n_rows, n_terms),
+        )
+        binary = counts.copy()
+        binary.data[:] = 1.0
+
+        df = np.asarray(binary.sum(axis=0)).ravel()
+        idf = (np.log((1 + n_rows) / (1 + df)) + 1).astype(np.float32)
+        tfidf = counts.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        tfidf = sparse.diags(1.0 / norms).dot(tfidf).tocsr()
+
+        category = sparse.csr_matrix(
+            (np.ones(len(self._cat_indices), dtype=np.float32),
+             np.frombuffer(self._cat_indices, dtype=np.int64),
+             np.frombuffer(self._cat_indptr, dtype=np.int64)),
+            shape=(n_rows, len(self._category_vocab)),
+        )
+
+        self._binary, self._tfidf, self._category, self._idf = binary, tfidf, category, idf
+        self._failure = np.frombuffer(self._failure_flags, dtype=np.int8).astype(np.float32)
+        self._status = np.frombuffer(self._status_flags, dtype=np.int8).astype(np.float32)
+        self._dirty = False
+
+    def scores(self, query: str, entities: Dict[str, List[str]], intent: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(weighted match score, TF-IDF cosine) of every email for ``query``, in one vectorized pass."""
+        with self._lock:
+            if not self.emails:
+                empty = np.zeros(0, dtype=np.float32)
+                return empty, empty
+            if self._dirty:
+                self._build()
+            binary, tfidf, category, idf = self._binary, self._tfidf, self._category, self._idf
+            n_rows = len(self.emails)
+
+            terms = tokenize(query)
+            term_counts = np.zeros(binary.shape[1], dtype=np.float32)
+            category_hits = np.zeros(category.shape[1], dtype=np.float32)
+            for term in terms:
+                col = self._vocab.get(term)
+                if col is not None:
+                    term_counts[col] += 1
+                cat_col = self._category_vocab.get(term)
+                if cat_col is not None:
+                    category_hits[cat_col] = 1
+
+            # +1 for every query term occurrence found in the email
+            score = binary.dot(term_counts)
+
+            # +3 per matching entity value
+            entity_hits = np.zeros(n_rows, dtype=np.float32)
+            for entity_type, values in entities.items():
+                for value in values:
+                    if entity_type in POSTING_ENTITY_TYPES:
+                        rows = self._entity_postings.get(_normalize_entity(value))
+                        if rows:
+                            entity_hits[rows] += 1
+                        continue
+                    cols = [self._vocab.get(t) for t in tokenize(str(value))]
+                    if cols and None not in cols:
+                        present = np.asarray(binary[:, cols].sum(axis=1)).ravel()
+                        entity_hits += present == len(cols)
+            score += 3 * entity_hits
+
+            # +2 if any query term names the email's category
+            if category_hits.any():
+                score += 2 * (category.dot(category_hits) > 0)
+
+            if intent == "explanation":
+                score += 2 * self._failure
+            elif intent == "status_inquiry":
+                score += 2 * self._status
+
+            # TF-IDF cosine in [0, 1]; kept apart so it never lifts an email over the threshold
+            query_vector = term_counts * idf
+            norm = np.linalg.norm(query_vector)
+            similarity = tfidf.dot(query_vector / norm) if norm else np.zeros(n_rows, dtype=np.float32)
+            return score, similarity
+
+    def search(self, query: str, entities: Dict[str, List[str]], intent: str,
+               k: int = 1, min_score: float = 1.0) -> List[Dict[str, Any]]:
+        """Return up to ``k`` emails whose weighted score exceeds ``min_score``, best first.
+
+        The threshold applies to the weighted score alone; the cosine only
+        orders emails with equal weighted scores.
+        """
+        score, similarity = self.scores(query, entities, intent)
+        candidates = np.flatnonzero(score > min_score)
+        if not len(candidates):
+            return []
+        # lexsort sorts by the last key first: weighted score, then cosine, then position
+        order = np.lexsort((candidates, -similarity[candidates], -score[candidates]))
+        return [self.emails[i] for i in candidates[order[:k]]]
+
+
+_index: Optional[EmailIndex] = None
+_index_mtime: Optional[float] = None
+_last_check = 0.0
+_index_lock = threading.Lock()
+
+
+def get_email_index(path: str = EMAIL_PATH) -> Optional[EmailIndex]:
+    """Return the shared index, folding in emails appended to the file since the last load."""
+    global _index, _index_mtime, _last_check
+    now = time.monotonic()
+    if _index is not None and now - _last_check < RELOAD_CHECK_SECONDS:
+        return _index
+
+    with _index_lock:
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return _index
+        if _index is not None and mtime == _index_mtime:
+            return _index
+        try:
+            with open(path, "r") as f:
+                emails = json.load(f)
+        except (OSError, ValueError):
+            return _index
+
+        # Appends are indexed incrementally; edits or deletions force a rebuild
+        if _index is not None and emails[:len(_index.emails)] == _index.emails:
+            _index.add(emails[len(_index.emails):])
+        else:
+            _index = EmailIndex(emails)
+        _index_mtime = mtime
+    return _index
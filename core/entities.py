@@ -0,0 +1,137 @@
+"""Business entity extraction shared by saving, context retrieval and email lookup.
+
+``extract_entities`` used to import ``re`` and compile its patterns on every
+call, and ran three times per user message (saving the turn, scoring past
+turns and matching emails).  Patterns are now compiled once at import, the
+result is an immutable ``ExtractedEntities`` memoized per text, and the
+router extracts once and hands the same object to every consumer.
+
+Each saved turn records the ``ENTITY_VERSION`` it was extracted with.  When
+the patterns change, bump the version and run ``reextract_history`` to
+bring stored history up to date; extraction is spread over worker processes.
+"""
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Bump whenever a pattern below changes, so reextract_history knows what is stale
+ENTITY_VERSION = 1
+
+INVOICE_ID_RE = re.compile(r'\bINV[-_]\d+\b', re.IGNORECASE)
+TICKET_ID_RE = re.compile(r'\bTCK[-_]\d+\b', re.IGNORECASE)
+AMOUNT_RE = re.compile(r'₹[\d,]+|\d+\s*rupees?', re.IGNORECASE)
+PERIOD_RE = re.compile(r'\b(?:last|this|next)\s+(?:month|quarter|year)\b|Q[1-4]\s*20\d{2}', re.IGNORECASE)
+# Vendors (simple detection); the first pattern with a match wins
+VENDOR_RES = (
+    re.compile(r'vendor\s+([A-Za-z\s]+)', re.IGNORECASE),
+    re.compile(r'from\s+([A-Za-z\s]+?)(?:\s|,|$)', re.IGNORECASE),
+)
+
+EXTRACTION_CACHE_SIZE = 4096
+REEXTRACT_CHUNK_SIZE = 512
+
+
+@dataclass(frozen=True)
+class ExtractedEntities:
+    """Entities found in one text; each field is a tuple of matches in text order."""
+
+    invoice_ids: Tuple[str, ...] = ()
+    ticket_ids: Tuple[str, ...] = ()
+    amounts: Tuple[str, ...] = ()
+    periods: Tuple[str, ...] = ()
+    vendors: Tuple[str, ...] = ()
+
+    def as_dict(self) -> Dict[str, List[str]]:
+        """The stored form: entity type -> list of values, empty types left out."""
+        return {f.name: list(getattr(self, f.name)) for f in fields(self) if getattr(self, f.name)}
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) for f in fields(self))
+
+
+@lru_cache(maxsize=EXTRACTION_CACHE_SIZE)
+def extract_entities(text: str) -> ExtractedEntities:
+    """Extract business entities from text (memoized; the result is immutable)"""
+    vendors: Tuple[str, ...] = ()
+    for pattern in VENDOR_RES:
+        found = pattern.findall(text)
+        if found:
+            vendors = tuple(v.strip() for v in found)
+            break
+
+    return ExtractedEntities(
+        invoice_ids=tuple(INVOICE_ID_RE.findall(text)),
+        ticket_ids=tuple(TICKET_ID_RE.findall(text)),
+        amounts=tuple(AMOUNT_RE.findall(text)),
+        periods=tuple(PERIOD_RE.findall(text)),
+        vendors=vendors,
+    )
+
+
+def as_entity_dict(entities: Any) -> Dict[str, List[str]]:
+    """Accept an ``ExtractedEntities`` or an already-stored entity dict."""
+    if isinstance(entities, ExtractedEntities):
+        return entities.as_dict()
+    return entities or {}
+
+
+# --- Batch re-extraction ---
+
+def _extract_batch(texts: List[str]) -> List[Dict[str, List[str]]]:
+    return [extract_entities(text).as_dict() for text in texts]
+
+
+def _chunks(items: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def reextract_history(store=None, processes: Optional[int] = None,
+                      chunk_size: int = REEXTRACT_CHUNK_SIZE) -> int:
+    """Re-run extraction over every stored turn saved with an older ENTITY_VERSION.
+
+    Distinct query texts are extracted in worker processes, then the store
+    rewrites the stale entries in one pass.  Returns the number of entries
+    updated.  Cached histories are flushed before and dropped after, so the
+    running process sees the new entities too.
+    """
+    from core.history_cache import get_history_cache
+    from core.history_search import reset_history_search
+
+    cache = get_history_cache() if store is None else None
+    if cache is not None:
+        cache.flush()
+        store = cache.store
+
+    stale = {}
+    for user_id in store.user_ids():
+        for entry in store.tail(user_id):
+            if entry.get("entities_version") != ENTITY_VERSION:
+                stale[entry.get("query", "")] = None
+    if not stale:
+        return 0
+
+    texts = list(stale)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        extracted = [result for batch in pool.map(_extract_batch, _chunks(texts, chunk_size)) for result in batch]
+    by_text = dict(zip(texts, extracted))
+
+    updated = 0
+
+    def refresh(entry: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal updated
+        if entry.get("entities_version") == ENTITY_VERSION:
+            return entry
+        updated += 1
+        text = entry.get("query", "")
+        # Turns saved after the scan above were not sent to the workers
+        entities = by_text[text] if text in by_text else extract_entities(text).as_dict()
+        return dict(entry, entities=entities, entities_version=ENTITY_VERSION)
+
+    store.compact(transform=refresh)
+    if cache is not None:
+        cache.invalidate()
+        reset_history_search()
+    return updated
@@ -1,11 +1,135 @@
+"""FAQ matching over a BM25 inverted index built once and hot-reloaded.
+
+Questions and tags are tokenized into an inverted index when the FAQ file is
+first used; later lookups only touch the postings of the query's terms.  A
+query matches an FAQ when its BM25 score reaches MATCH_THRESHOLD of the
+score the FAQ's own question would get, so a query containing the whole
+question (the old substring rule) always matches.  The index is rebuilt
+when the file's mtime changes.
+"""
 import json
+import math
 import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+FAQ_PATH = os.path.join("data", "faqs.json")
+
+MATCH_THRESHOLD = 0.6
+RELOAD_CHECK_SECONDS = 1.0
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "can", "did", "do", "does", "for", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "the", "there", "to", "what", "when",
+    "where", "which", "who", "why", "with", "you", "your",
+})
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed (tags split on '_')."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class FAQEngine:
+    """Inverted index of FAQ questions and tags with BM25 scoring."""
+
+    def __init__(self, faqs: List[Dict]):
+        self.faqs = faqs
+        self.postings: Dict[str, tuple] = {}
+
+        doc_terms = []
+        question_terms = []
+        for faq in faqs:
+            terms = tokenize(faq.get("question", ""))
+            question_terms.append(set(terms))
+            for tag in faq.get("tags", []):
+                terms.extend(tokenize(tag))
+            doc_terms.append(Counter(terms))
+
+        n_docs = len(doc_terms)
+        avg_len = (sum(sum(c.values()) for c in doc_terms) / n_docs) if n_docs else 0.0
+
+        raw: Dict[str, tuple] = {}
+        for doc_id, counts in enumerate(doc_terms):
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(counts.values()) / avg_len) if avg_len else BM25_K1
+            for term, tf in counts.items():
+                ids, weights = raw.setdefault(term, ([], []))
+                ids.append(doc_id)
+                weights.append(tf * (BM25_K1 + 1) / (tf + length_norm))
+
+        # Query-side tf is ignored, so each posting carries its full BM25 term weight.
+        # The reference score only counts question terms; tag hits are a bonus.
+        self_scores = np.zeros(n_docs, dtype=np.float64)
+        for term, (ids, weights) in raw.items():
+            df = len(ids)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            ids_arr = np.asarray(ids, dtype=np.int32)
+            weights_arr = np.asarray(weights, dtype=np.float64) * idf
+            self.postings[term] = (ids_arr, weights_arr)
+            for doc_id, weight in zip(ids, weights_arr):
+                if term in question_terms[doc_id]:
+                    self_scores[doc_id] += weight
+
+        self.inverse_self_scores = np.zeros(n_docs, dtype=np.float64)
+        np.divide(1.0, self_scores, out=self.inverse_self_scores, where=self_scores > 0)
+
+    def best_match(self, query: str, threshold: float = MATCH_THRESHOLD) -> Optional[Dict]:
+        """Return the best-scoring FAQ entry, or None if nothing clears the threshold."""
+        terms = set(tokenize(query))
+        hits = [self.postings[t] for t in terms if t in self.postings]
+        if not hits:
+            return None
+
+        scores = np.zeros(len(self.faqs), dtype=np.float64)
+        for ids, weights in hits:
+            scores[ids] += weights
+
+        # Rank by how much of the FAQ's question the query covers
+        relative = scores * self.inverse_self_scores
+        best = int(np.argmax(relative))
+        if relative[best] < threshold:
+            return None
+        return self.faqs[best]
+
+
+_engine: Optional[FAQEngine] = None
+_engine_mtime: Optional[float] = None
+_last_check = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_faq_engine(path: str = FAQ_PATH) -> Optional[FAQEngine]:
+    """Return the compiled FAQ engine, rebuilding it if the file changed."""
+    global _engine, _engine_mtime, _last_check
+    now = time.monotonic()
+    if _engine is not None and now - _last_check < RELOAD_CHECK_SECONDS:
+        return _engine
+
+    with _engine_lock:
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return _engine
+        if _engine is None or mtime != _engine_mtime:
+            with open(path, "r") as f:
+                _engine = FAQEngine(json.load(f))
+            _engine_mtime = mtime
+    return _engine
+
 
 def match_faq(query):
-    path = os.path.join("data", "faqs.json")
-    with open(path, "r") as f:
-        faqs = json.load(f)
-    for faq in faqs:
-        if faq["question"].lower() in query:
-            return faq["answer"]
-    return None
+    engine = get_faq_engine()
+    if engine is None:
+        return None
+    faq = engine.best_match(query)
+    return faq["answer"] if faq else None
@@ -0,0 +1,253 @@
+"""In-process hot cache of per-user conversation history with write-behind.
+
+A single routed query reads the same user's history several times (context
+summary, relevant context, search) and then appends one turn.  The cache
+serves those reads from memory and batches appends to the conversation
+store, flushing every ``flush_interval`` seconds or once ``flush_threshold``
+entries are pending, whichever comes first.  ``flush()`` can be called
+explicitly and runs automatically at interpreter shutdown.
+
+Each cached user also carries a ``ContextIndex`` for relevant-context
+retrieval and a running ``ContextSummary``, both updated as turns are
+appended.  The summary's state is saved alongside the batch on flush, so a
+reload does not have to recompute it from the history.
+
+Entries written by other processes become visible here once the user's
+history is evicted and reloaded; writes from this process are visible to
+others after the next flush.
+"""
+import atexit
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+
+from core.context_index import ContextIndex
+from core.context_summary import ContextSummary, summary_matches
+from core.conversation_store import ConversationStore, get_store
+
+MAX_CACHED_USERS = 1024
+MAX_CACHE_BYTES = 32 * 1024 * 1024
+FLUSH_INTERVAL_SECONDS = 2.0
+FLUSH_THRESHOLD = 32
+
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    return len(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class _UserHistory:
+    __slots__ = ("entries", "sizes", "size", "index", "summary")
+
+    def __init__(self, retention: int):
+        self.entries = deque(maxlen=retention)
+        self.sizes = deque(maxlen=retention)
+        self.size = 0
+        self.index = ContextIndex(retention)
+        self.summary: Optional[ContextSummary] = None
+
+    def add(self, entry: Dict[str, Any], size: int) -> None:
+        if len(self.entries) == self.entries.maxlen:
+            self.size -= self.sizes[0]
+        self.entries.append(entry)
+        self.sizes.append(size)
+        self.size += size
+        self.index.add(entry)
+        if self.summary is not None:
+            self.summary.add(entry)
+
+
+class HistoryCache:
+    """Bounded LRU over user_ids, evicting by user count and approximate bytes."""
+
+    def __init__(self, store: Optional[ConversationStore] = None, max_users: int = MAX_CACHED_USERS,
+                 max_bytes: int = MAX_CACHE_BYTES, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 flush_threshold: int = FLUSH_THRESHOLD):
+        self._store = store
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._users: "OrderedDict[str, _UserHistory]" = OrderedDict()
+        self._bytes = 0
+        self._pending: List[tuple] = []
+        self._pending_users: Dict[str, int] = {}
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def store(self) -> ConversationStore:
+        return self._store if self._store is not None else get_store()
+
+    # --- Reads ---
+
+    def get(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the user's last ``limit`` turns (oldest first), loading on a miss."""
+        with self._lock:
+            return self._slice(self._load(user_id), limit)
+
+    def context_index(self, user_id: str) -> ContextIndex:
+        """The user's relevance index over every retained turn."""
+        with self._lock:
+            return self._load(user_id).index
+
+    def summary(self, user_id: str) -> ContextSummary:
+        """The user's running context summary over their most recent turns."""
+        with self._lock:
+            return self._load(user_id).summary
+
+    def _load(self, user_id: str) -> _UserHistory:
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is not None:
+                self._users.move_to_end(user_id)
+                return history
+
+        if self._pending_users.get(user_id):
+            # Our own unflushed turns must reach the store before a reload
+            self.flush()
+
+        store = self.store
+        loaded = store.tail(user_id)
+        saved = ContextSummary.from_state(store.load_summary(user_id))
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is None:
+                history = _UserHistory(store.retention)
+                for entry in loaded:
+                    history.add(entry, _entry_size(entry))
+                # Turns appended while we were loading are still only in the queue
+                for pending_user, entry in self._pending:
+                    if pending_user == user_id:
+                        history.add(entry, _entry_size(entry))
+                # A saved summary is only trusted if it ends at the same turn
+                entries = list(history.entries)
+                history.summary = saved if summary_matches(saved, entries) else ContextSummary.rebuild(entries)
+                self._users[user_id] = history
+                self._bytes += history.size
+                self._evict(keep=user_id)
+            self._users.move_to_end(user_id)
+            return history
+
+    @staticmethod
+    def _slice(history: _UserHistory, limit: Optional[int]) -> List[Dict[str, Any]]:
+        entries = list(history.entries)
+        if limit is None:
+            return entries
+        return entries[-limit:] if limit > 0 else []
+
+    # --- Writes ---
+
+    def append(self, user_id: str, entry: Dict[str, Any]) -> None:
+        """Record a turn in memory and queue it for the store."""
+        size = _entry_size(entry)
+        with self._lock:
+            history = self._users.get(user_id)
+            if history is not None:
+                before = history.size
+                history.add(entry, size)
+                self._bytes += history.size - before
+                self._users.move_to_end(user_id)
+                self._evict(keep=user_id)
+
+            self._pending.append((user_id, entry))
+            self._pending_users[user_id] = self._pending_users.get(user_id, 0) + 1
+            pending = len(self._pending)
+            self._ensure_flusher()
+
+        if pending >= self.flush_threshold:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all pending turns to the store, preserving their order."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            written = 0
+            try:
+                store = self.store
+                for user_id, entry in batch:
+                    store.append(user_id, entry)
+                    written += 1
+                # A saved summary that ends past the stored turns is simply rebuilt on reload
+                with self._lock:
+                    summaries = {
+                        user_id: self._users[user_id].summary.state()
+                        for user_id, _ in batch if user_id in self._users
+                    }
+                store.save_summaries(summaries)
+            finally:
+                with self._lock:
+                    # Requeue anything the store rejected ahead of newer turns
+                    self._pending[:0] = batch[written:]
+                    for user_id, _ in batch[:written]:
+                        remaining = self._pending_users.get(user_id, 0) - 1
+                        if remaining > 0:
+                            self._pending_users[user_id] = remaining
+                        else:
+                            self._pending_users.pop(user_id, None)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop cached history for one user (or everyone) so it reloads from the store."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+                self._bytes = 0
+            else:
+                history = self._users.pop(user_id, None)
+                if history is not None:
+                    self._bytes -= history.size
+
+    def close(self) -> None:
+        """Stop the background flusher and write out anything pending."""
+        self._closed = True
+        self._wakeup.set()
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"⚠️ Error flushing conversation history: {str(e)}")
+
+    # --- Internals ---
+
+    def _evict(self, keep: str) -> None:
+        while len(self._users) > 1 and (len(self._users) > self.max_users or self._bytes > self.max_bytes):
+            user_id = next(iter(self._users))
+            if user_id == keep:
+                self._users.move_to_end(user_id)
+                user_id = next(iter(self._users))
+            self._bytes -= self._users.pop(user_id).size
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None and not self._closed:
+            self._flusher = threading.Thread(target=self._flush_loop, name="history-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            if self._closed:
+                break
+            if self._pending:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"⚠️ Error flushing conversation history: {str(e)}")
+
+
+_cache: Optional[HistoryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_history_cache() -> HistoryCache:
+    """Return the process-wide history cache, registering its shutdown flush."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HistoryCache()
+                atexit.register(_cache.close)
+    return _cache
@@ -0,0 +1,220 @@
+"""Inverted full-text index over conversation history.
+
+``search_conversation_history`` used to scan the user's last 50 turns and
+run a lowercase substring test on each query, response and entity list per
+search.  Here every retained turn is tokenized once, when it is saved, into
+postings of ``term -> {doc: field weight}``.  The field weights are the old
+ones: query 2, response 1, entities 1.5.  One index is kept per user and
+one across all users for admin searches.
+
+A search looks up each query term, plus vocabulary terms it is a prefix of
+(found by bisecting the sorted vocabulary), and ranks matching turns by the
+sum of IDF-weighted field weights.  The work depends on how many turns
+contain the terms, not on how long the history is.
+
+The index is built from the conversation store on first use, then kept
+current by ``add`` as turns are saved.  Turns that fall out of the store's
+retention are dropped from the index as well.
+"""
+import heapq
+import math
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.email_index import tokenize
+
+QUERY_WEIGHT = 2.0
+RESPONSE_WEIGHT = 1.0
+ENTITY_WEIGHT = 1.5
+
+# Prefix expansions count less than an exact term and are capped per term
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 64
+
+
+def _doc_terms(entry: Dict[str, Any]) -> Dict[str, float]:
+    """Term -> summed weight of the fields of one turn that contain it."""
+    response = entry.get("response", "")
+    fields = (
+        (QUERY_WEIGHT, tokenize(entry.get("query", ""))),
+        (RESPONSE_WEIGHT, tokenize(response if isinstance(response, str) else str(response))),
+        (ENTITY_WEIGHT, [t for values in (entry.get("entities") or {}).values() for v in values for t in tokenize(str(v))]),
+    )
+    terms: Dict[str, float] = {}
+    for weight, tokens in fields:
+        for term in set(tokens):
+            terms[term] = terms.get(term, 0.0) + weight
+    return terms
+
+
+class _InvertedIndex:
+    """Postings plus a sorted vocabulary for prefix lookups."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.vocabulary: List[str] = []
+        self.size = 0
+
+    def add(self, doc_id: int, terms: Dict[str, float]) -> None:
+        for term, weight in terms.items():
+            docs = self.postings.get(term)
+            if docs is None:
+                docs = self.postings[term] = {}
+                insort(self.vocabulary, term)
+            docs[doc_id] = weight
+        self.size += 1
+
+    def remove(self, doc_id: int, terms: Dict[str, float]) -> None:
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+        self.size -= 1
+
+    def expand(self, term: str) -> Iterable[Tuple[str, float]]:
+        """The term itself and vocabulary terms it prefixes, with their match weight."""
+        if term in self.postings:
+            yield term, 1.0
+        if len(term) < MIN_PREFIX_LENGTH:
+            return
+        i = bisect_left(self.vocabulary, term)
+        expansions = 0
+        while i < len(self.vocabulary) and expansions < MAX_PREFIX_EXPANSIONS:
+            candidate = self.vocabulary[i]
+            if not candidate.startswith(term):
+                break
+            if candidate != term:
+                yield candidate, PREFIX_WEIGHT
+                expansions += 1
+            i += 1
+
+    def score(self, terms: List[str]) -> Dict[int, float]:
+        totals: Dict[int, float] = {}
+        for term in terms:
+            # A query term counts once per turn: its best exact or prefix match
+            best: Dict[int, float] = {}
+            for match, match_weight in self.expand(term):
+                docs = self.postings[match]
+                idf = math.log(1.0 + self.size / len(docs))
+                for doc_id, weight in docs.items():
+                    value = weight * match_weight * idf
+                    if value > best.get(doc_id, 0.0):
+                        best[doc_id] = value
+            for doc_id, value in best.items():
+                totals[doc_id] = totals.get(doc_id, 0.0) + value
+        return totals
+
+
+class HistorySearchIndex:
+    """Per-user and admin-wide full-text search over retained conversation turns."""
+
+    def __init__(self, retention: int):
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._next_id = 0
+        # doc_id -> (user_id, entry, terms)
+        self._docs: Dict[int, Tuple[str, Dict[str, Any], Dict[str, float]]] = {}
+        self._user_docs: Dict[str, deque] = {}
+        self._user_keys: Dict[str, set] = {}
+        self._users: Dict[str, _InvertedIndex] = {}
+        self._all = _InvertedIndex()
+
+    def add(self, user_id: str, entry: Dict[str, Any]) -> None:
+        """Index one saved turn, dropping the user's oldest once past retention."""
+        key = entry.get("timestamp")
+        terms = _doc_terms(entry)
+        with self._lock:
+            keys = self._user_keys.setdefault(user_id, set())
+            if key is not None and key in keys:
+                return  # already loaded from the store
+            doc_ids = self._user_docs.setdefault(user_id, deque())
+            index = self._users.setdefault(user_id, _InvertedIndex())
+            if len(doc_ids) >= self.retention:
+                self._drop(user_id, doc_ids.popleft())
+
+            doc_id = self._next_id
+            self._next_id += 1
+            self._docs[doc_id] = (user_id, entry, terms)
+            doc_ids.append(doc_id)
+            keys.add(key)
+            index.add(doc_id, terms)
+            self._all.add(doc_id, terms)
+
+    def _drop(self, user_id: str, doc_id: int) -> None:
+        _, entry, terms = self._docs.pop(doc_id)
+        self._user_keys[user_id].discard(entry.get("timestamp"))
+        self._users[user_id].remove(doc_id, terms)
+        self._all.remove(doc_id, terms)
+
+    def search(self, search_term: str, user_id: Optional[str] = None, offset: int = 0,
+               limit: int = 5) -> Tuple[int, List[Tuple[float, str, Dict[str, Any]]]]:
+        """(total matches, one page of (relevance, user_id, entry)), best first.
+
+        Searches one user's history, or every user's when ``user_id`` is None.
+        Equal scores keep history order (oldest first).
+        """
+        terms = list(dict.fromkeys(tokenize(search_term)))
+        if not terms or limit <= 0:
+            return 0, []
+        with self._lock:
+            index = self._all if user_id is None else self._users.get(user_id)
+            if index is None:
+                return 0, []
+            totals = index.score(terms)
+            page = heapq.nsmallest(offset + limit, totals.items(), key=lambda item: (-item[1], item[0]))[offset:]
+            return len(totals), [
+                (round(score, 3), self._docs[doc_id][0], self._docs[doc_id][1]) for doc_id, score in page
+            ]
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+_index: Optional[HistorySearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_history_search() -> HistorySearchIndex:
+    """Return the shared index, building it from the conversation store on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from core.history_cache import get_history_cache
+
+                cache = get_history_cache()
+                # Pending turns must be in the store before it is read
+                cache.flush()
+                store = cache.store
+                index = HistorySearchIndex(store.retention)
+                for user_id in store.user_ids():
+                    for entry in store.tail(user_id):
+                        index.add(user_id, entry)
+                _index = index
+    return _index
+
+
+def index_turn(user_id: str, entry: Dict[str, Any]) -> None:
+    """Keep the index current with a newly saved turn; a no-op until the index is first used."""
+    index = _index
+    if index is None:
+        # Wait out a build in progress, which may have read the store before this turn landed
+        with _index_lock:
+            index = _index
+        if index is None:
+            return
+    index.add(user_id, entry)
+
+
+def reset_history_search() -> None:
+    """Drop the index so the next search rebuilds it (after history was rewritten)."""
+    global _index
+    with _index_lock:
+        _index = None
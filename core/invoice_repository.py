@@ -0,0 +1,216 @@
+"""Invoice storage behind a repository interface with a columnar pandas backend.
+
+Invoices are held column-wise: categorical vendor and status, datetime64
+dates and int64 amounts.  A filter is a single boolean mask built from
+vectorized comparisons, and the aggregates the response needs (row count,
+total amount, failed count) are computed from the same mask.  Vendor
+matching runs over the (small) category list rather than every row.
+
+Relative periods ("last month", "this month", "last quarter") are resolved
+against today's date.  Set ``FINKRAFT_AS_OF`` to an ISO date to pin them to
+a fixed snapshot instead, e.g. ``FINKRAFT_AS_OF=2025-01-01`` for the bundled
+fixtures, whose newest invoices are from December 2024.
+"""
+import calendar
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+INVOICE_DATA_PATH = os.path.join("data", "invoices.csv")
+AS_OF_ENV = "FINKRAFT_AS_OF"
+RELOAD_CHECK_SECONDS = 1.0
+
+INVOICE_DTYPES = {
+    "invoice_id": "string",
+    "vendor": "category",
+    "status": "category",
+    "amount": "int64",
+    "error": "string",
+}
+
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+
+def _month_start(year: int, month: int) -> date:
+    # Normalises month overflow/underflow (e.g. month 13 -> January next year)
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return date(year, month, 1)
+
+
+def reference_date() -> date:
+    """Date relative periods are resolved against: FINKRAFT_AS_OF when set, else today."""
+    value = os.environ.get(AS_OF_ENV)
+    return date.fromisoformat(value) if value else date.today()
+
+
+def resolve_period(period: Optional[str], as_of: date) -> Optional[Tuple[date, date, str]]:
+    """Turn an extracted period into a half-open [start, end) date range and a label.
+
+    Understands the values produced by actions.extract_parameters: last_month,
+    this_month, last_quarter, 'Q1 2025' and 'march 2025'.  Returns None for
+    anything else so callers can leave the period unfiltered.
+    """
+    if not period:
+        return None
+    value = period.strip().lower()
+
+    if value == "this_month":
+        start = _month_start(as_of.year, as_of.month)
+        return start, _month_start(start.year, start.month + 1), "this month"
+    if value == "last_month":
+        start = _month_start(as_of.year, as_of.month - 1)
+        return start, _month_start(start.year, start.month + 1), "last month"
+    if value == "last_quarter":
+        current_q_start = _month_start(as_of.year, 3 * ((as_of.month - 1) // 3) + 1)
+        start = _month_start(current_q_start.year, current_q_start.month - 3)
+        return start, current_q_start, "last quarter"
+
+    parts = value.replace("-", " ").split()
+    if len(parts) == 2 and parts[1].isdigit():
+        year = int(parts[1])
+        if parts[0] in ("q1", "q2", "q3", "q4"):
+            start = _month_start(year, 3 * (int(parts[0][1]) - 1) + 1)
+            return start, _month_start(year, start.month + 3), period.upper()
+        if parts[0][:3] in _MONTHS:
+            month = _MONTHS.index(parts[0][:3]) + 1
+            return _month_start(year, month), _month_start(year, month + 1), f"{calendar.month_name[month]} {year}"
+    return None
+
+
+@dataclass
+class InvoiceQueryResult:
+    """Filtered invoices plus the aggregates computed in the same pass."""
+
+    total_found: int
+    total_amount: int
+    failed_count: int
+    rows: List[Dict[str, Any]]
+    filters_applied: List[str] = field(default_factory=list)
+
+
+class InvoiceRepository:
+    """Interface for invoice backends."""
+
+    def filter(self, vendor: Optional[str] = None, status: Optional[str] = None,
+               period: Optional[str] = None, limit: int = 5) -> InvoiceQueryResult:
+        raise NotImplementedError
+
+    def as_of(self) -> date:
+        raise NotImplementedError
+
+
+class ColumnarInvoiceRepository(InvoiceRepository):
+    """pandas/numpy backed repository; filters are vectorized boolean masks."""
+
+    def __init__(self, frame: pd.DataFrame, as_of: Optional[date] = None):
+        frame = frame.reset_index(drop=True)
+        for column, dtype in INVOICE_DTYPES.items():
+            if column in frame.columns:
+                frame[column] = frame[column].astype(dtype)
+        frame["date"] = pd.to_datetime(frame["date"])
+        self.frame = frame
+
+        # Raw column arrays so filters never go through the DataFrame machinery
+        self._vendor_codes = frame["vendor"].cat.codes.to_numpy()
+        self._vendor_names = [str(v).lower() for v in frame["vendor"].cat.categories]
+        self._status_codes = frame["status"].cat.codes.to_numpy()
+        self._status_names = [str(s).lower() for s in frame["status"].cat.categories]
+        self._dates = frame["date"].to_numpy(dtype="datetime64[ns]")
+        self._amounts = frame["amount"].to_numpy(dtype=np.int64)
+        failed_codes = self._category_codes(self._status_names, lambda name: name == "failed")
+        self._failed = np.isin(self._status_codes, failed_codes)
+        self._as_of = as_of
+
+    @classmethod
+    def from_file(cls, path: str = INVOICE_DATA_PATH, **kwargs) -> "ColumnarInvoiceRepository":
+        """Load from CSV or Parquet (Parquet needs pyarrow or fastparquet installed)."""
+        if path.endswith(".parquet"):
+            frame = pd.read_parquet(path)
+        else:
+            frame = pd.read_csv(path, dtype=INVOICE_DTYPES, parse_dates=["date"])
+        return cls(frame, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def as_of(self) -> date:
+        """Reference date for relative periods: the ``as_of`` given at construction, else reference_date()."""
+        if self._as_of is not None:
+            return self._as_of
+        return reference_date()
+
+    def _category_codes(self, names: List[str], predicate) -> np.ndarray:
+        return np.array([i for i, name in enumerate(names) if predicate(name)], dtype=np.int32)
+
+    def mask(self, vendor: Optional[str] = None, status: Optional[str] = None,
+             period: Optional[str] = None) -> Tuple[np.ndarray, List[str]]:
+        """Boolean row mask for the given filters and the labels of those applied."""
+        mask = np.ones(len(self.frame), dtype=bool)
+        applied = []
+
+        if vendor:
+            needle = vendor.lower()
+            codes = self._category_codes(self._vendor_names, lambda name: needle in name)
+            mask &= np.isin(self._vendor_codes, codes)
+            applied.append(f"vendor: {vendor}")
+
+        if status:
+            codes = self._category_codes(self._status_names, lambda name: name == status.lower())
+            mask &= np.isin(self._status_codes, codes)
+            applied.append(f"status: {status}")
+
+        bounds = resolve_period(period, self.as_of())
+        if bounds:
+            start, end, label = bounds
+            mask &= (self._dates >= np.datetime64(start)) & (self._dates < np.datetime64(end))
+            applied.append(f"period: {label}")
+
+        return mask, applied
+
+    def filter(self, vendor: Optional[str] = None, status: Optional[str] = None,
+               period: Optional[str] = None, limit: int = 5) -> InvoiceQueryResult:
+        mask, applied = self.mask(vendor, status, period)
+
+        total_found = int(np.count_nonzero(mask))
+        total_amount = int(self._amounts[mask].sum())
+        failed_count = int(np.count_nonzero(mask & self._failed))
+
+        # Only the displayed rows are materialised
+        head = self.frame.iloc[np.flatnonzero(mask)[:limit]]
+        rows = []
+        for record in head.to_dict("records"):
+            record["date"] = record["date"].strftime("%Y-%m-%d")
+            record["amount"] = int(record["amount"])
+            record["error"] = None if pd.isna(record.get("error")) else record["error"]
+            rows.append(record)
+
+        return InvoiceQueryResult(total_found, total_amount, failed_count, rows, applied)
+
+
+_repository: Optional[InvoiceRepository] = None
+_repository_mtime: Optional[float] = None
+_last_check = 0.0
+_repository_lock = threading.Lock()
+
+
+def get_invoice_repository(path: str = INVOICE_DATA_PATH) -> InvoiceRepository:
+    """Return the shared repository, reloading when the data file changes."""
+    global _repository, _repository_mtime, _last_check
+    now = time.monotonic()
+    if _repository is not None and now - _last_check < RELOAD_CHECK_SECONDS:
+        return _repository
+
+    with _repository_lock:
+        _last_check = now
+        mtime = os.path.getmtime(path)
+        if _repository is None or mtime != _repository_mtime:
+            _repository = ColumnarInvoiceRepository.from_file(path)
+            _repository_mtime = mtime
+    return _repository
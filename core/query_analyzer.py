@@ -0,0 +1,206 @@
+"""Single-pass query analysis shared by the router, actions and context manager.
+
+Every keyword list the routing pipeline checks (intent words, routing
+phrases, action patterns) is compiled into one Aho-Corasick automaton, so a
+query is scanned once and all substring hits (overlapping ones included)
+come out together.  The word-bounded complexity checks are folded into one
+regex with named groups.  The result is a memoized, immutable
+``QueryFeatures`` that each module reads instead of re-scanning the text.
+"""
+import re
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+# Intent keywords in priority order (first group with a hit wins)
+INTENT_KEYWORDS = {
+    "data_retrieval": ["filter", "show", "list", "find"],
+    "report_generation": ["download", "export", "generate"],
+    "creation": ["create", "raise", "new"],
+    "explanation": ["why", "how", "what", "explain"],
+    "status_inquiry": ["status", "check", "track"],
+}
+
+# Phrases the router uses to pick a module
+ROUTING_KEYWORDS = {
+    # why/how/what come from the word-bounded question count instead, since
+    # a substring test would send "show ..." queries to the FAQ matcher
+    "faq": ["explain"],
+    "email": ["email", "notification", "alert", "status update", "reminder"],
+    # A ticket ID on its own ("status of TCK-101, TCK-104") is a tracking request
+    "support": ["ticket", "support", "tck-"],
+    "ticket_create": ["create", "raise"],
+    "ticket_track": ["status", "track", "tck-"],
+    "followup": ["why", "how", "more details", "explain", "what about", "also"],
+}
+
+# Enhanced action patterns with more variations (checked in this order)
+ACTION_PATTERNS = {
+    "filter_invoices": [
+        "filter invoices", "show invoices", "find invoices", "search invoices",
+        "list invoices", "invoices for", "get invoices"
+    ],
+    "download_gst_report": [
+        "download report", "get report", "generate report", "export report",
+        "gst report", "download gst", "create report", "report status"
+    ],
+    "view_filing_status": [
+        "filing status", "check status", "gst status", "show status",
+        "filing for", "check filing", "status of filing"
+    ],
+    "reconcile_invoices": [
+        "reconcile", "match invoices", "compare invoices", "reconcile invoices",
+        "invoice reconciliation", "match with gstr"
+    ],
+    "raise_ticket": [
+        "raise ticket", "create ticket", "new ticket", "open ticket",
+        "support ticket", "help ticket", "ticket for"
+    ]
+}
+
+# Word-bounded complexity signals, one alternation per counter
+_ANALYSIS_RE = re.compile(
+    r"(?P<assignment>=)"
+    r"|\b(?:(?P<question>what|why|how|when|where|who)"
+    r"|(?P<action>filter|download|create|show|generate|reconcile)"
+    r"|(?P<parameter>vendor|status|period|last|this))\b"
+    r"|\b(?P<entity>INV-\d+|TCK-\d+|₹[\d,]+)\b",
+    re.IGNORECASE,
+)
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting every keyword occurring in a text."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+
+        for keyword in set(keywords):
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] += (keyword,)
+
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self._goto[state].items():
+                pending.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> FrozenSet[str]:
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found.update(out[state])
+        return frozenset(found)
+
+
+def _all_keywords() -> List[str]:
+    keywords = []
+    for table in (INTENT_KEYWORDS, ROUTING_KEYWORDS, ACTION_PATTERNS):
+        for words in table.values():
+            keywords.extend(words)
+    return keywords
+
+
+_AUTOMATON = KeywordAutomaton(_all_keywords())
+
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    """Everything the pipeline needs to know about a query, computed once."""
+
+    text: str
+    lower: str
+    tokens: Tuple[str, ...]
+    keywords: FrozenSet[str]
+    intent: str
+    actions: Tuple[str, ...]
+    word_count: int
+    has_parameters: bool
+    has_entities: bool
+    question_words: int
+    action_words: int
+    complexity: str
+
+    def has_any(self, group: str) -> bool:
+        """True if any keyword of the ROUTING_KEYWORDS ``group`` occurs in the query."""
+        return any(word in self.keywords for word in ROUTING_KEYWORDS[group])
+
+    def complexity_analysis(self) -> dict:
+        """The dict shape returned by router.analyze_query_complexity."""
+        return {
+            "word_count": self.word_count,
+            "has_parameters": self.has_parameters,
+            "has_entities": self.has_entities,
+            "question_words": self.question_words,
+            "action_words": self.action_words,
+            "complexity": self.complexity,
+        }
+
+
+@lru_cache(maxsize=2048)
+def analyze_query(query: str) -> QueryFeatures:
+    """Tokenize and scan ``query`` once; results are memoized per query text."""
+    lower = query.lower()
+    tokens = tuple(query.split())
+    keywords = _AUTOMATON.find(lower)
+
+    intent = "general"
+    for name, words in INTENT_KEYWORDS.items():
+        if any(word in keywords for word in words):
+            intent = name
+            break
+
+    actions = tuple(
+        name for name, patterns in ACTION_PATTERNS.items()
+        if any(pattern in keywords for pattern in patterns)
+    )
+
+    counts = {"assignment": 0, "question": 0, "action": 0, "parameter": 0, "entity": 0}
+    for match in _ANALYSIS_RE.finditer(query):
+        counts[match.lastgroup] += 1
+
+    has_parameters = bool(counts["assignment"] or counts["parameter"])
+    has_entities = bool(counts["entity"])
+    if len(tokens) > 10 or has_parameters or has_entities:
+        complexity = "high"
+    elif counts["question"] > 0 or counts["action"] > 0:
+        complexity = "medium"
+    else:
+        complexity = "low"
+
+    return QueryFeatures(
+        text=query,
+        lower=lower,
+        tokens=tokens,
+        keywords=keywords,
+        intent=intent,
+        actions=actions,
+        word_count=len(tokens),
+        has_parameters=has_parameters,
+        has_entities=has_entities,
+        question_words=counts["question"],
+        action_words=counts["action"],
+        complexity=complexity,
+    )
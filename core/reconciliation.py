@@ -0,0 +1,301 @@
+"""GSTR-2A reconciliation of the purchase register.
+
+Both ledgers are loaded column-wise and normalised to a join key of
+(GSTIN, invoice number), with invoice numbers stripped of separators and case
+so "INV/2024/034" and "inv-2024-034" meet.  The keys of both ledgers are
+factorized together into one int64 code per invoice when the data is loaded,
+so a reconciliation is an outer ``pandas.merge`` (a hash join) over integer
+codes, dates and amounts only.  Each pair is classified with vectorized
+comparisons:
+
+* matched          - amounts within the tolerance band and dates within
+                     ``date_days`` of each other
+* mismatched       - present on both sides but outside a tolerance
+* missing_gstr2a   - in our books, not reported by the supplier
+* missing_in_books - reported by the supplier, not in our books
+
+Invoices listed more than once on a side (one line per tax rate, or a
+repeated upload) are summed into one row per key before the join, so a
+duplicate never pairs with every row of the other side.
+
+A matched pair belongs to the period of our booking date and an unmatched
+row to the period of its own date, so a pair whose two dates straddle a
+month edge is counted once, in the month it was booked.
+
+``get_reconciler`` loads the ledgers per requested period, reading the files
+in chunks so only rows of that period (plus the date slack either side) are
+held in memory.  The last few periods are kept in a small LRU.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.invoice_repository import reference_date, resolve_period
+
+PURCHASE_REGISTER_PATH = os.path.join("data", "purchase_register.csv")
+GSTR2A_PATH = os.path.join("data", "gstr2a.csv")
+RELOAD_CHECK_SECONDS = 1.0
+
+# Rows read per chunk when a file is loaded for a single period
+READ_CHUNK_ROWS = 500_000
+
+# Periods whose loaded ledgers get_reconciler keeps
+RECONCILER_CACHE_PERIODS = 4
+
+# Entries listed per category in the response; counts always cover every row
+MAX_LISTED = 10
+
+# Source column -> canonical column, per ledger
+BOOKS_COLUMNS = {"gstin": "gstin", "invoice_no": "invoice_no", "vendor": "vendor",
+                 "date": "date", "amount": "amount"}
+GSTR2A_COLUMNS = {"gstin": "gstin", "invoice_no": "invoice_no", "supplier_name": "vendor",
+                  "date": "date", "taxable_value": "amount"}
+
+_KEY_STRIP_RE = r"[^0-9A-Z]"
+
+
+@dataclass(frozen=True)
+class Tolerance:
+    """How far the two sides may drift apart and still count as matched."""
+
+    amount_abs: float = 1.0      # rupees, absorbs paise rounding
+    amount_pct: float = 0.0      # fraction of our amount, e.g. 0.001 for 0.1%
+    date_days: int = 3
+
+    def amount_band(self, amounts: np.ndarray) -> np.ndarray:
+        return np.maximum(self.amount_abs, np.abs(amounts) * self.amount_pct)
+
+
+def normalize_ledger(frame: pd.DataFrame, columns: Dict[str, str]) -> pd.DataFrame:
+    """Rename to canonical columns, coerce dtypes and add the join keys."""
+    frame = frame[list(columns)].rename(columns=columns)
+    frame["gstin"] = frame["gstin"].astype(str).str.strip().str.upper()
+    frame["invoice_no"] = frame["invoice_no"].astype(str).str.strip()
+    frame["vendor"] = frame["vendor"].astype("category")
+    frame["date"] = pd.to_datetime(frame["date"])
+    frame["amount"] = pd.to_numeric(frame["amount"]).astype("float64")
+    frame["invoice_key"] = frame["invoice_no"].str.upper().str.replace(_KEY_STRIP_RE, "", regex=True)
+    return frame.reset_index(drop=True)
+
+
+def iter_ledger_chunks(path: str, columns: Dict[str, str], start: Optional[date] = None,
+                       end: Optional[date] = None, chunksize: int = READ_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield raw ``chunksize`` row blocks of a CSV ledger, keeping rows dated in [start, end).
+
+    Each block is filtered before the next is read, so callers that consume
+    the blocks one at a time hold at most one chunk in memory.
+    """
+    reader = pd.read_csv(path, usecols=list(columns), dtype={"gstin": str, "invoice_no": str},
+                         parse_dates=["date"], chunksize=chunksize)
+    for chunk in reader:
+        if start is not None:
+            chunk = chunk[(chunk["date"] >= pd.Timestamp(start)) & (chunk["date"] < pd.Timestamp(end))]
+        yield chunk
+
+
+def load_ledger(path: str, columns: Dict[str, str], start: Optional[date] = None,
+                end: Optional[date] = None, chunksize: int = READ_CHUNK_ROWS) -> pd.DataFrame:
+    """Read a CSV ledger, keeping only rows dated in [start, end) when given.
+
+    Peak memory tracks the period, not the file.
+    """
+    chunks = list(iter_ledger_chunks(path, columns, start, end, chunksize))
+    frame = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=list(columns))
+    return normalize_ledger(frame, columns)
+
+
+def _money(value: float):
+    # Whole rupee amounts stay ints so the response renders ₹50,000, not ₹50,000.0
+    value = round(float(value), 2)
+    return int(value) if value.is_integer() else value
+
+
+def _in_range(dates: pd.Series, start: Optional[date], end: Optional[date]) -> np.ndarray:
+    if start is None:
+        return np.ones(len(dates), dtype=bool)
+    return ((dates >= pd.Timestamp(start)) & (dates < pd.Timestamp(end))).to_numpy()
+
+
+def _collapse_duplicates(slim: pd.DataFrame) -> pd.DataFrame:
+    """One row per join key: amounts summed, earliest date, first source row kept for listing."""
+    if not slim["join_key"].duplicated().any():
+        return slim
+    return slim.groupby("join_key", sort=False, as_index=False).agg(
+        date=("date", "min"), amount=("amount", "sum"), row=("row", "first"))
+
+
+class GSTRReconciler:
+    """Hash-join reconciliation between the purchase register and GSTR-2A."""
+
+    def __init__(self, books: pd.DataFrame, gstr2a: pd.DataFrame, tolerance: Tolerance = Tolerance(),
+                 as_of: Optional[date] = None):
+        self.books = books
+        self.gstr2a = gstr2a
+        self.tolerance = tolerance
+        self._as_of = as_of
+
+        # One shared code per (GSTIN, invoice) so the join never compares strings
+        keys = pd.concat([books["gstin"] + "|" + books["invoice_key"],
+                          gstr2a["gstin"] + "|" + gstr2a["invoice_key"]], ignore_index=True)
+        codes, _ = pd.factorize(keys)
+        self._books_slim = pd.DataFrame({
+            "join_key": codes[:len(books)], "date": books["date"].to_numpy(),
+            "amount": books["amount"].to_numpy(), "row": np.arange(len(books)),
+        })
+        self._gstr2a_slim = pd.DataFrame({
+            "join_key": codes[len(books):], "date": gstr2a["date"].to_numpy(),
+            "amount": gstr2a["amount"].to_numpy(), "row": np.arange(len(gstr2a)),
+        })
+
+    @classmethod
+    def from_files(cls, books_path: str = PURCHASE_REGISTER_PATH, gstr2a_path: str = GSTR2A_PATH,
+                   **kwargs) -> "GSTRReconciler":
+        return cls(load_ledger(books_path, BOOKS_COLUMNS), load_ledger(gstr2a_path, GSTR2A_COLUMNS), **kwargs)
+
+    def as_of(self) -> date:
+        """Reference date for relative periods: the ``as_of`` given at construction, else reference_date()."""
+        if self._as_of is not None:
+            return self._as_of
+        return reference_date()
+
+    def period_bounds(self, period: Optional[str]) -> Tuple[Optional[date], Optional[date], Optional[str]]:
+        bounds = resolve_period(period, self.as_of())
+        return bounds if bounds else (None, None, None)
+
+    def match(self, period: Optional[str] = None) -> pd.DataFrame:
+        """Outer-join both ledgers for ``period`` and label every row with a ``result``."""
+        start, end, _ = self.period_bounds(period)
+
+        # Either side's date may sit just across the period edge and still match
+        slack = timedelta(days=self.tolerance.date_days)
+        wide_start = start - slack if start else None
+        wide_end = end + slack if end else None
+        books = _collapse_duplicates(self._books_slim[_in_range(self._books_slim["date"], wide_start, wide_end)])
+        gstr2a = _collapse_duplicates(self._gstr2a_slim[_in_range(self._gstr2a_slim["date"], wide_start, wide_end)])
+
+        merged = pd.merge(
+            books, gstr2a, on="join_key", how="outer",
+            suffixes=("_books", "_2a"), indicator=True, sort=False,
+        )
+
+        side = merged["_merge"].to_numpy()
+        both = side == "both"
+        our_amount = merged["amount_books"].to_numpy()
+        their_amount = merged["amount_2a"].to_numpy()
+        difference = np.abs(our_amount - their_amount)
+        day_gap = np.abs((merged["date_books"] - merged["date_2a"]).dt.days.to_numpy())
+
+        amount_ok = difference <= self.tolerance.amount_band(our_amount)
+        date_ok = day_gap <= self.tolerance.date_days
+
+        result = np.full(len(merged), "missing_in_books", dtype=object)
+        result[side == "left_only"] = "missing_gstr2a"
+        result[both & amount_ok & date_ok] = "matched"
+        result[both & ~(amount_ok & date_ok)] = "mismatched"
+        merged["result"] = result
+        merged["difference"] = np.where(both, our_amount - their_amount, np.nan)
+        merged["amount_mismatch"] = both & ~amount_ok
+        merged["date_mismatch"] = both & ~date_ok
+
+        # A pair belongs to the period of our booking date, an unmatched row to that of its own date,
+        # so rows pulled in by the slack are left to the neighbouring period
+        in_period = np.where(side == "right_only", _in_range(merged["date_2a"], start, end),
+                             _in_range(merged["date_books"], start, end))
+        return merged[in_period].reset_index(drop=True)
+
+    def _source_rows(self, merged: pd.DataFrame, side: str) -> pd.DataFrame:
+        # Invoice numbers and vendors are only looked up for the rows being listed
+        ledger = self.books if side == "books" else self.gstr2a
+        return ledger.iloc[merged[f"row_{side}"].astype(np.int64).to_numpy()]
+
+    def reconcile(self, period: Optional[str] = None, max_listed: int = MAX_LISTED) -> Dict[str, Any]:
+        """Summary in the ``reconciliation_data`` shape used by actions.reconcile_invoices."""
+        merged = self.match(period)
+        counts = merged["result"].value_counts()
+
+        discrepancies = merged[merged["amount_mismatch"]]
+        discrepancies = discrepancies.reindex(
+            discrepancies["difference"].abs().sort_values(ascending=False).index
+        ).head(max_listed)
+        missing_2a = merged[merged["result"] == "missing_gstr2a"].nlargest(max_listed, "amount_books")
+        missing_books = merged[merged["result"] == "missing_in_books"].nlargest(max_listed, "amount_2a")
+
+        return {
+            "total_invoices": int((merged["_merge"] != "right_only").sum()),
+            "matched": int(counts.get("matched", 0)),
+            "mismatched": int(counts.get("mismatched", 0)),
+            "missing_gstr2a": int(counts.get("missing_gstr2a", 0)),
+            "missing_in_books": int(counts.get("missing_in_books", 0)),
+            "date_mismatches": int(merged["date_mismatch"].sum()),
+            "amount_discrepancies": [
+                {
+                    "invoice_id": invoice_no,
+                    "our_amount": _money(ours),
+                    "gstr2a_amount": _money(theirs),
+                    "difference": _money(abs(ours - theirs)),
+                }
+                for invoice_no, ours, theirs in zip(self._source_rows(discrepancies, "books")["invoice_no"],
+                                                    discrepancies["amount_books"], discrepancies["amount_2a"])
+            ],
+            "missing_invoices": [
+                {"invoice_id": row.invoice_no, "vendor": str(row.vendor), "amount": _money(row.amount)}
+                for row in self._source_rows(missing_2a, "books").itertuples(index=False)
+            ],
+            "unrecorded_invoices": [
+                {"invoice_id": row.invoice_no, "vendor": str(row.vendor), "amount": _money(row.amount)}
+                for row in self._source_rows(missing_books, "2a").itertuples(index=False)
+            ],
+        }
+
+
+_reconcilers: "OrderedDict[Tuple, GSTRReconciler]" = OrderedDict()
+_reconciler_mtimes: Optional[Tuple[float, float]] = None
+_last_check = 0.0
+_reconciler_lock = threading.Lock()
+
+
+def get_reconciler(period: Optional[str] = None, books_path: str = PURCHASE_REGISTER_PATH,
+                   gstr2a_path: str = GSTR2A_PATH) -> GSTRReconciler:
+    """Return a reconciler holding only the rows ``period`` needs.
+
+    Reconcilers are kept for the last RECONCILER_CACHE_PERIODS periods and all
+    of them are dropped when either ledger file changes.  No period (or one
+    that does not resolve) loads both ledgers in full.
+    """
+    global _reconciler_mtimes, _last_check
+    with _reconciler_lock:
+        now = time.monotonic()
+        if _reconciler_mtimes is None or now - _last_check >= RELOAD_CHECK_SECONDS:
+            _last_check = now
+            mtimes = (os.path.getmtime(books_path), os.path.getmtime(gstr2a_path))
+            if mtimes != _reconciler_mtimes:
+                _reconcilers.clear()
+                _reconciler_mtimes = mtimes
+
+        # Relative periods move with the calendar, so the key is the resolved date range
+        as_of = reference_date()
+        bounds = resolve_period(period, as_of)
+        start, end = (bounds[0], bounds[1]) if bounds else (None, None)
+        key = (books_path, gstr2a_path, start, end)
+        reconciler = _reconcilers.get(key)
+        if reconciler is not None:
+            _reconcilers.move_to_end(key)
+            return reconciler
+
+        # Rows just across the period edge can still match, so both ledgers are read with the date slack
+        slack = timedelta(days=Tolerance().date_days)
+        wide_start, wide_end = (start - slack, end + slack) if start else (None, None)
+        books = load_ledger(books_path, BOOKS_COLUMNS, wide_start, wide_end)
+        gstr2a = load_ledger(gstr2a_path, GSTR2A_COLUMNS, wide_start, wide_end)
+        reconciler = GSTRReconciler(books, gstr2a, as_of=as_of)
+        _reconcilers[key] = reconciler
+        while len(_reconcilers) > RECONCILER_CACHE_PERIODS:
+            _reconcilers.popitem(last=False)
+    return reconciler
@@ -0,0 +1,247 @@
+"""Content-addressed cache of generated report files.
+
+A report is identified by what went into it: report type, format, the
+normalised period, the tenant and a hash of the source data.  When a request
+maps to a key already in the cache and the file is still on disk, the
+existing artifact in ``reports/`` is returned instead of regenerating it.
+
+The index lives next to the reports (``reports/.cache_index.json``) so it
+survives restarts.  Entries expire after ``ttl_seconds`` (reports are
+advertised as downloadable for 30 days), and the least recently used ones
+are evicted, files included, once the cache exceeds ``max_entries`` or
+``max_bytes`` on disk.
+
+Hits only reorder the in-memory LRU.  The index is written when it changes
+(a put, an eviction or an entry found stale).  Each write happens under an
+exclusive ``flock`` and first merges the index on disk, so processes sharing
+``reports/`` do not overwrite each other's entries.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+from core.invoice_repository import reference_date, resolve_period
+
+REPORTS_DIR = "reports"
+CACHE_INDEX_NAME = ".cache_index.json"
+CACHE_LOCK_NAME = ".cache_index.lock"
+
+REPORT_CACHE_TTL_SECONDS = 30 * 24 * 3600
+REPORT_CACHE_MAX_ENTRIES = 500
+REPORT_CACHE_MAX_BYTES = int(os.environ.get("FINKRAFT_REPORT_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+DEFAULT_TENANT = os.environ.get("FINKRAFT_TENANT", "default")
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+_digest_memo: Dict[str, Tuple[int, int, str]] = {}
+_digest_lock = threading.Lock()
+
+
+def data_version(path: str) -> str:
+    """SHA-256 of a data file's content, recomputed only when its size or mtime changes."""
+    stat = os.stat(path)
+    with _digest_lock:
+        memo = _digest_memo.get(path)
+        if memo and memo[:2] == (stat.st_size, stat.st_mtime_ns):
+            return memo[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    version = digest.hexdigest()[:16]
+
+    with _digest_lock:
+        _digest_memo[path] = (stat.st_size, stat.st_mtime_ns, version)
+    return version
+
+
+def normalize_period(period: Optional[str]) -> str:
+    """Canonical form of a period so 'Q1 2025', 'q1-2025' and 'jan 2025'-style variants share a key."""
+    value = "_".join((period or "current month").strip().lower().replace("-", " ").split())
+    # Relative periods key on the dates they cover today, so "this_month" rolls over with the calendar
+    as_of = reference_date()
+    bounds = resolve_period(value, as_of) or resolve_period(value.replace("_", " "), as_of)
+    if bounds:
+        return f"{bounds[0].isoformat()}..{bounds[1].isoformat()}"
+    return value
+
+
+def cache_key(report_type: str, fmt: str, period: Optional[str], tenant: str, version: str) -> str:
+    raw = "|".join([report_type, fmt, normalize_period(period), tenant, version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    """LRU + TTL + disk budget index over report files."""
+
+    def __init__(self, directory: str = REPORTS_DIR, ttl_seconds: float = REPORT_CACHE_TTL_SECONDS,
+                 max_entries: int = REPORT_CACHE_MAX_ENTRIES, max_bytes: int = REPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.index_path = os.path.join(directory, CACHE_INDEX_NAME)
+        self.lock_path = os.path.join(directory, CACHE_LOCK_NAME)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._seen_mtime: Optional[int] = None
+        self._load()
+
+    def _index_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        self._seen_mtime = self._index_mtime()
+        try:
+            with open(self.index_path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _load(self) -> None:
+        # Stored least recently used first, so insertion order is the LRU order
+        for key, entry in sorted(self._read_index().items(), key=lambda item: item[1].get("last_access", 0)):
+            self._entries[key] = entry
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize index writes across threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge_disk_index(self) -> None:
+        """Fold in entries other processes wrote since our last read.
+
+        For a key known to both, the newer report wins and the later access
+        time is kept.  Entries whose files are gone were dropped elsewhere.
+        """
+        merged = dict(self._entries)
+        for key, theirs in self._read_index().items():
+            ours = merged.get(key)
+            if ours is None:
+                merged[key] = theirs
+            elif theirs.get("created_at", 0) > ours.get("created_at", 0):
+                merged[key] = dict(theirs, last_access=max(theirs.get("last_access", 0), ours.get("last_access", 0)))
+            else:
+                ours["last_access"] = max(theirs.get("last_access", 0), ours.get("last_access", 0))
+        self._entries = OrderedDict(
+            (key, entry)
+            for key, entry in sorted(merged.items(), key=lambda item: item[1].get("last_access", 0))
+            if os.path.exists(entry["file_path"])
+        )
+
+    def _save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-index-", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.index_path)
+            self._seen_mtime = self._index_mtime()
+        except OSError as e:
+            print(f"⚠️ Error saving report cache index: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        try:
+            os.remove(entry["file_path"])
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached entry for ``key`` if its file is still present and fresh."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._index_mtime() != self._seen_mtime:
+                # Another process may have generated this report since we last read the index
+                self._merge_disk_index()
+                entry = self._entries.get(key)
+            stale = entry is not None and (now - entry["created_at"] > self.ttl_seconds
+                                           or not os.path.exists(entry["file_path"]))
+            if entry is not None and not stale:
+                # The new access time reaches disk with the next index write
+                self.hits += 1
+                entry["last_access"] = now
+                self._entries.move_to_end(key)
+                return dict(entry)
+            self.misses += 1
+
+        if stale:
+            with self._exclusive():
+                if key in self._entries:
+                    self._drop(key)
+                    self.evictions += 1
+                self._merge_disk_index()
+                self._save()
+        return None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Record a finished report, then evict down to the entry and byte budgets."""
+        now = time.time()
+        entry = dict(entry, created_at=entry.get("created_at", now), last_access=now)
+        with self._exclusive():
+            self._merge_disk_index()
+            if key in self._entries and self._entries[key]["file_path"] != entry["file_path"]:
+                self._drop(key)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict(now, keep=key)
+            self._save()
+
+    def _evict(self, now: float, keep: Optional[str] = None) -> None:
+        for key in [k for k, e in self._entries.items() if now - e["created_at"] > self.ttl_seconds]:
+            self._drop(key)
+            self.evictions += 1
+
+        total = sum(e.get("file_size", 0) for e in self._entries.values())
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_entries and total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries[key].get("file_size", 0)
+            self._drop(key)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": sum(e.get("file_size", 0) for e in self._entries.values()),
+            }
@@ -0,0 +1,488 @@
+"""Streaming GST report generation.
+
+Invoice rows are read from the purchase register in chunks and pushed
+through a format writer (CSV, XLSX or PDF) row by row, so memory stays
+constant whatever the size of the period.  Each report is written to a
+temporary file in ``reports/`` and moved into place with ``os.replace`` once
+complete, so readers never see a half-written file.
+
+Finished reports are recorded in the report cache, so a repeat request
+with unchanged inputs gets the existing file back.  Reports run on a small
+background worker pool.  ``download_gst_report`` waits
+briefly for the job; small periods finish inside that window and are
+answered directly, larger ones keep running and report progress when the
+user asks for the report's status.
+"""
+import atexit
+import calendar
+import csv
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from core.invoice_repository import reference_date, resolve_period
+from core.reconciliation import BOOKS_COLUMNS, PURCHASE_REGISTER_PATH, iter_ledger_chunks
+from core.report_cache import DEFAULT_TENANT, ReportCache, cache_key, data_version
+
+REPORTS_DIR = "reports"
+REPORT_TYPE = "gst_purchase_register"
+REPORT_FORMATS = ("pdf", "csv", "xlsx")
+DEFAULT_FORMAT = "pdf"
+
+# Rows pulled from the register per read; the only rows held in memory at once
+REPORT_CHUNK_ROWS = 50_000
+
+# How long download_gst_report waits before answering with a progress message
+INLINE_WAIT_SECONDS = 2.0
+
+REPORT_WORKERS = 2
+
+# Finished jobs remembered for "report status RPT-..." lookups; older ones are forgotten
+MAX_TRACKED_JOBS = 256
+
+ALL_PERIODS_LABEL = "all periods"
+
+REPORT_COLUMNS = ["GSTIN", "Invoice No", "Vendor", "Invoice Date", "Taxable Value"]
+
+
+class ReportError(Exception):
+    """Raised when a report cannot be produced in the requested format."""
+
+
+def iter_report_rows(start: Optional[date], end: Optional[date], path: str = PURCHASE_REGISTER_PATH,
+                     chunksize: int = REPORT_CHUNK_ROWS, on_chunk=None) -> Iterator[List[Any]]:
+    """Yield report rows for [start, end) one at a time from the purchase register.
+
+    ``on_chunk(rows_scanned)`` is called after each chunk is read, with the
+    number of register rows read so far (matching or not).
+    """
+    scanned = 0
+    for chunk in iter_ledger_chunks(path, BOOKS_COLUMNS, chunksize=chunksize):
+        scanned += len(chunk)
+        if start is not None:
+            chunk = chunk[(chunk["date"] >= pd.Timestamp(start)) & (chunk["date"] < pd.Timestamp(end))]
+        dates = chunk["date"].dt.strftime("%Y-%m-%d")
+        for gstin, invoice_no, vendor, invoice_date, amount in zip(
+            chunk["gstin"], chunk["invoice_no"], chunk["vendor"], dates, chunk["amount"]
+        ):
+            yield [gstin, invoice_no, vendor, invoice_date, float(amount)]
+        if on_chunk:
+            on_chunk(scanned)
+
+
+def scan_register(path: str = PURCHASE_REGISTER_PATH, chunksize: int = REPORT_CHUNK_ROWS):
+    """Row count and latest invoice date of the register, reading only the date column."""
+    rows, latest = 0, None
+    for chunk in pd.read_csv(path, usecols=["date"], parse_dates=["date"], chunksize=chunksize):
+        rows += len(chunk)
+        if len(chunk):
+            chunk_latest = chunk["date"].max().date()
+            latest = chunk_latest if latest is None else max(latest, chunk_latest)
+    return rows, latest
+
+
+_latest_month_memo: Dict[str, Tuple[int, int, Optional[str]]] = {}
+_latest_month_lock = threading.Lock()
+
+
+def latest_register_month(path: str = PURCHASE_REGISTER_PATH) -> Optional[str]:
+    """Month of the newest register entry as a period ("december 2024"); None for an empty register.
+
+    The register is rescanned only when its size or mtime changes.
+    """
+    stat = os.stat(path)
+    with _latest_month_lock:
+        memo = _latest_month_memo.get(path)
+        if memo and memo[:2] == (stat.st_size, stat.st_mtime_ns):
+            return memo[2]
+
+    _, latest = scan_register(path)
+    month = f"{calendar.month_name[latest.month].lower()} {latest.year}" if latest else None
+    with _latest_month_lock:
+        _latest_month_memo[path] = (stat.st_size, stat.st_mtime_ns, month)
+    return month
+
+
+# ---------- Writers ----------
+
+class ReportWriter:
+    """Receives the header once, then rows one at a time, then a closing summary."""
+
+    extension = ""
+
+    def __init__(self, path: str, title: str):
+        self.path = path
+        self.title = title
+
+    def write_header(self, columns: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def write_row(self, row: Sequence[Any]) -> None:
+        raise NotImplementedError
+
+    def close(self, summary: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class CsvReportWriter(ReportWriter):
+    extension = "csv"
+
+    def __init__(self, path: str, title: str):
+        super().__init__(path, title)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+
+    def write_header(self, columns):
+        self._writer.writerow(columns)
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+
+    def close(self, summary):
+        self._writer.writerow([])
+        self._writer.writerow(["Total invoices", summary["row_count"]])
+        self._writer.writerow(["Total taxable value", f"{summary['total_amount']:.2f}"])
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+def _require_openpyxl():
+    try:
+        import openpyxl
+    except ImportError:
+        raise ReportError("XLSX reports need the openpyxl package (pip install openpyxl); "
+                          "ask for a CSV or PDF report instead.")
+    return openpyxl
+
+
+class XlsxReportWriter(ReportWriter):
+    """openpyxl write-only workbook: rows are serialised as they are appended."""
+
+    extension = "xlsx"
+
+    def __init__(self, path: str, title: str):
+        super().__init__(path, title)
+        self._workbook = _require_openpyxl().Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet(title="GST Report")
+
+    def write_header(self, columns):
+        self._sheet.append([self.title])
+        self._sheet.append(list(columns))
+
+    def write_row(self, row):
+        self._sheet.append(list(row))
+
+    def close(self, summary):
+        self._sheet.append([])
+        self._sheet.append(["Total invoices", summary["row_count"]])
+        self._sheet.append(["Total taxable value", summary["total_amount"]])
+        self._workbook.save(self.path)
+
+
+class PdfReportWriter(ReportWriter):
+    """Minimal PDF 1.4 writer that emits one page object as soon as it is full.
+
+    Only the current page's lines and the byte offset of each object are kept,
+    which is what the cross-reference table at the end of the file needs.
+    """
+
+    extension = "pdf"
+    LINES_PER_PAGE = 70
+    FONT_SIZE = 8
+    LEADING = 11
+    TOP = 806
+    LEFT = 36
+
+    _CATALOG, _PAGES, _FONT = 1, 2, 3
+
+    def __init__(self, path: str, title: str):
+        super().__init__(path, title)
+        self._file = open(path, "wb")
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = 4
+        self._lines: List[str] = []
+        self._header_line = ""
+
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(self._CATALOG, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._write_object(self._FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>")
+
+    def _write_object(self, object_id: int, body: bytes) -> None:
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(f"{object_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def _allocate(self) -> int:
+        object_id = self._next_id
+        self._next_id += 1
+        return object_id
+
+    @staticmethod
+    def _escape(text: str) -> str:
+        text = text.replace("₹", "Rs.")
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    def _flush_page(self) -> None:
+        lines = [self.title, self._header_line, ""] + self._lines
+        ops = [f"BT /F1 {self.FONT_SIZE} Tf {self.LEADING} TL {self.LEFT} {self.TOP} Td"]
+        ops.extend(f"({self._escape(line)}) Tj T*" for line in lines)
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+
+        content_id, page_id = self._allocate(), self._allocate()
+        self._write_object(content_id, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self._PAGES} 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {self._FONT} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+        self._page_ids.append(page_id)
+        self._lines = []
+
+    @staticmethod
+    def _format(row: Sequence[Any]) -> str:
+        gstin, invoice_no, vendor, invoice_date, amount = row
+        amount = f"{amount:,.2f}" if isinstance(amount, float) else str(amount)
+        return f"{gstin:<16} {invoice_no:<18} {str(vendor)[:18]:<18} {invoice_date:<12} {amount:>16}"
+
+    def write_header(self, columns):
+        self._header_line = self._format(columns)
+
+    def write_row(self, row):
+        self._lines.append(self._format(row))
+        if len(self._lines) >= self.LINES_PER_PAGE:
+            self._flush_page()
+
+    def close(self, summary):
+        self._lines += ["", f"Total invoices: {summary['row_count']:,}",
+                        f"Total taxable value: Rs.{summary['total_amount']:,.2f}"]
+        self._flush_page()
+
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self._PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode())
+
+        xref_offset = self._file.tell()
+        size = self._next_id
+        self._file.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+        for object_id in range(1, size):
+            self._file.write(f"{self._offsets[object_id]:010d} 00000 n \n".encode())
+        self._file.write(f"trailer\n<< /Size {size} /Root {self._CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+WRITERS = {"csv": CsvReportWriter, "xlsx": XlsxReportWriter, "pdf": PdfReportWriter}
+
+
+# ---------- Jobs ----------
+
+@dataclass
+class ReportJob:
+    """State of one report; updated by the worker, read by the chat handler."""
+
+    report_id: str
+    period: str
+    fmt: str
+    status: str = "queued"          # queued | running | completed | failed
+    rows_total: int = 0             # register rows to scan
+    rows_scanned: int = 0
+    row_count: int = 0              # rows written to the report
+    total_amount: float = 0.0
+    file_path: Optional[str] = None
+    file_size: int = 0
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    finished_at: Optional[str] = None
+    cache_key: Optional[str] = None
+    cached: bool = False            # served from the report cache, nothing regenerated
+
+    @property
+    def progress(self) -> float:
+        if self.status == "completed":
+            return 1.0
+        return self.rows_scanned / self.rows_total if self.rows_total else 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+
+def format_file_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def generate_report(job: ReportJob, register_path: str = PURCHASE_REGISTER_PATH,
+                    reports_dir: str = REPORTS_DIR) -> ReportJob:
+    """Stream the register into ``job``'s format and atomically publish the file."""
+    job.status = "running"
+    tmp_path = None
+    try:
+        job.rows_total, _ = scan_register(register_path)
+        bounds = resolve_period(job.period, reference_date())
+        # An unrecognised period is not filtered, so the report covers the whole register
+        start, end, label = bounds if bounds else (None, None, ALL_PERIODS_LABEL)
+
+        os.makedirs(reports_dir, exist_ok=True)
+        final_path = os.path.join(reports_dir, f"gst_{job.period.replace(' ', '_')}_{job.report_id}.{job.fmt}")
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", suffix=f".{job.fmt}", dir=reports_dir)
+        os.close(fd)
+
+        writer = WRITERS[job.fmt](tmp_path, f"GST Purchase Report - {label.title()} ({job.report_id})")
+        writer.write_header(REPORT_COLUMNS)
+
+        def on_chunk(scanned):
+            job.rows_scanned = scanned
+
+        for row in iter_report_rows(start, end, register_path, on_chunk=on_chunk):
+            writer.write_row(row)
+            job.row_count += 1
+            job.total_amount += row[4]
+        writer.close({"row_count": job.row_count, "total_amount": job.total_amount})
+
+        os.replace(tmp_path, final_path)
+        tmp_path = None
+        job.file_path = final_path
+        job.file_size = os.path.getsize(final_path)
+        job.status = "completed"
+    except Exception as e:
+        print(f"⚠️ Error generating report {job.report_id}: {str(e)}")
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        job.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return job
+
+
+class ReportJobRegistry:
+    """Background executor plus the jobs it has run in this process.
+
+    Requests whose inputs match a cached report are answered from the cache,
+    and a request matching a report still being generated joins that job.
+    """
+
+    def __init__(self, workers: int = REPORT_WORKERS, register_path: str = PURCHASE_REGISTER_PATH,
+                 reports_dir: str = REPORTS_DIR, cache: Optional[ReportCache] = None):
+        self.register_path = register_path
+        self.reports_dir = reports_dir
+        self.cache = cache if cache is not None else ReportCache(reports_dir)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._jobs: Dict[str, ReportJob] = {}
+        self._futures = {}
+        self._inflight: Dict[str, ReportJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, period: str, fmt: str = DEFAULT_FORMAT, tenant: str = DEFAULT_TENANT) -> ReportJob:
+        if fmt not in WRITERS:
+            raise ReportError(f"Unsupported report format '{fmt}'; choose one of {', '.join(REPORT_FORMATS)}.")
+        if fmt == "xlsx":
+            # Fail in the chat turn, not later in the worker
+            _require_openpyxl()
+
+        try:
+            key = cache_key(REPORT_TYPE, fmt, period, tenant, data_version(self.register_path))
+        except OSError:
+            key = None  # the worker reports the missing register
+
+        with self._lock:
+            running = self._inflight.get(key) if key else None
+            if running is not None:
+                return running
+
+        entry = self.cache.get(key) if key else None
+        if entry is not None:
+            job = ReportJob(
+                report_id=entry["report_id"], period=period, fmt=fmt, status="completed",
+                rows_total=entry["row_count"], rows_scanned=entry["row_count"],
+                row_count=entry["row_count"], total_amount=entry["total_amount"],
+                file_path=entry["file_path"], file_size=entry["file_size"],
+                created_at=entry["generated_at"], finished_at=entry["generated_at"],
+                cache_key=key, cached=True,
+            )
+            with self._lock:
+                self._jobs[job.report_id] = job
+                self._prune()
+            return job
+
+        report_id = f"RPT-{datetime.now().strftime('%Y%m%d%H%M')}-{uuid.uuid4().hex[:4].upper()}"
+        job = ReportJob(report_id=report_id, period=period, fmt=fmt, cache_key=key)
+        with self._lock:
+            self._jobs[report_id] = job
+            self._prune()
+            if key:
+                self._inflight[key] = job
+            self._futures[report_id] = self._executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: ReportJob) -> ReportJob:
+        try:
+            generate_report(job, self.register_path, self.reports_dir)
+            if job.status == "completed" and job.cache_key:
+                self.cache.put(job.cache_key, {
+                    "report_id": job.report_id,
+                    "period": job.period,
+                    "format": job.fmt,
+                    "file_path": job.file_path,
+                    "file_size": job.file_size,
+                    "row_count": job.row_count,
+                    "total_amount": job.total_amount,
+                    "generated_at": job.finished_at,
+                })
+        finally:
+            with self._lock:
+                self._inflight.pop(job.cache_key, None)
+        return job
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs beyond MAX_TRACKED_JOBS (caller holds the lock)."""
+        excess = len(self._jobs) - MAX_TRACKED_JOBS
+        if excess <= 0:
+            return
+        for report_id in [rid for rid, job in self._jobs.items() if job.done][:excess]:
+            del self._jobs[report_id]
+            self._futures.pop(report_id, None)
+
+    def wait(self, report_id: str, timeout: float = INLINE_WAIT_SECONDS) -> Optional[ReportJob]:
+        """Block up to ``timeout`` seconds for a job; returns it either way."""
+        future = self._futures.get(report_id)
+        if future is not None:
+            wait([future], timeout=timeout)
+        return self.get(report_id)
+
+    def get(self, report_id: str) -> Optional[ReportJob]:
+        return self._jobs.get(report_id.upper())
+
+    def jobs(self, active_only: bool = False) -> List[ReportJob]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if not (active_only and job.done)]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_registry: Optional[ReportJobRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_report_registry() -> ReportJobRegistry:
+    """Return the process-wide registry; running reports are allowed to finish at exit."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ReportJobRegistry()
+                atexit.register(_registry.close)
+    return _registry
@@ -0,0 +1,151 @@
+"""Router-level cache of deterministic module responses.
+
+FAQ answers, email lookups and filing status depend only on the query and
+the data files behind them, so near-identical queries ("show pending
+invoices" / "Show pending invoices please") can share one computed body.
+Queries are reduced to a signature: lowercased content tokens with filler
+words removed, the extracted parameters and the role.  Email lookups score
+every query token, filler words included, so their signature keeps exactly
+the tokens the email scorer sees.  Each module has its
+own TTL, and its entries are dropped as soon as one of its data files
+changes on disk.
+
+Only the module output is cached.  Per-user decoration (previous-discussion
+notes, context suggestions) is added by the router after the lookup, and
+``get`` hands out deep copies so that decoration never leaks into the cache.
+"""
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from core.actions import extract_parameters
+from core.email_index import EMAIL_PATH, tokenize as email_tokenize
+from core.faq import FAQ_PATH
+
+RELOAD_CHECK_SECONDS = 1.0
+RESPONSE_CACHE_MAX_ENTRIES = 4096
+
+# Per-module TTL in seconds and the files whose changes invalidate its entries
+MODULE_POLICIES = {
+    "faq": {"ttl": 3600.0, "files": (FAQ_PATH,)},
+    "email": {"ttl": 300.0, "files": (EMAIL_PATH,)},
+    "view_filing_status": {"ttl": 600.0, "files": ()},
+}
+
+# Words that never change what a deterministic module returns
+SIGNATURE_STOPWORDS = frozenset({
+    "a", "an", "the", "please", "pls", "kindly", "me", "my", "our", "us", "i", "we",
+    "can", "could", "would", "you", "your", "just", "now", "thanks", "thank",
+    "hi", "hello", "hey", "to", "of", "for",
+})
+
+_SIGNATURE_TOKEN_RE = re.compile(r"[a-z0-9₹]+(?:[-_/][a-z0-9]+)*")
+
+
+def query_signature(query: str, role: str, module: Optional[str] = None) -> Tuple[Hashable, ...]:
+    """Normalised identity of a query for caching purposes."""
+    if module == "email":
+        # Every token adds to the email match score, so none of them can be dropped
+        tokens = tuple(email_tokenize(query))
+    else:
+        tokens = tuple(t for t in _SIGNATURE_TOKEN_RE.findall(query.lower()) if t not in SIGNATURE_STOPWORDS)
+    params = tuple(sorted(extract_parameters(query.lower()).items()))
+    return (role.lower(), tokens, params)
+
+
+class ResponseCache:
+    """Bounded LRU of module responses with per-module TTL and file-based invalidation."""
+
+    def __init__(self, policies: Dict[str, Dict[str, Any]] = MODULE_POLICIES,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.policies = policies
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float, Tuple]]" = OrderedDict()
+        self._versions: Dict[str, Tuple] = {}
+        self._version_checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _data_version(self, module: str) -> Tuple:
+        # File mtimes are checked at most once per RELOAD_CHECK_SECONDS per module
+        now = time.monotonic()
+        if now - self._version_checked.get(module, 0.0) >= RELOAD_CHECK_SECONDS:
+            versions = []
+            for path in self.policies[module]["files"]:
+                try:
+                    versions.append(os.path.getmtime(path))
+                except OSError:
+                    versions.append(None)
+            self._versions[module] = tuple(versions)
+            self._version_checked[module] = now
+        return self._versions[module]
+
+    def get(self, module: str, signature: Tuple) -> Tuple[bool, Any]:
+        """(True, deep copy of the cached value) on a fresh hit, else (False, None)."""
+        key = (module, signature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, version = entry
+                if time.monotonic() < expires_at and version == self._data_version(module):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+        return False, None
+
+    def put(self, module: str, signature: Tuple, value: Any) -> None:
+        policy = self.policies[module]
+        with self._lock:
+            expires_at = time.monotonic() + policy["ttl"]
+            self._entries[(module, signature)] = (copy.deepcopy(value), expires_at, self._data_version(module))
+            self._entries.move_to_end((module, signature))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, module: str, query: str, role: str, compute: Callable, *args) -> Any:
+        """Cached value for ``query`` in ``module``, computing and storing it on a miss.
+
+        Empty results (no match) and error responses are not stored.
+        """
+        if module not in self.policies:
+            return compute(*args)
+        signature = query_signature(query, role, module)
+        hit, value = self.get(module, signature)
+        if hit:
+            return value
+        value = compute(*args)
+        if value and not (isinstance(value, dict) and value.get("error")):
+            self.put(module, signature, value)
+        return value
+
+    def invalidate(self, module: Optional[str] = None) -> None:
+        with self._lock:
+            if module is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == module]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -1,27 +1,24 @@
-import re
-import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 from core import faq, support, actions, context_manager as cm
+from core.entities import extract_entities
+from core.query_analyzer import analyze_query
+from core.response_cache import get_response_cache
 from utils import trace_logger
+from utils.timing import StageTimer, record_timer
+from utils.role_manager import is_action_allowed
+
+# Shared by every route_query_async call so each query does not spin up its own threads
+_LOOKUP_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="route-lookup")
+
+# Actions whose output depends only on the query, so it can be served from the response cache
+CACHED_ACTIONS = frozenset(["view_filing_status"])
 
 def analyze_query_complexity(query: str) -> dict:
     """Analyze query to determine complexity and routing strategy"""
-    analysis = {
-        'word_count': len(query.split()),
-        'has_parameters': bool(re.search(r'[=]|\b(vendor|status|period|last|this)\b', query, re.IGNORECASE)),
-        'has_entities': bool(re.search(r'\b(INV-\d+|TCK-\d+|₹[\d,]+)\b', query, re.IGNORECASE)),
-        'question_words': len(re.findall(r'\b(what|why|how|when|where|who)\b', query, re.IGNORECASE)),
-        'action_words': len(re.findall(r'\b(filter|download|create|show|generate|reconcile)\b', query, re.IGNORECASE))
-    }
-
-    # Determine complexity
-    if analysis['word_count'] > 10 or analysis['has_parameters'] or analysis['has_entities']:
-        analysis['complexity'] = 'high'
-    elif analysis['question_words'] > 0 or analysis['action_words'] > 0:
-        analysis['complexity'] = 'medium'
-    else:
-        analysis['complexity'] = 'low'
-
-    return analysis
+    return analyze_query(query).complexity_analysis()
 
 def enhance_response_with_context(response: dict, context_data: dict, query: str) -> dict:
     """Enhance response with relevant contextual information"""
@@ -48,21 +45,116 @@ def enhance_response_with_context(response: dict, context_data: dict, query: str
 
     return response
 
-def route_query(query: str, role: str, faqs, emails, tickets, action_config, user_id=None):
-    """Enhanced router with smart context integration and better decision making"""
-    query_lower = query.lower()
+def _faq_lookup(query_lower, role):
+    return get_response_cache().get_or_compute("faq", query_lower, role, faq.match_faq, query_lower)
+
+def _email_lookup(query_lower, role, entities=None):
+    return get_response_cache().get_or_compute(
+        "email", query_lower, role, cm.fetch_relevant_email, query_lower, entities
+    )
+
+def _action_lookup(query_lower, role, features):
+    """Run the matched action; deterministic ones (filing status) go through the response cache."""
+    action_name = actions.resolve_action(role, features)
+    if action_name not in CACHED_ACTIONS:
+        return actions.handle_action(query_lower, role, features)
+    result = get_response_cache().get_or_compute(
+        action_name, query_lower, role, actions.handle_action, query_lower, role, features
+    )
+    if result:
+        result["execution_time"] = datetime.now().strftime("%H:%M:%S")
+    return result
+
+def _faq_gate(features) -> bool:
+    return features.question_words > 0 or features.has_any("faq")
+
+def _email_gate(features) -> bool:
+    return features.has_any("email")
+
+def _context_summary(user_id):
+    try:
+        return cm.get_context_summary(user_id)
+    except Exception:
+        return {}
 
-    query_analysis = analyze_query_complexity(query)
+def _relevant_context(user_id, query, entities=None):
+    try:
+        return cm.get_relevant_context(user_id, query, entities=entities)
+    except Exception:
+        return []
+
+async def route_query_async(query: str, role: str, faqs, emails, tickets, action_config, user_id=None,
+                            entities=None):
+    """Async router: independent lookups run concurrently, then the usual priority order picks the answer.
+
+    The context summary, relevant-context scoring and the FAQ and email
+    candidates (each only when its routing gate holds) are fetched in worker
+    threads at the same time, since each is dominated by blocking file I/O.
+    Entities are extracted once (or passed in by the caller, who can reuse
+    them when saving the turn) and shared by every lookup.  Each stage is
+    timed; the timings go into the trace entry and the latency histograms.
+    """
+    timer = StageTimer()
+    query_lower = query.lower()
+    with timer.stage("analysis"):
+        features = analyze_query(query)
+        if entities is None:
+            entities = extract_entities(query)
+    loop = asyncio.get_running_loop()
 
-    context_data = {}
+    lookups = {}
     if user_id:
-        try:
-            context_data = cm.get_context_summary(user_id)
-            relevant_context = cm.get_relevant_context(user_id, query)
-        except Exception:
-            relevant_context = []
-    else:
-        relevant_context = []
+        lookups["context_data"] = loop.run_in_executor(
+            _LOOKUP_EXECUTOR, timer.timed("context_summary", _context_summary), user_id)
+        lookups["relevant_context"] = loop.run_in_executor(
+            _LOOKUP_EXECUTOR, timer.timed("relevant_context", _relevant_context), user_id, query, entities)
+    if _faq_gate(features):
+        lookups["faq"] = loop.run_in_executor(
+            _LOOKUP_EXECUTOR, timer.timed("faq", _faq_lookup), query_lower, role)
+    if _email_gate(features):
+        lookups["email"] = loop.run_in_executor(
+            _LOOKUP_EXECUTOR, timer.timed("email", _email_lookup), query_lower, role, entities)
+
+    results = await asyncio.gather(*lookups.values(), return_exceptions=True)
+    candidates = dict(zip(lookups, results))
+
+    context_data = candidates.pop("context_data", {})
+    relevant_context = candidates.pop("relevant_context", [])
+    return _route(query, role, features, entities, context_data, relevant_context, candidates, user_id, timer)
+
+def route_query(query: str, role: str, faqs, emails, tickets, action_config, user_id=None, entities=None):
+    """Enhanced router with smart context integration and better decision making"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(route_query_async(query, role, faqs, emails, tickets, action_config, user_id, entities))
+
+    # Already inside an event loop (asyncio.run cannot nest): look things up in turn
+    timer = StageTimer()
+    with timer.stage("analysis"):
+        features = analyze_query(query)
+        if entities is None:
+            entities = extract_entities(query)
+    with timer.stage("context_summary"):
+        context_data = _context_summary(user_id) if user_id else {}
+    with timer.stage("relevant_context"):
+        relevant_context = _relevant_context(user_id, query, entities) if user_id else []
+    return _route(query, role, features, entities, context_data, relevant_context, {}, user_id, timer)
+
+def _candidate(candidates: dict, name: str, lookup, *args):
+    """A prefetched lookup result, or run the lookup now if it was not prefetched."""
+    if name not in candidates:
+        return lookup(*args)
+    result = candidates[name]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def _route(query, role, features, entities, context_data, relevant_context, candidates, user_id, timer=None):
+    """Apply the priority order FAQ → email → support → actions → context → fallback."""
+    timer = timer or StageTimer()
+    query_lower = query.lower()
+    query_analysis = features.complexity_analysis()
 
     response = None
     trace_info = ""
@@ -70,8 +162,9 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
 
     try:
         # 1. FAQ handling
-        if query_analysis['question_words'] > 0 or any(word in query_lower for word in ["why", "how", "what", "explain"]):
-            faq_answer = faq.match_faq(query_lower)
+        if _faq_gate(features):
+            with timer.stage("faq"):
+                faq_answer = _candidate(candidates, "faq", _faq_lookup, query_lower, role)
             if faq_answer:
                 response = {"text": faq_answer}
                 trace_info = "FAQ Module"
@@ -87,24 +180,31 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
                     confidence_score = 0.95
 
         # 2. Email/notification queries
-        if not response and any(
-            phrase in query_lower
-            for phrase in ["email", "notification", "alert", "status update", "reminder"]
-        ):
-            email_response = cm.fetch_relevant_email(query_lower)
+        if not response and _email_gate(features):
+            with timer.stage("email"):
+                email_response = _candidate(candidates, "email", _email_lookup, query_lower, role, entities)
             if email_response:
                 response = {"text": email_response}
                 trace_info = "Enhanced Email Module"
                 confidence_score = 0.85  # bumped slightly
 
         # 3. Support tickets
-        if not response and ("ticket" in query_lower or "support" in query_lower):
-            if "create" in query_lower or "raise" in query_lower:
+        if not response and features.has_any("support"):
+            if features.has_any("ticket_create") and not is_action_allowed(role, "raise_ticket"):
+                response = {
+                    "text": f"🔒 Your role ({role}) can view tickets but not create them. Please ask a Manager or Admin to raise this ticket.",
+                    "actions": ["Checked ticket permissions"]
+                }
+                trace_info = "Enhanced Support Module (Denied)"
+                confidence_score = 0.9
+
+            elif features.has_any("ticket_create"):
                 priority = "medium"
                 if context_data.get('average_satisfaction', 1.0) < 0.5:
                     priority = "high"
 
-                ticket_id = support.create_ticket(summary=query)
+                with timer.stage("support"):
+                    ticket_id = support.create_ticket(summary=query, priority=priority)
                 response_text = f"✅ Ticket {ticket_id} created with {priority} priority for: {query}"
 
                 if context_data.get('open_tickets'):
@@ -118,8 +218,9 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
                 trace_info = "Enhanced Support Module (Create)"
                 confidence_score = 0.95
 
-            elif "status" in query_lower or "track" in query_lower:
-                ticket_status = support.track_ticket(query_lower)
+            elif features.has_any("ticket_track"):
+                with timer.stage("support"):
+                    ticket_status = support.track_ticket(query_lower)
 
                 if context_data.get('open_tickets'):
                     ticket_status += f"\n\nYour other open tickets:"
@@ -135,7 +236,8 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
 
         # 4. Actions
         if not response:
-            action_result = actions.handle_action(query_lower, role)
+            with timer.stage("actions"):
+                action_result = _action_lookup(query_lower, role, features)
             if action_result:
                 response = action_result
                 trace_info = "Enhanced Actions Module"
@@ -147,8 +249,7 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
         # 5. Context follow-up
         if not response and user_id and relevant_context:
             best_context = relevant_context[0]
-            followup_indicators = ["why", "how", "more details", "explain", "what about", "also"]
-            if any(indicator in query_lower for indicator in followup_indicators):
+            if features.has_any("followup"):
                 context_msg = f"Based on our previous discussion about '{best_context['query'][:50]}...':\n\n"
                 context_msg += f"**Previous context**: {best_context['response'][:150]}...\n\n"
                 context_msg += "**For your current question**: Let me provide more specific information."
@@ -210,11 +311,13 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
 
         # Add context + trace
         if response and context_data:
-            response = enhance_response_with_context(response, context_data, query)
+            with timer.stage("enhancement"):
+                response = enhance_response_with_context(response, context_data, query)
             response["confidence_score"] = confidence_score
             response["query_analysis"] = query_analysis
 
         trace_data = {
+            "role": role,
             "confidence": confidence_score,
             "complexity": query_analysis['complexity'],
             "context_used": bool(relevant_context),
@@ -223,8 +326,15 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
                 "common_intent": context_data.get('most_common_intent', 'unknown')
             } if context_data else {}
         }
-
-        trace_logger.log_trace(query, response, trace_info, trace_data)
+        if isinstance(response, dict) and "report_cache" in response:
+            trace_data["report_cache"] = response["report_cache"]
+
+        # The entry carries every stage up to here; its own write is only in the histograms
+        trace_data["stage_timings"] = timer.as_ms()
+        trace_data["execution_time"] = trace_data["stage_timings"]["total"]
+        with timer.stage("trace_write"):
+            trace_logger.log_trace(query, response, trace_info, trace_data)
+        record_timer(timer, trace_info, role)
         return response, trace_info
 
     except Exception as e:
@@ -233,7 +343,11 @@ def route_query(query: str, role: str, faqs, emails, tickets, action_config, use
             "error": True,
             "confidence_score": 0.1
         }
-        trace_logger.log_trace(query, error_response, "Error Handler")
+        stage_timings = timer.as_ms()
+        trace_logger.log_trace(query, error_response, "Error Handler",
+                               {"role": role, "stage_timings": stage_timings,
+                                "execution_time": stage_timings["total"]})
+        record_timer(timer, "Error Handler", role)
         return error_response, "Error Handler"
 
 def explain_failure_reasons(query: str, failed_items: list) -> str:
@@ -1,34 +1,31 @@
-import json
-import os
-from datetime import datetime
+import re
 
-TICKET_PATH = os.path.join("data", "tickets.json")
+from core.ticket_store import get_ticket_store
 
-def create_ticket(summary):
-    with open(TICKET_PATH, "r") as f:
-        tickets = json.load(f)
+TICKET_ID_PATTERN = re.compile(r"\bTCK-\d+\b", re.IGNORECASE)
 
-    new_id = f"TCK-{len(tickets)+101}"
-    new_ticket = {
-        "ticket_id": new_id,
-        "summary": summary,
-        "status": "open",
-        "priority": "medium",
-        "created_at": str(datetime.now().date()),
-        "updated_at": str(datetime.now().date()),
-        "assigned_to": "Support Team"
-    }
+def create_ticket(summary, priority="medium"):
+    # ID allocation and persistence are atomic inside the store
+    return get_ticket_store().create(summary, priority=priority)["ticket_id"]
 
-    tickets.append(new_ticket)
-    with open(TICKET_PATH, "w") as f:
-        json.dump(tickets, f, indent=2)
+def track_ticket(query):
+    # Every referenced ID in one regex pass, deduplicated in order of mention
+    ticket_ids = list(dict.fromkeys(m.upper() for m in TICKET_ID_PATTERN.findall(query)))
+    if not ticket_ids:
+        return "No matching ticket found."
 
-    return new_id
+    found = {t["ticket_id"]: t for t in get_ticket_store().get_many(ticket_ids)}
+    if len(ticket_ids) == 1:
+        ticket = found.get(ticket_ids[0])
+        if ticket:
+            return f"🎫 Ticket {ticket['ticket_id']} is {ticket['status']} (Priority: {ticket['priority']})."
+        return "No matching ticket found."
 
-def track_ticket(query):
-    with open(TICKET_PATH, "r") as f:
-        tickets = json.load(f)
-    for t in tickets:
-        if t["ticket_id"].lower() in query:
-            return f"🎫 Ticket {t['ticket_id']} is {t['status']} (Priority: {t['priority']})."
-    return "No matching ticket found."
+    lines = [f"🎫 Status for {len(ticket_ids)} tickets:"]
+    for ticket_id in ticket_ids:
+        ticket = found.get(ticket_id)
+        if ticket:
+            lines.append(f"• {ticket_id}: {ticket['status']} (Priority: {ticket['priority']})")
+        else:
+            lines.append(f"• {ticket_id}: not found")
+    return "\n".join(lines)
@@ -0,0 +1,259 @@
+"""Indexed ticket repository with append-only persistence.
+
+Tickets used to live in one JSON array that was loaded and rewritten on every
+creation, with IDs derived from the array length (two concurrent creations
+got the same ID).  Here every create or update appends the full ticket as one
+JSON line to ``data/tickets.jsonl``; replaying the file (last line per ID
+wins) rebuilds the state.  In memory the store keeps a hash map by ticket_id
+plus secondary indexes by status, priority and assignee, so lookups and
+filters never scan the whole ticket list.
+
+Writers hold an exclusive ``flock`` and catch up with lines appended by other
+processes before allocating the next ID, so IDs stay unique and monotonic
+across Streamlit workers.
+"""
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+TICKET_LOG_PATH = os.path.join("data", "tickets.jsonl")
+
+# Legacy single-file tickets, imported once when the log does not exist yet
+LEGACY_TICKET_PATH = os.path.join("data", "tickets.json")
+
+TICKET_PREFIX = "TCK-"
+FIRST_TICKET_NUMBER = 101
+RELOAD_CHECK_SECONDS = 1.0
+
+# Ticket fields with a secondary index (field -> index name)
+INDEXED_FIELDS = {"status": "status", "priority": "priority", "assigned_to": "assignee"}
+
+_TICKET_NUMBER_RE = re.compile(r"^TCK-(\d+)$", re.IGNORECASE)
+
+
+def _load_legacy_tickets(path: str) -> List[Dict[str, Any]]:
+    try:
+        with open(path, "r") as f:
+            tickets = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return tickets if isinstance(tickets, list) else []
+
+
+class TicketStore:
+    """Ticket map plus status/priority/assignee indexes over an append-only JSONL log."""
+
+    def __init__(self, path: str = TICKET_LOG_PATH, legacy_path: Optional[str] = LEGACY_TICKET_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._tickets: Dict[str, Dict[str, Any]] = {}
+        # value -> ticket IDs; dicts double as insertion-ordered sets
+        self._indexes: Dict[str, Dict[str, Dict[str, None]]] = {name: {} for name in INDEXED_FIELDS.values()}
+        self._position = 0
+        self._last_number = FIRST_TICKET_NUMBER - 1
+        self._last_check = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if legacy_path and not os.path.exists(path):
+            self._import_legacy(legacy_path)
+        self._refresh(force=True)
+
+    # --- Persistence ---
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize writers across threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _import_legacy(self, legacy_path: str) -> None:
+        tickets = _load_legacy_tickets(legacy_path)
+        with self._exclusive():
+            if os.path.exists(self.path):
+                return  # another process migrated first
+            tmp_path = f"{self.path}.tmp-{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                for ticket in tickets:
+                    f.write(json.dumps(ticket) + "\n")
+            os.replace(tmp_path, self.path)
+
+    def _append(self, ticket: Dict[str, Any]) -> None:
+        # Called under _exclusive() after _refresh(), so our position is the end of the file
+        line = (json.dumps(ticket) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(line)
+        self._position += len(line)
+        self._apply(ticket)
+
+    def _refresh(self, force: bool = False) -> None:
+        """Apply lines appended since the last call (by any process)."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_check < RELOAD_CHECK_SECONDS:
+                return
+            self._last_check = now
+            try:
+                if os.path.getsize(self.path) <= self._position:
+                    return
+                with open(self.path, "rb") as f:
+                    f.seek(self._position)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break  # partially written line; pick it up next time
+                        self._position += len(line)
+                        if line.strip():
+                            self._apply(json.loads(line))
+            except FileNotFoundError:
+                return
+
+    def _apply(self, ticket: Dict[str, Any]) -> None:
+        ticket_id = ticket["ticket_id"]
+        previous = self._tickets.get(ticket_id)
+        for field, name in INDEXED_FIELDS.items():
+            index = self._indexes[name]
+            if previous is not None:
+                index.get(previous.get(field), {}).pop(ticket_id, None)
+            index.setdefault(ticket.get(field), {})[ticket_id] = None
+        self._tickets[ticket_id] = ticket
+
+        match = _TICKET_NUMBER_RE.match(ticket_id)
+        if match:
+            self._last_number = max(self._last_number, int(match.group(1)))
+
+    # --- Writes ---
+
+    def create(self, summary: str, priority: str = "medium", status: str = "open",
+               assigned_to: str = "Support Team") -> Dict[str, Any]:
+        """Allocate the next ticket ID and persist the new ticket."""
+        today = str(datetime.now().date())
+        with self._exclusive():
+            self._refresh(force=True)
+            ticket = {
+                "ticket_id": f"{TICKET_PREFIX}{self._last_number + 1}",
+                "summary": summary,
+                "status": status,
+                "priority": priority,
+                "created_at": today,
+                "updated_at": today,
+                "assigned_to": assigned_to,
+            }
+            self._append(ticket)
+        return dict(ticket)
+
+    def update(self, ticket_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Persist changed fields of an existing ticket; returns the updated ticket."""
+        with self._exclusive():
+            self._refresh(force=True)
+            current = self._tickets.get(ticket_id.upper())
+            if current is None:
+                return None
+            ticket = dict(current, **fields, updated_at=str(datetime.now().date()))
+            self._append(ticket)
+        return dict(ticket)
+
+    # --- Reads ---
+
+    def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        self._refresh()
+        ticket = self._tickets.get(ticket_id.upper())
+        return dict(ticket) if ticket else None
+
+    def get_many(self, ticket_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Resolve several IDs at once, in the order given; unknown IDs are skipped."""
+        self._refresh()
+        with self._lock:
+            found = (self._tickets.get(ticket_id.upper()) for ticket_id in ticket_ids)
+            return [dict(ticket) for ticket in found if ticket]
+
+    def _matching_ids(self, ticket_ids: Optional[Iterable[str]] = None, **filters) -> List[str]:
+        """IDs satisfying every filter, in creation order.
+
+        Each filter names an index (status, priority, assignee) and takes a
+        single value or a collection of accepted values.
+        """
+        with self._lock:
+            candidate_sets = []
+            for name, wanted in filters.items():
+                if wanted is None:
+                    continue
+                index = self._indexes[name]
+                values = [wanted] if isinstance(wanted, str) else list(wanted)
+                ids = set()
+                for value in values:
+                    ids.update(index.get(value, ()))
+                candidate_sets.append(ids)
+            if ticket_ids is not None:
+                candidate_sets.append(set(ticket_ids))
+
+            if not candidate_sets:
+                return list(self._tickets)
+            candidate_sets.sort(key=len)
+            matched = set.intersection(*candidate_sets)
+            # Small results are sorted by position; large ones keep the map's order directly
+            if len(matched) * 4 < len(self._tickets):
+                order = {ticket_id: i for i, ticket_id in enumerate(self._tickets)}
+                return sorted(matched, key=order.__getitem__)
+            return [ticket_id for ticket_id in self._tickets if ticket_id in matched]
+
+    def query(self, status=None, priority=None, assignee=None) -> List[Dict[str, Any]]:
+        """Tickets matching the given index filters, oldest first."""
+        self._refresh()
+        ids = self._matching_ids(status=status, priority=priority, assignee=assignee)
+        with self._lock:
+            return [dict(self._tickets[ticket_id]) for ticket_id in ids]
+
+    def count(self, ticket_ids: Optional[Iterable[str]] = None, status=None, priority=None, assignee=None) -> int:
+        """Number of tickets matching the filters, optionally within ``ticket_ids``."""
+        self._refresh()
+        filters = {"status": status, "priority": priority, "assignee": assignee}
+        if ticket_ids is None and sum(v is not None for v in filters.values()) == 1:
+            name, wanted = next((k, v) for k, v in filters.items() if v is not None)
+            if isinstance(wanted, str):
+                return len(self._indexes[name].get(wanted, ()))
+        return len(self._matching_ids(ticket_ids, **filters))
+
+    def values(self, index: str) -> List[str]:
+        """Distinct values present in one secondary index (e.g. every assignee)."""
+        self._refresh()
+        with self._lock:
+            return [value for value, ids in self._indexes[index].items() if ids and value is not None]
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self.query()
+
+    def __len__(self) -> int:
+        self._refresh()
+        return len(self._tickets)
+
+
+_store: Optional[TicketStore] = None
+_store_lock = threading.Lock()
+
+
+def get_ticket_store() -> TicketStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TicketStore()
+    return _store
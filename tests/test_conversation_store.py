@@ -0,0 +1,48 @@
+import os
+
+from core.conversation_store import SegmentedLogStore
+
+
+def _entry(user_id, i):
+    return {"timestamp": f"2025-01-01T00:00:{i:06d}", "query": f"{user_id} question {i}", "response": "x" * 40}
+
+
+def _index_lines(directory):
+    total = 0
+    for name in os.listdir(directory):
+        if name.endswith(".idx"):
+            with open(os.path.join(directory, name), "rb") as f:
+                total += sum(1 for _ in f)
+    return total
+
+
+def test_rollover_compacts_entries_past_retention(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # no legacy history file to import
+    tmp_path = tmp_path / "conversations"
+    store = SegmentedLogStore(str(tmp_path), retention=5, segment_max_bytes=2048)
+    for i in range(500):
+        for user_id in ("alice", "bob"):
+            store.append(user_id, _entry(user_id, i))
+
+    # Index lines (replayed on open) and segments track retained history, not all 1000 writes
+    assert _index_lines(str(tmp_path)) <= 2 * 5 * (1 + store.compact_dead_ratio) + 2048 // 80
+    assert len([n for n in os.listdir(str(tmp_path)) if n.endswith(".jsonl") and n.startswith("segment-")]) <= 3
+
+    expected = [_entry("alice", i) for i in range(495, 500)]
+    assert store.tail("alice") == expected
+    assert store.tail("bob", 2) == [_entry("bob", i) for i in range(498, 500)]
+
+    reopened = SegmentedLogStore(str(tmp_path), retention=5, segment_max_bytes=2048)
+    assert reopened.tail("alice") == expected
+    assert sorted(reopened.user_ids()) == ["alice", "bob"]
+
+
+def test_no_compaction_while_history_is_within_retention(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tmp_path = tmp_path / "conversations"
+    store = SegmentedLogStore(str(tmp_path), retention=1000, segment_max_bytes=2048)
+    for i in range(100):
+        store.append("alice", _entry("alice", i))
+
+    assert _index_lines(str(tmp_path)) == 100
+    assert store.tail("alice") == [_entry("alice", i) for i in range(100)]
@@ -0,0 +1,130 @@
+from datetime import date
+
+import pandas as pd
+
+from core.reconciliation import (BOOKS_COLUMNS, GSTR2A_COLUMNS, GSTRReconciler, get_reconciler,
+                                 normalize_ledger)
+
+GSTIN = "27AABCI1234F1Z5"
+AS_OF = date(2025, 1, 1)
+
+BOOKS_HEADER = ["gstin", "invoice_no", "vendor", "date", "amount"]
+GSTR2A_HEADER = ["gstin", "invoice_no", "supplier_name", "date", "taxable_value"]
+
+
+def _books(rows):
+    return normalize_ledger(pd.DataFrame(rows, columns=BOOKS_HEADER), BOOKS_COLUMNS)
+
+
+def _gstr2a(rows):
+    return normalize_ledger(pd.DataFrame(rows, columns=GSTR2A_HEADER), GSTR2A_COLUMNS)
+
+
+def _reconcile(books, gstr2a, period=None):
+    return GSTRReconciler(_books(books), _gstr2a(gstr2a), as_of=AS_OF).reconcile(period)
+
+
+def test_rows_are_classified_by_amount_and_date_tolerance():
+    result = _reconcile(
+        [
+            [GSTIN, "INV-001", "IndiSky", "2024-12-02", 1000.0],
+            [GSTIN, "INV-002", "IndiSky", "2024-12-03", 2000.0],   # amount off by 500
+            [GSTIN, "INV-003", "IndiSky", "2024-12-04", 3000.0],   # dated 10 days apart
+            [GSTIN, "INV-004", "IndiSky", "2024-12-05", 4000.0],   # never reported by the supplier
+            [GSTIN, "INV/2024/05", "IndiSky", "2024-12-06", 5000.0],
+        ],
+        [
+            [GSTIN, "INV-001", "IndiSky", "2024-12-04", 1000.4],   # within the date and rupee bands
+            [GSTIN, "INV-002", "IndiSky", "2024-12-03", 2500.0],
+            [GSTIN, "INV-003", "IndiSky", "2024-12-14", 3000.0],
+            [GSTIN, "inv-2024-05", "IndiSky", "2024-12-06", 5000.0],
+            [GSTIN, "INV-006", "IndiSky", "2024-12-07", 6000.0],   # not in our books
+        ],
+    )
+
+    assert result["total_invoices"] == 5
+    assert result["matched"] == 2
+    assert result["mismatched"] == 2
+    assert result["missing_gstr2a"] == 1
+    assert result["missing_in_books"] == 1
+    assert result["date_mismatches"] == 1
+    assert result["amount_discrepancies"] == [
+        {"invoice_id": "INV-002", "our_amount": 2000, "gstr2a_amount": 2500, "difference": 500}
+    ]
+    assert result["missing_invoices"] == [{"invoice_id": "INV-004", "vendor": "IndiSky", "amount": 4000}]
+    assert result["unrecorded_invoices"] == [{"invoice_id": "INV-006", "vendor": "IndiSky", "amount": 6000}]
+
+
+def test_duplicate_keys_are_summed_before_the_join():
+    result = _reconcile(
+        [
+            # One invoice booked as two tax-rate lines
+            [GSTIN, "INV-001", "IndiSky", "2024-12-02", 600.0],
+            [GSTIN, "INV-001", "IndiSky", "2024-12-02", 400.0],
+            [GSTIN, "INV-002", "IndiSky", "2024-12-03", 2000.0],
+        ],
+        [
+            [GSTIN, "INV-001", "IndiSky", "2024-12-02", 1000.0],
+            # Reported twice by the supplier, so its total no longer agrees
+            [GSTIN, "INV-002", "IndiSky", "2024-12-03", 2000.0],
+            [GSTIN, "INV-002", "IndiSky", "2024-12-03", 2000.0],
+        ],
+    )
+
+    # Two invoices, each counted once rather than once per pairing of duplicate rows
+    assert result["total_invoices"] == 2
+    assert result["matched"] == 1
+    assert result["mismatched"] == 1
+    assert result["amount_discrepancies"] == [
+        {"invoice_id": "INV-002", "our_amount": 2000, "gstr2a_amount": 4000, "difference": 2000}
+    ]
+
+
+def _write_ledgers(tmp_path):
+    books_path, gstr2a_path = tmp_path / "purchase_register.csv", tmp_path / "gstr2a.csv"
+    pd.DataFrame([
+        [GSTIN, "INV-011", "IndiSky", "2024-11-10", 1100.0],
+        [GSTIN, "INV-012", "IndiSky", "2024-11-20", 1200.0],
+        [GSTIN, "INV-121", "IndiSky", "2024-12-01", 2100.0],
+        [GSTIN, "INV-122", "IndiSky", "2024-12-15", 2200.0],
+    ], columns=BOOKS_HEADER).to_csv(books_path, index=False)
+    pd.DataFrame([
+        [GSTIN, "INV-011", "IndiSky", "2024-11-10", 1100.0],
+        [GSTIN, "INV-121", "IndiSky", "2024-11-29", 2100.0],   # supplier dated it across the month edge
+        [GSTIN, "INV-122", "IndiSky", "2024-12-15", 2200.0],
+        [GSTIN, "INV-013", "IndiSky", "2024-11-30", 1300.0],   # November, not ours
+    ], columns=GSTR2A_HEADER).to_csv(gstr2a_path, index=False)
+    return str(books_path), str(gstr2a_path)
+
+
+def test_get_reconciler_loads_only_the_requested_period(tmp_path, monkeypatch):
+    monkeypatch.setenv("FINKRAFT_AS_OF", AS_OF.isoformat())
+    books_path, gstr2a_path = _write_ledgers(tmp_path)
+
+    reconciler = get_reconciler("last_month", books_path, gstr2a_path)
+    assert sorted(reconciler.books["invoice_no"]) == ["INV-121", "INV-122"]
+
+    result = reconciler.reconcile("last_month")
+    assert result["total_invoices"] == 2
+    assert result["matched"] == 2
+    assert result["missing_in_books"] == 0
+
+    november = get_reconciler("november 2024", books_path, gstr2a_path).reconcile("november 2024")
+    assert november["total_invoices"] == 2
+    assert november["matched"] == 1
+    assert november["missing_gstr2a"] == 1
+    assert november["unrecorded_invoices"] == [{"invoice_id": "INV-013", "vendor": "IndiSky", "amount": 1300}]
+
+    everything = get_reconciler(None, books_path, gstr2a_path).reconcile()
+    assert everything["total_invoices"] == 4
+
+
+def test_relative_periods_follow_the_reference_date(tmp_path, monkeypatch):
+    books_path, gstr2a_path = _write_ledgers(tmp_path)
+
+    monkeypatch.setenv("FINKRAFT_AS_OF", "2024-12-10")
+    assert get_reconciler("last_month", books_path, gstr2a_path).reconcile("last_month")["total_invoices"] == 2
+    assert get_reconciler("this_month", books_path, gstr2a_path).reconcile("this_month")["total_invoices"] == 2
+
+    monkeypatch.setenv("FINKRAFT_AS_OF", "2025-03-01")
+    assert get_reconciler("last_month", books_path, gstr2a_path).reconcile("last_month")["total_invoices"] == 0
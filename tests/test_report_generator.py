@@ -0,0 +1,97 @@
+import csv
+import os
+
+import pandas as pd
+
+from core import actions
+from core.report_generator import ReportJob, ReportJobRegistry, generate_report, latest_register_month
+
+REGISTER_ROWS = [
+    ["27AABCI1234F1Z5", "INV-011", "IndiSky", "2024-11-10", 1100.0],
+    ["27AABCI1234F1Z5", "INV-012", "IndiSky", "2024-11-20", 1200.0],
+    ["27AABCI1234F1Z5", "INV-121", "IndiSky", "2024-12-01", 2100.0],
+    ["07AADCD9012M1Z8", "INV-122", "DataFlow", "2024-12-15", 2200.0],
+    ["07AADCD9012M1Z8", "INV-123", "DataFlow", "2024-12-31", 2300.0],
+]
+
+
+def _write_register(path, rows=REGISTER_ROWS):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame(rows, columns=["gstin", "invoice_no", "vendor", "date", "amount"]).to_csv(path, index=False)
+
+
+def _report(tmp_path, period):
+    register = str(tmp_path / "purchase_register.csv")
+    _write_register(register)
+    job = generate_report(ReportJob(report_id="RPT-TEST", period=period, fmt="csv"),
+                          register, str(tmp_path / "reports"))
+    assert job.status == "completed", job.error
+    return job
+
+
+def _csv_invoice_numbers(path):
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    return [row[1] for row in rows[1:] if len(row) == 5]
+
+
+def test_report_contains_only_the_period_rows(tmp_path):
+    job = _report(tmp_path, "december 2024")
+
+    assert job.rows_total == 5
+    assert job.row_count == 3
+    assert job.total_amount == 6600.0
+    assert _csv_invoice_numbers(job.file_path) == ["INV-121", "INV-122", "INV-123"]
+
+
+def test_relative_periods_resolve_against_the_reference_date(tmp_path, monkeypatch):
+    monkeypatch.setenv("FINKRAFT_AS_OF", "2025-01-01")
+    assert _report(tmp_path, "last_month").row_count == 3
+    assert _report(tmp_path, "this_month").row_count == 0
+
+    monkeypatch.setenv("FINKRAFT_AS_OF", "2024-12-05")
+    assert _report(tmp_path, "last_month").row_count == 2
+
+
+def test_unrecognised_period_covers_the_whole_register(tmp_path):
+    assert _report(tmp_path, "whenever").row_count == 5
+
+
+def test_latest_register_month_follows_the_file(tmp_path):
+    register = str(tmp_path / "purchase_register.csv")
+    _write_register(register)
+    assert latest_register_month(register) == "december 2024"
+
+    _write_register(register, REGISTER_ROWS + [["27AABCI1234F1Z5", "INV-201", "IndiSky", "2025-02-03", 100.0]])
+    assert latest_register_month(register) == "february 2025"
+
+
+def test_cached_report_keeps_its_row_count(tmp_path):
+    register = str(tmp_path / "purchase_register.csv")
+    _write_register(register)
+    registry = ReportJobRegistry(workers=1, register_path=register, reports_dir=str(tmp_path / "reports"))
+    try:
+        first = registry.wait(registry.submit("Q4 2024", "csv").report_id, timeout=30)
+        assert first.status == "completed"
+        assert first.row_count == 5
+
+        second = registry.submit("q4-2024", "csv")
+        assert second.cached
+        assert second.row_count == 5
+        assert second.file_path == first.file_path
+    finally:
+        registry.close()
+
+
+def test_default_period_is_the_newest_register_month(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_register(os.path.join("data", "purchase_register.csv"))
+    pd.DataFrame(REGISTER_ROWS, columns=["gstin", "invoice_no", "supplier_name", "date", "taxable_value"]).to_csv(
+        os.path.join("data", "gstr2a.csv"), index=False)
+
+    assert actions._default_period() == "december 2024"
+    # The label and the reconciled rows come from the same period
+    response = actions.reconcile_invoices("reconcile invoices", "Admin", params={})
+    assert "**Period**: December 2024" in response["text"]
+    assert response["data"]["total_invoices"] == 3
+    assert response["data"]["matched"] == 3
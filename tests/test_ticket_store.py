@@ -0,0 +1,77 @@
+import json
+
+from core import ticket_store
+from core.ticket_store import TicketStore
+
+LEGACY_TICKETS = [
+    {"ticket_id": "TCK-101", "summary": "GSTR-2A mismatch", "status": "open", "priority": "high",
+     "created_at": "2024-12-01", "updated_at": "2024-12-01", "assigned_to": "Reconciliation Team"},
+    {"ticket_id": "TCK-102", "summary": "Missing invoice", "status": "resolved", "priority": "medium",
+     "created_at": "2024-12-02", "updated_at": "2024-12-03", "assigned_to": "Support Team"},
+    {"ticket_id": "TCK-104", "summary": "Filing delayed", "status": "open", "priority": "medium",
+     "created_at": "2024-12-04", "updated_at": "2024-12-04", "assigned_to": "Compliance Team"},
+]
+
+
+def _store(tmp_path, legacy=LEGACY_TICKETS):
+    legacy_path = tmp_path / "tickets.json"
+    legacy_path.write_text(json.dumps(legacy))
+    return TicketStore(str(tmp_path / "tickets.jsonl"), str(legacy_path))
+
+
+def _ids(tickets):
+    return [t["ticket_id"] for t in tickets]
+
+
+def test_indexes_are_built_from_the_imported_tickets(tmp_path):
+    store = _store(tmp_path)
+
+    assert len(store) == 3
+    assert _ids(store.query(status="open")) == ["TCK-101", "TCK-104"]
+    assert _ids(store.query(status="open", priority="medium")) == ["TCK-104"]
+    assert _ids(store.query(assignee=["Support Team", "Compliance Team"])) == ["TCK-102", "TCK-104"]
+    assert store.count(status="open") == 2
+    assert store.count(ticket_ids=["TCK-101", "TCK-102"], status="open") == 1
+    assert store.create("New issue")["ticket_id"] == "TCK-105"
+
+
+def test_updates_move_tickets_between_indexes_and_survive_a_replay(tmp_path):
+    store = _store(tmp_path)
+    store.update("tck-101", status="resolved", assigned_to="Support Team")
+    store.create("Portal down", priority="high")
+
+    for current in (store, TicketStore(str(tmp_path / "tickets.jsonl"), None)):
+        assert _ids(current.query(status="open")) == ["TCK-104", "TCK-105"]
+        assert _ids(current.query(status="resolved")) == ["TCK-101", "TCK-102"]
+        assert _ids(current.query(assignee="Reconciliation Team")) == []
+        assert _ids(current.query(priority="high")) == ["TCK-101", "TCK-105"]
+        assert "Reconciliation Team" not in current.values("assignee")
+        assert current.get("TCK-101")["status"] == "resolved"
+
+
+def test_stores_sharing_a_log_see_each_others_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ticket_store, "RELOAD_CHECK_SECONDS", 0.0)
+    first = _store(tmp_path)
+    second = TicketStore(str(tmp_path / "tickets.jsonl"), None)
+
+    created = [first.create("from first"), second.create("from second"), first.create("first again")]
+    # IDs stay unique and in order across writers
+    assert _ids(created) == ["TCK-105", "TCK-106", "TCK-107"]
+    assert _ids(first.query(status="open")) == _ids(second.query(status="open")) == \
+        ["TCK-101", "TCK-104", "TCK-105", "TCK-106", "TCK-107"]
+
+
+def test_partially_written_lines_are_applied_once_complete(tmp_path, monkeypatch):
+    monkeypatch.setattr(ticket_store, "RELOAD_CHECK_SECONDS", 0.0)
+    store = _store(tmp_path)
+    line = json.dumps(dict(LEGACY_TICKETS[0], ticket_id="TCK-200", status="closed")) + "\n"
+
+    with open(tmp_path / "tickets.jsonl", "a") as f:
+        f.write(line[:20])
+    assert store.get("TCK-200") is None
+
+    with open(tmp_path / "tickets.jsonl", "a") as f:
+        f.write(line[20:])
+    assert store.get("TCK-200")["status"] == "closed"
+    assert _ids(store.query(status="closed")) == ["TCK-200"]
+    assert store.create("after")["ticket_id"] == "TCK-201"
@@ -0,0 +1,420 @@
+"""In-process metrics registry: counters, gauges and log-linear histograms.
+
+The dashboards used to reload and iterate the trace log on every Streamlit
+rerun to count modules, average confidences and so on.  Instead, each trace
+updates a few metrics in O(1) when it is logged, and the dashboards read the
+registry.
+
+Metrics are identified by a name plus keyword labels (``module=``,
+``role=``, ``stage=``).  Histograms use HDR-style log-linear buckets: values
+below 32 get one bucket each, and every power of two above that is split
+into 16 linear sub-buckets.  Recording a value is a bit-length and a shift,
+and percentiles are within 1/16 (6.25%) of the true value.
+
+The registry is written to ``data/metrics_snapshot.json`` every
+``SNAPSHOT_INTERVAL_SECONDS`` while it has changes, and at shutdown.  It is
+reloaded from there on start, so the dashboards survive restarts.
+
+Several worker processes share that file.  A snapshot holds an exclusive
+``flock``, reads the file, adds in only what this process recorded since its
+previous snapshot (counter increments and histogram observations; gauges it
+set replace the stored value) and writes the result back.  The in-memory
+registry is then refreshed from the merged totals, so each worker's
+dashboards show every worker's traffic, and nothing is counted twice.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+METRICS_SNAPSHOT_PATH = os.path.join("data", "metrics_snapshot.json")
+SNAPSHOT_INTERVAL_SECONDS = 30.0
+SNAPSHOT_VERSION = 1
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Largest recordable value is 2**MAX_VALUE_BITS - 1 (ns: about 18 minutes)
+MAX_VALUE_BITS = 40
+BUCKET_COUNT = SUB_BUCKETS * (MAX_VALUE_BITS - SUB_BUCKET_BITS) + 2 * SUB_BUCKETS
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _bucket_index(value: int) -> int:
+    if value < 2 * SUB_BUCKETS:
+        return max(value, 0)
+    shift = min(value.bit_length(), MAX_VALUE_BITS) - SUB_BUCKET_BITS - 1
+    mantissa = min(value >> shift, 2 * SUB_BUCKETS - 1)
+    return SUB_BUCKETS * shift + mantissa
+
+
+def _bucket_upper(index: int) -> int:
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return ((mantissa + 1) << shift) - 1
+
+
+class LogLinearHistogram:
+    """Fixed-size bucket counts with count, sum, min and max."""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def record(self, value: int) -> None:
+        value = int(value)
+        self.counts[_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "LogLinearHistogram") -> None:
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        for attr, pick in (("min", min), ("max", max)):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                mine = getattr(self, attr)
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+
+    def percentile(self, pct: float) -> Optional[int]:
+        """Upper bound of the bucket holding the pct-th value, capped at the observed max."""
+        if not self.count:
+            return None
+        rank = max(1, -(-self.count * pct // 100))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(_bucket_upper(i), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": {str(i): c for i, c in enumerate(self.counts) if c},
+            "count": self.count, "total": self.total, "min": self.min, "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogLinearHistogram":
+        histogram = cls()
+        for i, c in data.get("buckets", {}).items():
+            histogram.counts[int(i)] = c
+        histogram.count = data.get("count", 0)
+        histogram.total = data.get("total", 0)
+        histogram.min = data.get("min")
+        histogram.max = data.get("max")
+        return histogram
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _matches(key: LabelKey, wanted: Dict[str, Any]) -> bool:
+    labels = dict(key)
+    return all(labels.get(k) == str(v) for k, v in wanted.items())
+
+
+class MetricsRegistry:
+    """Named, labelled counters, gauges and histograms with periodic disk snapshots."""
+
+    def __init__(self, path: Optional[str] = METRICS_SNAPSHOT_PATH,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL_SECONDS):
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, LogLinearHistogram]] = {}
+        # What this process recorded since its last snapshot, merged into the file on the next one
+        self._pending = self._empty_series()
+        self._snapshot_mtime: Optional[int] = None
+        self._dirty = False
+        self._closed = False
+        self.restored = False  # True once a snapshot has been loaded
+        self._wakeup = threading.Event()
+        self._snapshotter: Optional[threading.Thread] = None
+        if path:
+            self._load()
+
+    # --- Updates (O(1)) ---
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            for counters in (self._counters, self._pending["counters"]):
+                series = counters.setdefault(name, {})
+                series[key] = series.get(key, 0) + value
+            self._touch()
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+            self._pending["gauges"].setdefault(name, {})[key] = value
+            self._touch()
+
+    def observe(self, name: str, value: int, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            for histograms in (self._histograms, self._pending["histograms"]):
+                series = histograms.setdefault(name, {})
+                histogram = series.get(key)
+                if histogram is None:
+                    histogram = series[key] = LogLinearHistogram()
+                histogram.record(value)
+            self._touch()
+
+    def _touch(self) -> None:
+        self._dirty = True
+        if self._snapshotter is None and self.path and not self._closed:
+            self._snapshotter = threading.Thread(target=self._snapshot_loop, name="metrics-snapshot", daemon=True)
+            self._snapshotter.start()
+
+    # --- Reads ---
+
+    def counter(self, name: str, **labels) -> float:
+        """Sum of the counter over every series whose labels include ``labels``."""
+        with self._lock:
+            return sum(v for k, v in self._counters.get(name, {}).items() if _matches(k, labels))
+
+    def counter_by(self, name: str, label: str, **labels) -> Dict[str, float]:
+        """Counter totals grouped by one label."""
+        grouped: Dict[str, float] = {}
+        with self._lock:
+            for key, value in self._counters.get(name, {}).items():
+                if _matches(key, labels):
+                    group = dict(key).get(label)
+                    if group is not None:
+                        grouped[group] = grouped.get(group, 0) + value
+        return grouped
+
+    def gauge(self, name: str, default: Optional[float] = None, **labels) -> Optional[float]:
+        with self._lock:
+            return self._gauges.get(name, {}).get(_label_key(labels), default)
+
+    def histogram(self, name: str, **labels) -> LogLinearHistogram:
+        """Merged histogram of every series whose labels include ``labels``."""
+        merged = LogLinearHistogram()
+        with self._lock:
+            for key, histogram in self._histograms.get(name, {}).items():
+                if _matches(key, labels):
+                    merged.merge(histogram)
+        return merged
+
+    def histogram_by(self, name: str, label: str, **labels) -> Dict[str, LogLinearHistogram]:
+        grouped: Dict[str, LogLinearHistogram] = {}
+        with self._lock:
+            for key, histogram in self._histograms.get(name, {}).items():
+                if _matches(key, labels):
+                    group = dict(key).get(label)
+                    if group is not None:
+                        grouped.setdefault(group, LogLinearHistogram()).merge(histogram)
+        return grouped
+
+    # --- Persistence ---
+
+    @staticmethod
+    def _empty_series() -> Dict[str, Dict[str, Dict[LabelKey, Any]]]:
+        return {"counters": {}, "gauges": {}, "histograms": {}}
+
+    @staticmethod
+    def _merge_series(into: Dict[str, Dict[str, Dict[LabelKey, Any]]],
+                      delta: Dict[str, Dict[str, Dict[LabelKey, Any]]]) -> None:
+        """Add ``delta``'s counters and histograms to ``into``; its gauges replace the stored ones."""
+        for name, series in delta["counters"].items():
+            target = into["counters"].setdefault(name, {})
+            for key, value in series.items():
+                target[key] = target.get(key, 0) + value
+        for name, series in delta["gauges"].items():
+            into["gauges"].setdefault(name, {}).update(series)
+        for name, series in delta["histograms"].items():
+            target = into["histograms"].setdefault(name, {})
+            for key, histogram in series.items():
+                merged = target.get(key)
+                if merged is None:
+                    merged = target[key] = LogLinearHistogram()
+                merged.merge(histogram)
+
+    @contextmanager
+    def _exclusive(self):
+        """Serialize snapshot writers across processes."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_snapshot(self) -> Optional[Dict[str, Dict[str, Dict[LabelKey, Any]]]]:
+        """The stored totals, or None when there is no readable snapshot."""
+        try:
+            self._snapshot_mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != SNAPSHOT_VERSION:
+            return None
+
+        stored = self._empty_series()
+        for kind in ("counters", "gauges", "histograms"):
+            for name, labels, value in data.get(kind, []):
+                if kind == "histograms":
+                    value = LogLinearHistogram.from_dict(value)
+                stored[kind].setdefault(name, {})[_label_key(labels)] = value
+        return stored
+
+    def _write_snapshot(self, stored: Dict[str, Dict[str, Dict[LabelKey, Any]]]) -> bool:
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "counters": [[n, dict(k), v] for n, s in stored["counters"].items() for k, v in s.items()],
+            "gauges": [[n, dict(k), v] for n, s in stored["gauges"].items() for k, v in s.items()],
+            "histograms": [[n, dict(k), h.to_dict()] for n, s in stored["histograms"].items() for k, h in s.items()],
+        }
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-metrics-", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._snapshot_mtime = os.stat(self.path).st_mtime_ns
+            return True
+        except OSError as e:
+            print(f"⚠️ Error saving metrics snapshot: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def _refresh_view(self, stored: Dict[str, Dict[str, Dict[LabelKey, Any]]]) -> None:
+        """Make the readable registry the stored totals plus what is still pending (caller holds _lock)."""
+        view = self._empty_series()
+        self._merge_series(view, stored)
+        self._merge_series(view, self._pending)
+        self._counters, self._gauges, self._histograms = view["counters"], view["gauges"], view["histograms"]
+
+    def _load(self) -> None:
+        stored = self._read_snapshot()
+        if stored is None:
+            return
+        with self._lock:
+            self._refresh_view(stored)
+        self.restored = True
+
+    def _snapshot_locked(self) -> None:
+        # Caller holds _exclusive()
+        with self._lock:
+            if not self._dirty:
+                return
+            delta, self._pending = self._pending, self._empty_series()
+            self._dirty = False
+
+        stored = self._read_snapshot() or self._empty_series()
+        self._merge_series(stored, delta)
+        written = self._write_snapshot(stored)
+        with self._lock:
+            if not written:
+                # Keep the unsaved changes for the next attempt
+                self._merge_series(delta, self._pending)
+                self._pending = delta
+                self._dirty = True
+                return
+            self._refresh_view(stored)
+
+    def snapshot(self) -> None:
+        """Merge this process's changes since the last snapshot into the file on disk.
+
+        Without local changes the registry only reloads the file, if another
+        process has written it since.
+        """
+        if not self.path:
+            return
+        if not self._dirty:
+            try:
+                changed = os.stat(self.path).st_mtime_ns != self._snapshot_mtime
+            except OSError:
+                changed = False
+            if changed:
+                stored = self._read_snapshot()
+                if stored is not None:
+                    with self._lock:
+                        self._refresh_view(stored)
+            return
+        with self._exclusive():
+            self._snapshot_locked()
+
+    def seed(self, populate: Callable[["MetricsRegistry"], None]) -> None:
+        """Fill a registry that started without a snapshot via ``populate(self)`` and save it.
+
+        The check and the save happen under the snapshot lock, so when several
+        processes start together only the first one seeds; the others load
+        what it wrote.
+        """
+        if not self.path:
+            populate(self)
+            return
+        with self._exclusive():
+            stored = self._read_snapshot()
+            if stored is not None:
+                with self._lock:
+                    self._refresh_view(stored)
+                self.restored = True
+                return
+            populate(self)
+            self._snapshot_locked()
+
+    def _snapshot_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.snapshot_interval)
+            if self._closed:
+                break
+            self.snapshot()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+        self.snapshot()
+
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the process-wide registry, registering its shutdown snapshot."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+                atexit.register(_registry.close)
+    return _registry
@@ -0,0 +1,254 @@
+"""Background sampler of this process's resource usage.
+
+The System Health panel used to show fixed Memory/CPU/Uptime figures.  A
+``ResourceMonitor`` thread reads ``/proc/self/stat``, ``/proc/self/status``
+and ``/proc/loadavg`` every ``interval`` seconds.  Each reading (RSS, CPU
+time and utilisation, threads, open file descriptors, GC counters, load
+average) goes into a fixed-size ring buffer.  The panel draws growth trends
+from that buffer.
+
+``top_allocations`` reports the largest tracemalloc allocation sites.
+Tracing is only switched on when first asked for, because it slows every
+allocation down.
+
+On platforms without ``/proc``, the fields read from it are None and the
+rest of the sample is still filled in.
+"""
+import atexit
+import gc
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+SAMPLE_INTERVAL_SECONDS = float(os.environ.get("FINKRAFT_RESOURCE_SAMPLE_SECONDS", "5"))
+# One hour of history at the default interval
+RING_CAPACITY = 720
+TRACEMALLOC_FRAMES = 1
+
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+    PHYSICAL_MEMORY = PAGE_SIZE * os.sysconf("SC_PHYS_PAGES")
+except (AttributeError, ValueError, OSError):  # pragma: no cover - non-POSIX platforms
+    CLOCK_TICKS, PAGE_SIZE, PHYSICAL_MEMORY = 100, 4096, None
+
+
+@dataclass(frozen=True)
+class ResourceSample:
+    timestamp: float
+    rss_bytes: Optional[int]
+    vms_bytes: Optional[int]
+    peak_rss_bytes: Optional[int]
+    cpu_seconds: Optional[float]
+    cpu_percent: Optional[float]
+    threads: Optional[int]
+    open_fds: Optional[int]
+    gc_counts: Tuple[int, int, int]
+    gc_collections: Tuple[int, ...]
+    load_average: Optional[Tuple[float, float, float]]
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _read_stat() -> Dict[str, Any]:
+    """utime+stime, thread count, start time, vsize and RSS from /proc/self/stat."""
+    raw = _read("/proc/self/stat")
+    if not raw:
+        return {}
+    # The command name may contain spaces and parentheses; fields start after the last ')'
+    fields = raw[raw.rindex(")") + 2:].split()
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "threads": int(fields[17]),
+        "start_ticks": int(fields[19]),
+        "vms_bytes": int(fields[20]),
+        "rss_bytes": int(fields[21]) * PAGE_SIZE,
+    }
+
+
+def _read_status() -> Dict[str, int]:
+    """VmRSS, VmHWM and Threads from /proc/self/status (sizes in bytes)."""
+    raw = _read("/proc/self/status")
+    values: Dict[str, int] = {}
+    for line in (raw or "").splitlines():
+        key, _, rest = line.partition(":")
+        if key in ("VmRSS", "VmHWM", "Threads"):
+            parts = rest.split()
+            values[key] = int(parts[0]) * (1024 if len(parts) > 1 and parts[1] == "kB" else 1)
+    return values
+
+
+def _read_loadavg() -> Optional[Tuple[float, float, float]]:
+    raw = _read("/proc/loadavg")
+    if not raw:
+        return None
+    one, five, fifteen = raw.split()[:3]
+    return float(one), float(five), float(fifteen)
+
+
+def _count_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def process_uptime() -> Optional[float]:
+    """Seconds since this process started, from its start time and the system uptime."""
+    stat, uptime = _read_stat(), _read("/proc/uptime")
+    if not stat or not uptime:
+        return None
+    return float(uptime.split()[0]) - stat["start_ticks"] / CLOCK_TICKS
+
+
+class ResourceMonitor:
+    """Samples process resources on a daemon thread into a bounded ring buffer."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS, capacity: int = RING_CAPACITY):
+        self.interval = interval
+        self._samples: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._previous: Optional[Tuple[float, float]] = None  # (wall, cpu seconds)
+        self._started_at = time.time()
+
+    def sample(self) -> ResourceSample:
+        """Take one reading now and append it to the ring buffer."""
+        now, wall = time.time(), time.monotonic()
+        stat, status = _read_stat(), _read_status()
+
+        cpu_seconds = stat.get("cpu_seconds")
+        cpu_percent = None
+        with self._lock:
+            if cpu_seconds is not None:
+                if self._previous and wall > self._previous[0]:
+                    cpu_percent = round(100 * (cpu_seconds - self._previous[1]) / (wall - self._previous[0]), 1)
+                self._previous = (wall, cpu_seconds)
+
+            sample = ResourceSample(
+                timestamp=now,
+                rss_bytes=status.get("VmRSS", stat.get("rss_bytes")),
+                vms_bytes=stat.get("vms_bytes"),
+                peak_rss_bytes=status.get("VmHWM"),
+                cpu_seconds=cpu_seconds,
+                cpu_percent=cpu_percent,
+                threads=status.get("Threads", stat.get("threads")),
+                open_fds=_count_fds(),
+                gc_counts=gc.get_count(),
+                gc_collections=tuple(generation["collections"] for generation in gc.get_stats()),
+                load_average=_read_loadavg(),
+            )
+            self._samples.append(sample)
+        return sample
+
+    def start(self) -> None:
+        if self._thread is None:
+            self.sample()
+            self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"⚠️ Error sampling process resources: {str(e)}")
+
+    # --- Reads ---
+
+    def latest(self) -> Optional[ResourceSample]:
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Samples as dicts, oldest first."""
+        with self._lock:
+            samples = list(self._samples)
+        if limit is not None:
+            samples = samples[-limit:]
+        return [asdict(s) for s in samples]
+
+    def summary(self) -> Dict[str, Any]:
+        """Latest reading plus RSS growth over the buffered window, for the health panel."""
+        with self._lock:
+            first = self._samples[0] if self._samples else None
+            last = self._samples[-1] if self._samples else None
+        if last is None:
+            return {"available": False}
+
+        uptime = process_uptime()
+        rss_growth = None
+        if first is not None and first.rss_bytes is not None and last.rss_bytes is not None:
+            rss_growth = last.rss_bytes - first.rss_bytes
+        return {
+            "available": last.rss_bytes is not None,
+            "sampled_at": last.timestamp,
+            "rss_bytes": last.rss_bytes,
+            "peak_rss_bytes": last.peak_rss_bytes,
+            "memory_percent": round(100 * last.rss_bytes / PHYSICAL_MEMORY, 1)
+            if last.rss_bytes is not None and PHYSICAL_MEMORY else None,
+            "rss_growth_bytes": rss_growth,
+            "window_seconds": round(last.timestamp - first.timestamp, 1),
+            "cpu_percent": last.cpu_percent,
+            "cpu_seconds": last.cpu_seconds,
+            "threads": last.threads,
+            "open_fds": last.open_fds,
+            "gc_counts": last.gc_counts,
+            "gc_collections": last.gc_collections,
+            "load_average": last.load_average,
+            "uptime_seconds": uptime if uptime is not None else time.time() - self._started_at,
+        }
+
+
+def top_allocations(limit: int = 10) -> Dict[str, Any]:
+    """Largest allocation sites by size; starts tracemalloc on first call."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        return {"tracing": True, "started": True, "allocations": []}
+    statistics = tracemalloc.take_snapshot().statistics("lineno")[:limit]
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "started": False,
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "allocations": [
+            {"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in statistics
+        ],
+    }
+
+
+def stop_allocation_tracing() -> None:
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+_monitor: Optional[ResourceMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_resource_monitor() -> ResourceMonitor:
+    """Return the process-wide monitor, started on first use."""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = ResourceMonitor()
+                _monitor.start()
+                atexit.register(_monitor.stop)
+    return _monitor
@@ -1,3 +1,68 @@
-def get_allowed_actions(role, actions):
-    role = role.lower()
-    return [a for a in actions if role in [r.lower() for r in a["role_access"]]]
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping
+
+ACTION_CONFIG_PATH = os.path.join("config", "actions_config.json")
+RELOAD_CHECK_SECONDS = 1.0
+
+_config: List[Dict] = []
+_matrix: Mapping[str, FrozenSet[str]] = MappingProxyType({})
+_config_mtime = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+
+def build_permission_matrix(actions) -> Mapping[str, FrozenSet[str]]:
+    """Map each lowercased role to the frozenset of action names it may run."""
+    matrix: Dict[str, set] = {}
+    for action in actions:
+        for role in action.get("role_access", []):
+            matrix.setdefault(role.lower(), set()).add(action["name"])
+    return MappingProxyType({role: frozenset(names) for role, names in matrix.items()})
+
+
+def _refresh(path: str = ACTION_CONFIG_PATH) -> None:
+    """Rebuild the cached config and matrix if the config file changed."""
+    global _config, _matrix, _config_mtime, _last_check
+    now = time.monotonic()
+    if _config_mtime is not None and now - _last_check < RELOAD_CHECK_SECONDS:
+        return
+
+    with _lock:
+        _last_check = now
+        mtime = os.path.getmtime(path)
+        if mtime != _config_mtime:
+            with open(path, "r") as f:
+                config = json.load(f)
+            _config, _matrix = config, build_permission_matrix(config)
+            _config_mtime = mtime
+
+
+def get_action_config() -> List[Dict]:
+    """The parsed actions config, re-read only when its mtime changes."""
+    _refresh()
+    return _config
+
+
+def get_permission_matrix() -> Mapping[str, FrozenSet[str]]:
+    _refresh()
+    return _matrix
+
+
+def get_allowed_action_names(role) -> FrozenSet[str]:
+    return get_permission_matrix().get(role.lower(), frozenset())
+
+
+def is_action_allowed(role, action_name) -> bool:
+    """O(1) permission check against the shared role→actions matrix."""
+    return action_name in get_allowed_action_names(role)
+
+
+def get_allowed_actions(role, actions=None):
+    if actions is None:
+        actions = get_action_config()
+    allowed = get_allowed_action_names(role)
+    return [a for a in actions if a["name"] in allowed]
@@ -0,0 +1,87 @@
+"""Stage timers and latency histograms for the routing pipeline.
+
+A ``StageTimer`` is created per routed query.  Code blocks are wrapped in
+``with timer.stage("faq"):`` and their ``perf_counter_ns`` durations add up
+per stage name, so a stage entered twice (prefetched in a worker, then
+consumed) reports its total.  The timer's result goes into the trace entry.
+
+``record_timer`` folds a finished request into the metrics registry's
+latency histograms (per stage, and end-to-end per module and role), which
+the dashboard reads p50/p95/p99 from.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from utils.metrics import LogLinearHistogram, get_metrics
+
+PERCENTILES = (50, 95, 99)
+
+
+class StageTimer:
+    """Accumulates per-stage durations (ns) for one request."""
+
+    def __init__(self):
+        self.started_ns = time.perf_counter_ns()
+        self.stages: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration_ns: int) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0) + duration_ns
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - start)
+
+    def timed(self, name: str, fn: Callable) -> Callable:
+        """Wrap ``fn`` so each call is recorded under ``name`` (for executor lookups)."""
+        def run(*args):
+            with self.stage(name):
+                return fn(*args)
+        return run
+
+    @property
+    def elapsed_ns(self) -> int:
+        return time.perf_counter_ns() - self.started_ns
+
+    def as_ms(self) -> Dict[str, float]:
+        """Stage durations in milliseconds, plus the time since the timer started as ``total``."""
+        with self._lock:
+            timings = {name: round(ns / 1e6, 3) for name, ns in self.stages.items()}
+        timings["total"] = round(self.elapsed_ns / 1e6, 3)
+        return timings
+
+
+def record_timer(timer: StageTimer, module: Optional[str] = None, role: Optional[str] = None) -> None:
+    """Fold one request's stage durations, and its total per module and role, into the metrics registry."""
+    metrics = get_metrics()
+    with timer._lock:
+        stages = dict(timer.stages)
+    for name, duration_ns in stages.items():
+        metrics.observe("stage_latency_ns", duration_ns, stage=name)
+    metrics.observe("route_latency_ns", timer.elapsed_ns, module=module or "Unknown", role=role or "Unknown")
+
+
+def latency_stats(histogram: LogLinearHistogram) -> Optional[Dict[str, float]]:
+    """{count, mean_ms, p50_ms, p95_ms, p99_ms} of a nanosecond histogram; None if empty."""
+    if not histogram.count:
+        return None
+    stats = {"count": histogram.count, "mean_ms": round(histogram.mean / 1e6, 3)}
+    for pct in PERCENTILES:
+        stats[f"p{pct}_ms"] = round(histogram.percentile(pct) / 1e6, 3)
+    return stats
+
+
+def format_ms(ms: Optional[float]) -> str:
+    """Human-readable duration for the dashboard."""
+    if ms is None:
+        return "N/A"
+    if ms >= 1000:
+        return f"{ms / 1000:.2f}s"
+    return f"{ms:.1f}ms"
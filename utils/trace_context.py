@@ -0,0 +1,167 @@
+"""Where the current session's recent traces are kept.
+
+``log_trace`` used to append every entry to ``st.session_state`` directly.
+That tied the router to a running Streamlit script, and the per-session list
+grew without bound.  Traces now go to a ``TraceContext``:
+
+* ``RingBufferTraceContext``: the last ``capacity`` entries in process memory.
+  This is the default, for batch jobs, benchmarks and API workers.
+* ``StreamlitTraceContext``: the same bounded buffer, kept per browser session
+  in ``st.session_state``.  The app installs it at startup.  Streamlit is only
+  imported when it is constructed.
+* ``NullTraceContext``: keeps nothing, for workers that only need the
+  persistent trace sink and the metrics.
+
+The persistent log (``utils.trace_sink``) and the metrics registry are
+written by ``log_trace`` whichever context is installed.
+"""
+import os
+import threading
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+TRACE_CONTEXT_CAPACITY = int(os.environ.get("FINKRAFT_TRACE_CONTEXT_CAPACITY", "500"))
+SESSION_TRACE_KEY = "trace_logs"
+
+
+class TraceContext:
+    """Interface shared by all trace contexts."""
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return up to ``limit`` most recent entries, oldest first."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class NullTraceContext(TraceContext):
+    """Discards session traces."""
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        pass
+
+    def recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return []
+
+    def clear(self) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
+def _tail(entries: deque, limit: int) -> List[Dict[str, Any]]:
+    if limit <= 0:
+        return []
+    return list(islice(entries, max(len(entries) - limit, 0), None))
+
+
+class RingBufferTraceContext(TraceContext):
+    """The last ``capacity`` traces of this process."""
+
+    def __init__(self, capacity: int = TRACE_CONTEXT_CAPACITY):
+        self._entries: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+
+    def recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            return _tail(self._entries, limit)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class StreamlitTraceContext(TraceContext):
+    """The last ``capacity`` traces of the current Streamlit session.
+
+    Calls made outside a script run (worker threads, bare imports) have no
+    session; their traces go to a process-wide ring buffer instead.
+    """
+
+    def __init__(self, capacity: int = TRACE_CONTEXT_CAPACITY, key: str = SESSION_TRACE_KEY):
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        self._st = st
+        self._get_script_run_ctx = get_script_run_ctx
+        self.capacity = capacity
+        self.key = key
+        self._fallback = RingBufferTraceContext(capacity)
+
+    def _entries(self) -> Optional[deque]:
+        if self._get_script_run_ctx() is None:
+            return None
+        state = self._st.session_state
+        entries = state.get(self.key)
+        if not isinstance(entries, deque) or entries.maxlen != self.capacity:
+            # Sessions started before the cap was introduced hold a plain list
+            entries = state[self.key] = deque(entries or (), maxlen=self.capacity)
+        return entries
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        entries = self._entries()
+        if entries is None:
+            self._fallback.append(entry)
+        else:
+            entries.append(entry)
+
+    def recent(self, limit: int = 10) -> List[Dict[str, Any]]:
+        entries = self._entries()
+        return self._fallback.recent(limit) if entries is None else _tail(entries, limit)
+
+    def clear(self) -> None:
+        entries = self._entries()
+        if entries is None:
+            self._fallback.clear()
+        else:
+            entries.clear()
+
+    def __len__(self) -> int:
+        entries = self._entries()
+        return len(self._fallback) if entries is None else len(entries)
+
+
+TRACE_CONTEXTS = {
+    "memory": RingBufferTraceContext,
+    "streamlit": StreamlitTraceContext,
+    "none": NullTraceContext,
+}
+
+_context: Optional[TraceContext] = None
+_context_lock = threading.Lock()
+
+
+def get_trace_context() -> TraceContext:
+    """Return the process-wide trace context (chosen by FINKRAFT_TRACE_CONTEXT, default "memory")."""
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                kind = os.environ.get("FINKRAFT_TRACE_CONTEXT", "memory").lower()
+                if kind not in TRACE_CONTEXTS:
+                    raise ValueError(f"Unknown trace context: {kind}")
+                _context = TRACE_CONTEXTS[kind]()
+    return _context
+
+
+def set_trace_context(context: Optional[TraceContext]) -> None:
+    """Install a specific trace context (None resets to the configured default)."""
+    global _context
+    with _context_lock:
+        _context = context
@@ -1,30 +1,61 @@
-import streamlit as st
-import json
-import os
+import threading
+import time
 from datetime import datetime
 
-# Path for persistent trace logs
-TRACE_LOG_PATH = os.path.join("data", "trace_log.json")
+from utils.metrics import get_metrics
+from utils.timing import latency_stats
+from utils.trace_context import get_trace_context
+from utils.trace_sink import get_trace_sink
+
+_metrics_seeded = False
+_seed_lock = threading.Lock()
 
 # --- Helpers ---
 
-def ensure_trace_logs():
-    """Make sure trace_logs always exists in session_state."""
-    if "trace_logs" not in st.session_state:
-        st.session_state["trace_logs"] = []
+def _trace_metrics():
+    """The metrics registry, seeded once from the persisted traces if it started without a snapshot."""
+    global _metrics_seeded
+    metrics = get_metrics()
+    if not _metrics_seeded:
+        with _seed_lock:
+            if not _metrics_seeded:
+                if not metrics.restored:
+                    metrics.seed(_seed_metrics)
+                _metrics_seeded = True
+    return metrics
+
+def _seed_metrics(metrics):
+    """Rebuild trace counters and latency histograms from every retained trace (first start after upgrade)."""
+    try:
+        sink = get_trace_sink()
+        sink.flush()
+        for trace in sink.iter_entries():
+            module = trace.get("routed_to") or "Unknown"
+            role = trace.get("role", "Unknown")
+            _count_trace(metrics, trace, module, role)
+            timings = trace.get("stage_timings") or {}
+            for stage, ms in timings.items():
+                if stage != "total":
+                    metrics.observe("stage_latency_ns", int(ms * 1e6), stage=stage)
+            if "total" in timings:
+                metrics.observe("route_latency_ns", int(timings["total"] * 1e6), module=module, role=role)
+    except Exception as e:
+        print(f"⚠️ Error seeding metrics from trace log: {str(e)}")
 
-def initialize_trace_file():
-    """Initialize the persistent trace log file if it doesn't exist."""
-    if not os.path.exists(TRACE_LOG_PATH):
-        os.makedirs(os.path.dirname(TRACE_LOG_PATH), exist_ok=True)
-        with open(TRACE_LOG_PATH, "w") as f:
-            json.dump([], f)
+def _count_trace(metrics, trace_entry, module, role):
+    metrics.inc("traces_total", module=module, role=role)
+    metrics.inc("trace_confidence_sum", trace_entry.get("confidence", 0.5), module=module)
+    metrics.inc("trace_query_chars_total", len(trace_entry.get("query") or ""), module=module)
+    if trace_entry.get("context_used"):
+        metrics.inc("trace_context_used_total", module=module)
+    if "error" in module.lower():
+        metrics.inc("trace_errors_total", module=module)
 
 # --- Core Functions ---
 
 def log_trace(query, response, module, metadata=None):
     """
-    Log a trace entry to both session state and file.
+    Log a trace entry to the session's trace context and to file.
     
     Args:
         query (str): The user query
@@ -32,7 +63,6 @@ def log_trace(query, response, module, metadata=None):
         module (str): The module that handled the query
         metadata (dict, optional): Additional metadata about the trace
     """
-    ensure_trace_logs()
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # Handle response formatting safely
@@ -58,90 +88,79 @@ def log_trace(query, response, module, metadata=None):
     # Add metadata if provided
     if metadata:
         trace_entry.update({
+            "role": metadata.get("role", "Unknown"),
             "confidence": metadata.get("confidence", 0.5),
             "complexity": metadata.get("complexity", "unknown"),
             "context_used": metadata.get("context_used", False),
             "user_context": metadata.get("user_context_summary", {}),
             "execution_time": metadata.get("execution_time", "N/A")
         })
+        if "report_cache" in metadata:
+            trace_entry["report_cache"] = metadata["report_cache"]
+        if "stage_timings" in metadata:
+            trace_entry["stage_timings"] = metadata["stage_timings"]
 
-    # Add to session state
-    st.session_state["trace_logs"].append(trace_entry)
-
-    # Save to persistent file
-    initialize_trace_file()
-    try:
-        with open(TRACE_LOG_PATH, "r") as f:
-            traces = json.load(f)
-
-        traces.append(trace_entry)
+    # Add to the session's recent traces (bounded; Streamlit session state in the app)
+    get_trace_context().append(trace_entry)
+    _record_trace_metrics(trace_entry, metadata)
 
-        # Keep only last 100 traces
-        if len(traces) > 100:
-            traces = traces[-100:]
+    # Hand off to the background writer (rotated JSON Lines under data/traces/)
+    if not get_trace_sink().write(trace_entry):
+        print("⚠️ Error saving trace log: trace queue is full")
 
-        with open(TRACE_LOG_PATH, "w") as f:
-            json.dump(traces, f, indent=2)
-
-    except Exception as e:
-        print(f"⚠️ Error saving trace log: {str(e)}")
+def _record_trace_metrics(trace_entry, metadata):
+    """O(1) metric updates per trace, so dashboards never re-read the trace log."""
+    metrics = _trace_metrics()
+    _count_trace(metrics, trace_entry, trace_entry["routed_to"], (metadata or {}).get("role", "Unknown"))
+    metrics.set_gauge("last_trace_time", time.time())
 
 def get_traces(limit=10):
-    """Get recent traces from session state."""
-    ensure_trace_logs()
-    return st.session_state["trace_logs"][-limit:]
+    """Get recent traces from the session's trace context."""
+    return get_trace_context().recent(limit)
 
 def get_persistent_traces(limit=10):
-    """Get recent traces from the persistent file."""
-    initialize_trace_file()
+    """Get recent traces from the tail of the newest trace segments."""
     try:
-        with open(TRACE_LOG_PATH, "r") as f:
-            traces = json.load(f)
-        return traces[-limit:]
+        sink = get_trace_sink()
+        sink.flush()
+        return sink.tail(limit)
     except Exception as e:
         print(f"⚠️ Error reading trace log: {str(e)}")
         return []
 
 def get_trace_analytics():
-    """Get analytics about system performance from traces."""
-    traces = get_persistent_traces(100)  # Get more traces for analysis
-    
-    if not traces:
+    """Get analytics about system performance from the metrics registry."""
+    metrics = _trace_metrics()
+    modules_used = {m: int(c) for m, c in metrics.counter_by("traces_total", "module").items()}
+    total = sum(modules_used.values())
+
+    if not total:
         return {
             "total_traces": 0,
             "modules_used": {},
             "average_confidence": 0.0,
             "context_usage_rate": 0.0
         }
-    
-    # Analyze trace data
-    modules_used = {}
-    confidence_scores = []
-    context_used_count = 0
-    
-    for trace in traces:
-        # Count module usage
-        module = trace.get("routed_to", "Unknown")
-        modules_used[module] = modules_used.get(module, 0) + 1
-        
-        # Collect confidence scores
-        confidence = trace.get("confidence", 0.5)
-        confidence_scores.append(confidence)
-        
-        # Count context usage
-        if trace.get("context_used", False):
-            context_used_count += 1
-    
-    # Calculate metrics
-    avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
-    context_usage_rate = (context_used_count / len(traces)) * 100 if traces else 0.0
-    
+
     return {
-        "total_traces": len(traces),
+        "total_traces": total,
         "modules_used": modules_used,
-        "average_confidence": round(avg_confidence, 2),
-        "context_usage_rate": round(context_usage_rate, 1),
-        "most_used_module": max(modules_used.items(), key=lambda x: x[1])[0] if modules_used else "None"
+        "average_confidence": round(metrics.counter("trace_confidence_sum") / total, 2),
+        "context_usage_rate": round(metrics.counter("trace_context_used_total") / total * 100, 1),
+        "average_query_length": round(metrics.counter("trace_query_chars_total") / total, 1),
+        "success_rate": round((1 - metrics.counter("trace_errors_total") / total) * 100, 1),
+        "most_used_module": max(modules_used.items(), key=lambda x: x[1])[0]
+    }
+
+def get_latency_analytics():
+    """Per-stage, per-module and per-role latency percentiles (ms) from the metrics registry."""
+    metrics = _trace_metrics()
+    by_stage = metrics.histogram_by("stage_latency_ns", "stage")
+    return {
+        "overall": latency_stats(metrics.histogram("route_latency_ns")),
+        "stages": {stage: latency_stats(h) for stage, h in by_stage.items()},
+        "modules": {m: latency_stats(h) for m, h in metrics.histogram_by("route_latency_ns", "module").items()},
+        "roles": {r: latency_stats(h) for r, h in metrics.histogram_by("route_latency_ns", "role").items()},
     }
 
 def search_traces(search_term, limit=10):
@@ -165,36 +184,32 @@ def search_traces(search_term, limit=10):
 
 def get_module_performance(module_name):
     """Get performance statistics for a specific module."""
-    traces = get_persistent_traces(100)
-    
-    module_traces = [t for t in traces if t.get("routed_to") == module_name]
-    
-    if not module_traces:
+    metrics = _trace_metrics()
+    total = int(metrics.counter("traces_total", module=module_name))
+
+    if not total:
         return {
             "module": module_name,
             "total_queries": 0,
             "average_confidence": 0.0,
             "recent_queries": []
         }
-    
-    # Calculate statistics
-    confidence_scores = [t.get("confidence", 0.5) for t in module_traces]
-    avg_confidence = sum(confidence_scores) / len(confidence_scores)
-    
-    # Get recent queries (last 5)
+
+    # Recent queries (last 5) come from this session's traces, not the log
     recent_queries = [
         {
             "query": t.get("query", ""),
             "confidence": t.get("confidence", 0.5),
             "timestamp": t.get("timestamp", "")
         }
-        for t in module_traces[-5:]
-    ]
-    
+        for t in get_traces(100) if t.get("routed_to") == module_name
+    ][-5:]
+
     return {
         "module": module_name,
-        "total_queries": len(module_traces),
-        "average_confidence": round(avg_confidence, 2),
+        "total_queries": total,
+        "average_confidence": round(metrics.counter("trace_confidence_sum", module=module_name) / total, 2),
+        "latency": latency_stats(metrics.histogram("route_latency_ns", module=module_name)),
         "recent_queries": recent_queries
     }
 
@@ -0,0 +1,289 @@
+"""Buffered, rotating JSON Lines sink for persistent trace entries.
+
+``log_trace`` used to re-read, trim and rewrite a single JSON file on every
+call.  Entries are now handed to a background writer through a bounded
+queue and appended to segment files under ``data/traces/``.  Segments rotate
+by size or age, and retention is enforced in bytes and age instead of a fixed
+entry count.  Reads only touch the tail of the newest segments.
+"""
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACE_DIR = os.path.join("data", "traces")
+
+# Legacy single-file trace log, still read when no segments cover a request
+LEGACY_TRACE_LOG_PATH = os.path.join("data", "trace_log.json")
+
+SEGMENT_MAX_BYTES = 1024 * 1024
+SEGMENT_MAX_AGE_SECONDS = 24 * 3600
+RETENTION_MAX_BYTES = 50 * 1024 * 1024
+RETENTION_MAX_AGE_SECONDS = 30 * 24 * 3600
+QUEUE_MAX_ENTRIES = 10000
+
+# Extra margin before a quiet segment is treated as closed by its writer
+SEGMENT_CLOSE_GRACE_SECONDS = 60.0
+
+_READ_BLOCK_BYTES = 64 * 1024
+
+
+def _tail_lines(path: str, count: int) -> List[bytes]:
+    """Return up to ``count`` complete lines from the end of ``path``."""
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        buffer = b""
+        while position > 0 and buffer.count(b"\n") <= count:
+            step = min(_READ_BLOCK_BYTES, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+    lines = buffer.split(b"\n")
+    if position > 0:
+        lines = lines[1:]  # first line may be cut mid-way
+    return [line for line in lines if line.strip()][-count:]
+
+
+def _pid_running(pid: int) -> bool:
+    if os.name != "posix":
+        return True  # no cheap liveness check; keep the segment until it goes quiet
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists but belongs to another user
+    return True
+
+
+class RotatingTraceSink:
+    """Background writer appending trace entries to rotated segment files."""
+
+    def __init__(self, directory: str = TRACE_DIR, segment_max_bytes: int = SEGMENT_MAX_BYTES,
+                 segment_max_age: float = SEGMENT_MAX_AGE_SECONDS,
+                 retention_max_bytes: int = RETENTION_MAX_BYTES,
+                 retention_max_age: float = RETENTION_MAX_AGE_SECONDS,
+                 queue_size: int = QUEUE_MAX_ENTRIES,
+                 legacy_path: Optional[str] = LEGACY_TRACE_LOG_PATH):
+        self.directory = directory
+        self.legacy_path = legacy_path
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.retention_max_bytes = retention_max_bytes
+        self.retention_max_age = retention_max_age
+        self.dropped = 0
+
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._segment_path: Optional[str] = None
+        self._segment_opened = 0.0
+        self._closed = False
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    # --- Writing ---
+
+    def write(self, entry: Dict[str, Any]) -> bool:
+        """Queue an entry without blocking; returns False if it had to be dropped."""
+        if self._closed:
+            return False
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self) -> None:
+        """Block until every queued entry has been written to disk."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None:
+            with self._start_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._writer.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else is waiting so one flush covers the burst
+            while len(batch) < 512:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            try:
+                for entry in batch:
+                    if entry is None:
+                        stop = True
+                        continue
+                    self._write_line((json.dumps(entry, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+                if self._file is not None:
+                    self._file.flush()
+            except Exception as e:
+                print(f"⚠️ Error saving trace log: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write_line(self, line: bytes) -> None:
+        now = time.time()
+        if (self._file is None
+                or self._file.tell() + len(line) > self.segment_max_bytes
+                or now - self._segment_opened > self.segment_max_age):
+            self._rotate(now)
+        self._file.write(line)
+
+    def _rotate(self, now: float) -> None:
+        if self._file is not None:
+            self._file.close()
+        # Millisecond prefix keeps segments ordered; the pid keeps workers apart
+        name = f"trace-{int(now * 1000):015d}-{os.getpid()}.jsonl"
+        self._segment_path = os.path.join(self.directory, name)
+        self._file = open(self._segment_path, "ab")
+        self._segment_opened = now
+        self._enforce_retention(now)
+
+    def _enforce_retention(self, now: float) -> None:
+        """Delete the oldest segments beyond the byte and age budgets.
+
+        Segments another worker may still be appending to are skipped (see
+        ``_may_be_open``); deleting them would lose everything it writes after.
+        """
+        segments = []
+        for path in self._segments():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            segments.append((path, stat.st_size, stat.st_mtime))
+
+        total = sum(size for _, size, _ in segments)
+        for path, size, mtime in segments:  # oldest first
+            if total <= self.retention_max_bytes and now - mtime <= self.retention_max_age:
+                break
+            if self._may_be_open(path, mtime, now):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _may_be_open(self, path: str, mtime: float, now: float) -> bool:
+        """Whether a writer may still append to the segment at ``path``.
+
+        Our own earlier segments are closed.  Another worker rotates before
+        writing to a segment opened more than ``segment_max_age`` ago, so a
+        segment quiet for longer is closed too; otherwise it is open as long
+        as the pid in its name is running.
+        """
+        if path == self._segment_path:
+            return True
+        try:
+            pid = int(os.path.basename(path)[:-len(".jsonl")].rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            pid = None
+        if pid == os.getpid() or now - mtime > self.segment_max_age + SEGMENT_CLOSE_GRACE_SECONDS:
+            return False
+        return pid is None or _pid_running(pid)
+
+    # --- Reading ---
+
+    def _segments(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in sorted(names)
+                if n.startswith("trace-") and n.endswith(".jsonl")]
+
+    def tail(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Return the newest ``limit`` entries, oldest first."""
+        if limit <= 0:
+            return []
+        collected: List[Dict[str, Any]] = []
+        for path in reversed(self._segments()):
+            needed = limit - len(collected)
+            try:
+                lines = _tail_lines(path, needed)
+            except FileNotFoundError:
+                continue
+            entries = []
+            for line in lines:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # torn write from a crashed worker
+            collected = entries + collected
+            if len(collected) >= limit:
+                return collected[-limit:]
+
+        return _read_legacy_traces(self.legacy_path, limit - len(collected)) + collected
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        """Every retained entry, oldest first (legacy log, then segments)."""
+        yield from _read_legacy_traces(self.legacy_path, sys.maxsize)
+        for path in self._segments():
+            try:
+                with open(path, "rb") as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue  # torn write from a crashed worker
+            except FileNotFoundError:
+                continue
+
+
+def _read_legacy_traces(path: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    if not path or limit <= 0:
+        return []
+    try:
+        with open(path, "r") as f:
+            traces = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return traces[-limit:] if isinstance(traces, list) else []
+
+
+_sink: Optional[RotatingTraceSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_trace_sink() -> RotatingTraceSink:
+    """Return the process-wide sink; pending entries are flushed at exit."""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = RotatingTraceSink()
+                atexit.register(_sink.close)
+    return _sink